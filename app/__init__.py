@@ -1,17 +1,28 @@
 from flask import Flask
-from config import Config
+from config import Config, check_config
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Settings are checked here rather than at import time, so imports never fail on them
+    problems = check_config(app.config)
+    for problem in problems:
+        print(f"Configuration problem: {problem}")
+    if problems and app.config.get('CONFIG_STRICT'):
+        raise RuntimeError("Invalid configuration: " + ' '.join(problems))
+
+    from app.metrics import init_metrics
+    init_metrics(app)
+
     # List of blueprint modules to register
     blueprint_modules = [
         ('app.main', 'main_bp', None),
         ('app.dashboard', 'dashboard_bp', '/dashboard'),
         ('app.scrape', 'scrape_bp', '/scrape'),
         ('app.schema', 'schema_bp', '/schema'),
-        ('app.extract', 'extract_bp', '/extract')
+        ('app.extract', 'extract_bp', '/extract'),
+        ('app.jobs', 'jobs_bp', '/jobs')
     ]
 
     # Dynamically register blueprints
@@ -20,4 +31,7 @@ def create_app(config_class=Config):
         bp = getattr(module, bp_name)
         app.register_blueprint(bp, url_prefix=url_prefix)
 
+    from app.cli import migrator_cli
+    app.cli.add_command(migrator_cli)
+
     return app
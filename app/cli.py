@@ -0,0 +1,78 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.scrape.batch import CrawlJob, get_jobs_dir, load_sitemap, load_url_list, run_job_for_app
+from app.scrape.crawl_state import TABLE_CHANGES, format_report
+from app.scrape.dedupe import get_table_index
+
+
+migrator_cli = AppGroup('migrator', help='Migration batch commands.')
+
+
+@migrator_cli.command('crawl')
+@click.argument('source', required=False)
+@click.option('--sitemap', is_flag=True, help='Treat SOURCE as a sitemap URL or file.')
+@click.option('--resume', 'resume_id', help='Resume an existing job by ID.')
+@click.option('--workers', type=int, help='Number of concurrent workers.')
+def crawl(source, sitemap, resume_id, workers):
+    """Scrape every URL in SOURCE (one per line) or a sitemap."""
+    app = current_app._get_current_object()
+    jobs_dir = get_jobs_dir(app)
+
+    if resume_id:
+        job = CrawlJob.load(jobs_dir, resume_id)
+    elif source:
+        urls = load_sitemap(source) if sitemap else load_url_list(source)
+        job = CrawlJob.create(jobs_dir, urls, source=source)
+    else:
+        raise click.UsageError('Provide a SOURCE or --resume JOB_ID')
+
+    if workers:
+        app.config['CRAWL_WORKERS'] = workers
+
+    click.echo(f"Job {job.id}: {len(job.pending_urls())} URLs to crawl, results in {job.results_path}")
+    run_job_for_app(app, job)
+    progress = job.progress()
+    click.echo(f"Job {job.id} {progress['status']}: {progress['counts']['done']} done, {progress['counts']['failed']} failed")
+    if progress['changes']:
+        click.echo(f"Since the last crawl: {format_report(progress['changes'])}")
+
+
+@migrator_cli.command('jobs')
+def jobs():
+    """List crawl jobs and their progress."""
+    for job in CrawlJob.list(get_jobs_dir()):
+        progress = job.progress()
+        click.echo(f"{job.id}  {progress['status']:<8} {progress['percent']:>5}%  {progress['total']} URLs  {progress['source']}")
+
+
+@migrator_cli.command('report')
+@click.argument('job_id')
+def report(job_id):
+    """Show how each URL in a job compared with its previous crawl."""
+    job = CrawlJob.load(get_jobs_dir(), job_id)
+    for url, entry in job.state['urls'].items():
+        changes = entry.get('changes')
+        if not changes:
+            click.echo(f"{entry['status']:<13} {url}")
+            continue
+        tables = '  '.join(f"{changes['tables'][key]} {key}" for key in TABLE_CHANGES)
+        click.echo(f"{changes['page']:<13} {url}  {tables}")
+    if job.state.get('changes'):
+        click.echo(format_report(job.state['changes']))
+
+
+@migrator_cli.command('duplicates')
+@click.option('--limit', type=int, default=20, help='Number of tables to list.')
+def duplicates(limit):
+    """List tables found on more than one page, most widespread first."""
+    index = get_table_index()
+    if index is None:
+        raise click.ClickException('Duplicate detection is turned off (DEDUPE_ENABLED=0)')
+    stats = index.stats()
+    click.echo(f"{stats['tables']} tables indexed as {stats['canonical']} distinct ones (threshold {stats['threshold']})")
+    for group in index.groups(limit):
+        click.echo(f"{group['canonical'][:12]}  {group['page_count']} pages  {group['tables']} variants")
+        for url in group['pages']:
+            click.echo(f"    {url}")
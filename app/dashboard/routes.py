@@ -1,6 +1,10 @@
 from flask import render_template
 from app.dashboard import dashboard_bp
+from app.metrics import metrics
+from app.scrape.batch import CrawlJob, get_jobs_dir
 
 @dashboard_bp.route('/dashboard')
 def dashboard():
-    return render_template('dashboard/dashboard.html')
\ No newline at end of file
+    jobs = [job.progress() for job in CrawlJob.list(get_jobs_dir())]
+    return render_template('dashboard/dashboard.html', jobs=jobs,
+                           traces=metrics.recent_traces(), metrics_enabled=metrics.enabled)
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import threading
+
+from flask import current_app
+
+
+_local = threading.local()
+
+
+def get_db_path(app=None):
+    # Resolve SQLALCHEMY_DATABASE_URI the way Flask-SQLAlchemy does: relative paths live in the instance folder
+    app = app or current_app._get_current_object()
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or 'sqlite:///app.db'
+    if not uri.startswith('sqlite:'):
+        raise ValueError(f"Only sqlite databases are supported, got {uri}")
+    # sqlite:///relative.db, sqlite:////absolute.db, or sqlite:// for in-memory
+    path = uri[len('sqlite:///'):] if uri.startswith('sqlite:///') else ''
+    if not path or path == ':memory:':
+        return 'file:migrator?mode=memory&cache=shared'
+    if not os.path.isabs(path):
+        path = os.path.join(app.instance_path, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def get_connection(app=None):
+    """Return this thread's connection to the app database."""
+    path = get_db_path(app)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=30, uri=path.startswith('file:'), isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connections[path] = connection
+    return connection
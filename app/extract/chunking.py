@@ -0,0 +1,186 @@
+import asyncio
+import html
+import json
+import random
+import re
+
+
+PROMPT_TEMPLATE = """Based on the following Schema and html table,
+extract ALL content from the table and convert it to json.
+Do not truncate or summarize the data - include every row from the table.
+
+Schema:
+{schema}
+
+HTML Table (rows {first_row} to {last_row} of {total_rows}):
+{table_html}
+
+Return ONLY a JSON array with exactly {row_count} objects, one per table row, in the same order as the rows.
+Do not use ellipsis (...) or truncate the data."""
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text and markup
+    return len(text) // 4 + 1
+
+
+def render_rows(headers, rows):
+    # Attribute-free markup keeps the prompt small
+    head = ''.join(f'<th>{html.escape(h)}</th>' for h in headers)
+    body = ''.join(
+        '<tr>' + ''.join(f'<td>{html.escape(value)}</td>' for value in row) + '</tr>'
+        for row in rows
+    )
+    return f'<table><tr>{head}</tr>{body}</table>'
+
+
+def split_into_batches(headers, rows, budget_tokens=1500):
+    """Group rows into consecutive batches whose markup fits the token budget.
+
+    Every batch gets the header row again so each prompt stands alone. A
+    single row larger than the budget still gets a batch of its own.
+    """
+    header_tokens = estimate_tokens(render_rows(headers, []))
+    batches = []
+    current = []
+    current_tokens = header_tokens
+    for row in rows:
+        row_tokens = estimate_tokens(render_rows([], [row])) - 1
+        if current and current_tokens + row_tokens > budget_tokens:
+            batches.append(current)
+            current = []
+            current_tokens = header_tokens
+        current.append(row)
+        current_tokens += row_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_json_payload(content):
+    # Remove any explanatory text or code fences before or after the JSON
+    json_match = re.search(r'\{[\s\S]*\}|\[[\s\S]*\]', content)
+    if json_match:
+        content = json_match.group()
+    return json.loads(content)
+
+
+def validate_batch(payload, expected_rows):
+    # Models sometimes wrap the array in an object like {"rows": [...]}
+    if isinstance(payload, dict):
+        lists = [value for value in payload.values() if isinstance(value, list)]
+        if len(lists) == 1:
+            payload = lists[0]
+    if not isinstance(payload, list):
+        raise ExtractionError("Expected a JSON array of records")
+    if len(payload) != expected_rows:
+        raise ExtractionError(f"Expected {expected_rows} records, got {len(payload)}")
+    return payload
+
+
+async def _extract_batch(client, semaphore, schema, headers, batch, first_row, total_rows,
+                         model, max_tokens, max_retries):
+    # Imported here rather than at startup, openai is slow to load
+    import openai
+
+    prompt = PROMPT_TEMPLATE.format(
+        schema=schema,
+        first_row=first_row + 1,
+        last_row=first_row + len(batch),
+        total_rows=total_rows,
+        table_html=render_rows(headers, batch),
+        row_count=len(batch),
+    )
+
+    last_error = None
+    for attempt in range(1, max_retries + 1):
+        # A cached answer that failed validation would just fail again
+        extra = {'cache': False} if attempt > 1 and getattr(client, 'supports_cache_bypass', False) else {}
+        try:
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0,
+                    max_tokens=max_tokens,
+                    **extra
+                )
+            payload = parse_json_payload(response.choices[0].message.content)
+            return validate_batch(payload, len(batch))
+        except (openai.APIError, ExtractionError, json.JSONDecodeError) as e:
+            last_error = e
+            print(f"Batch at row {first_row + 1} failed (attempt {attempt}/{max_retries}): {str(e)}")
+            if attempt < max_retries:
+                await asyncio.sleep(min(30, 2 ** attempt) * (0.5 + random.random()))
+
+    # Callers pair records with rows by position, so a batch with the wrong count can't be kept
+    raise ExtractionError(f"Batch at row {first_row + 1} failed after {max_retries} attempts: {last_error}")
+
+
+async def extract_batches(client, schema, headers, rows, model='gpt-4o', budget_tokens=1500,
+                          concurrency=4, max_tokens=4096, max_retries=3, on_progress=None):
+    batches = split_into_batches(headers, rows, budget_tokens)
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = 0
+
+    async def tracked(coroutine):
+        nonlocal finished
+        result = await coroutine
+        finished += 1
+        if on_progress:
+            on_progress(finished, len(batches))
+        return result
+
+    tasks = []
+    first_row = 0
+    for batch in batches:
+        tasks.append(tracked(_extract_batch(
+            client, semaphore, schema, headers, batch, first_row, len(rows),
+            model, max_tokens, max_retries
+        )))
+        first_row += len(batch)
+
+    # gather() keeps results in batch order regardless of completion order
+    results = await asyncio.gather(*tasks)
+    records = []
+    for batch_records in results:
+        records.extend(batch_records)
+    return records, len(batches)
+
+
+def extract_table(schema, headers, rows, config, client=None, wrap_client=None, on_progress=None):
+    """Run a chunked extraction to completion and return (records, batch_count).
+
+    Without a ``client`` the run goes to the app's shared LLM loop, so
+    concurrent runs share each backend's connections and concurrency limit.
+    ``wrap_client`` can decorate the async client used for this run,
+    e.g. to put a response cache in front of it. ``on_progress`` is called
+    with (finished_batches, total_batches) as batches complete.
+    """
+    llm_loop = None
+    if client is None:
+        from app.llm import get_llm_loop
+
+        llm_loop = get_llm_loop()
+
+    async def run():
+        async_client = client or llm_loop.client
+        if wrap_client:
+            async_client = wrap_client(async_client)
+        return await extract_batches(
+            async_client, schema, headers, rows,
+            model=config.get('EXTRACT_MODEL', 'gpt-4o'),
+            budget_tokens=config.get('EXTRACT_BATCH_TOKENS', 1500),
+            concurrency=config.get('EXTRACT_CONCURRENCY', 4),
+            max_tokens=config.get('EXTRACT_MAX_TOKENS', 4096),
+            max_retries=config.get('EXTRACT_MAX_RETRIES', 3),
+            on_progress=on_progress,
+        )
+
+    if llm_loop is None:
+        return asyncio.run(run())
+    return llm_loop.run(run())
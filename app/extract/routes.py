@@ -1,56 +1,213 @@
-from flask import render_template, request, jsonify, session, redirect, url_for
+from flask import Response, current_app, render_template, request, jsonify, session, redirect, url_for, stream_with_context
 from app.extract import extract_bp
-from app.utils import openai, load_dotenv
+from app.table_store import get_table_store
+from app.scrape.dedupe import get_table_index
+from app.scrape.tables import ParsedTable, parse_table
+from app.extract.chunking import ExtractionError, extract_table
+from app.extract.streaming import csv_error_row, iter_csv, iter_ndjson, stream_table
+from app.llm_cache import cached_client
+from app.scrape.crawl_state import get_crawl_state, stage_key, table_hash
+from app.metrics import count, span
+from app.jobs.manager import get_job_manager, job_handler, job_response, job_view, wants_async
+import hashlib
+import json
+
+
+def _no_progress(fraction, message=None):
+    pass
+
+
+def _row_keys(table):
+    # A row's headers, text and links; rows with the same key give the same record
+    headers = json.dumps(table.headers)
+    link_columns = sorted(table.links)
+    keys = []
+    for i, row in enumerate(table.rows()):
+        links = [[column, table.links[column][i]] for column in link_columns if table.links[column][i]]
+        key = f"{headers}{json.dumps(row)}{json.dumps(links)}"
+        keys.append(hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest())
+    return keys
+
+
+def _canonical_records(state, key, stage, row_keys):
+    # Records of a near-duplicate's canonical table, for the rows the two tables share
+    index = get_table_index()
+    canonical = index.canonical(key) if index else None
+    if not canonical or canonical == key:
+        return {}, None
+    stored = state.get_result(canonical, stage)
+    if not stored or 'row_keys' not in stored:
+        return {}, None
+    by_key = dict(zip(stored['row_keys'], stored['records']))
+    return {i: by_key[row_key] for i, row_key in enumerate(row_keys) if row_key in by_key}, stored['report']
+
+
+def _select_rows(table, indexes):
+    return ParsedTable(
+        table.headers,
+        [[column[i] for i in indexes] for column in table.columns],
+        len(indexes),
+        {column: [links[i] for i in indexes] for column, links in table.links.items()},
+    )
+
+
+def extract_records(table_html, schema, progress=_no_progress):
+    config = current_app.config
+    # An unchanged table extracted with the same schema and settings isn't extracted again
+    state = get_crawl_state()
+    if state:
+        key = table_hash(table_html)
+        stage = stage_key('records', schema, config.get('EXTRACT_MODEL'), config.get('EXTRACT_RULES_ENABLED', True),
+                          config.get('EXTRACT_RULES_MIN_CONFIDENCE'))
+        stored = state.get_result(key, stage)
+        if stored is not None:
+            progress(1.0, 'Table unchanged since it was last extracted')
+            count('records_reused', len(stored['records']))
+            return stored['records'], stored['report']
+
+    # The rule path needs pandas, which is loaded with the first extraction
+    from app.extract.rules import extract_with_fallback, parse_schema
+
+    with span('extract.parse'):
+        table = parse_table(table_html)
+    report = None
+
+    # Rows a near-duplicate shares with its canonical table take the records extracted there
+    row_keys = _row_keys(table) if state else None
+    reused, reused_report = _canonical_records(state, key, stage, row_keys) if state else ({}, None)
+    full_table = table
+    if reused:
+        count('records_reused', len(reused))
+        print(f"Reusing {len(reused)} of {table.n_rows} records from the canonical table")
+        table = _select_rows(table, [i for i in range(table.n_rows) if i not in reused])
+
+    def llm_extract(llm_schema, headers, rows):
+        def batch_done(finished, total):
+            progress(0.1 + 0.9 * finished / total, f"Extracted batch {finished} of {total}")
+
+        # Split the rows into batches and extract them concurrently
+        with span('extract.llm'):
+            records, batch_count = extract_table(
+                llm_schema, headers, rows, config,
+                wrap_client=lambda client: cached_client(client, is_async=True),
+                on_progress=batch_done
+            )
+        print(f"Extracted {len(records)} records from {len(rows)} rows in {batch_count} batches")
+        return records
+
+    progress(0.05, f"Extracting {table.n_rows} rows")
+    schema_fields = parse_schema(schema)
+    if not table.n_rows:
+        records, report = [], reused_report
+    elif config.get('EXTRACT_RULES_ENABLED', True) and schema_fields is not None:
+        # Map the schema's fields straight onto columns, only leftovers go to the LLM
+        with span('extract.rules'):
+            records, report = extract_with_fallback(table, config, llm_extract, schema_fields)
+    else:
+        records = llm_extract(schema, table.headers, table.rows())
+    count('records_extracted', len(records))
+    # Records are paired with rows by position, so a short or long result can't be kept
+    if len(records) != table.n_rows:
+        raise ExtractionError(f"Expected {table.n_rows} records, got {len(records)}")
+    if reused:
+        extracted = iter(records)
+        records = [reused[i] if i in reused else next(extracted) for i in range(full_table.n_rows)]
+    if state:
+        state.put_result(key, stage, {'records': records, 'report': report, 'row_keys': row_keys})
+    return records, report
+
+
+def render_extraction(records, report):
+    with span('extract.render'):
+        pretty_content = json.dumps(records, indent=2)
+        return render_template('extract/extract.html', content=pretty_content, report=report)
+
+
+@job_handler('extract')
+def extract_job(params, progress):
+    table_html = get_table_store().get(params['table_id'])
+    if not table_html:
+        raise ValueError("Unknown or expired table, please scrape the page again")
+    records, report = extract_records(table_html, params['schema'], progress)
+    return {'records': records, 'report': report}
+
+
+@job_view('extract')
+def extract_job_view(job):
+    if job['error']:
+        return jsonify({"error": f"Error extracting content: {job['error']}"}), 500
+    return render_extraction(job['result']['records'], job['result']['report'])
+
 
 @extract_bp.route('/extract_content', methods=['POST'])
 def extract_content():
     try:
         schema = request.form.get('schema')
-        table_html = request.form.get('table_html')
+        table_id = request.form.get('table_id')
+        table_html = get_table_store().get(table_id)
         
         if not schema or not table_html:
-            return jsonify({"error": "Missing schema or table HTML"}), 400
-            
-        prompt = f"""Based on the following Schema and html table, 
-extract ALL content from the table and convert it to json. 
-Do not truncate or summarize the data - include every row from the table.
-Return the complete dataset as valid JSON that matches the schema structure.
-
-Schema:
-{schema}
-
-HTML Table:
-{table_html}
-
-Important: Return the complete JSON for all rows. Do not use ellipsis (...) or truncate the data."""
-        
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=12000  # Increased max_tokens
-        )
+            return jsonify({"error": "Missing schema or table (it may have expired)"}), 400
         
-        content = response.choices[0].message.content
-        
-        # Try to parse and format the JSON
-        try:
-            # Remove any explanatory text before or after the JSON
-            import re
-            json_match = re.search(r'\{[\s\S]*\}|\[[\s\S]*\]', content)
-            if json_match:
-                content = json_match.group()
-            
-            parsed_content = json.loads(content)
-            pretty_content = json.dumps(parsed_content, indent=2)
-        except json.JSONDecodeError:
-            pretty_content = content
+        # Run in the background and hand back a job to follow
+        if wants_async():
+            return job_response(get_job_manager().submit('extract', {'table_id': table_id, 'schema': schema}))
             
-        return render_template('extract/extract.html', content=pretty_content)
+        records, report = extract_records(table_html, schema)
+        return render_extraction(records, report)
         
     except Exception as e:
         print(f"Error in extract_content route: {str(e)}")
         return jsonify({"error": f"Error extracting content: {str(e)}"}), 500
+
+
+def stream_records(table_html, schema):
+    """Return (records iterator, field names) for a streamed extraction."""
+    from app.extract.rules import iter_with_fallback, parse_schema
+
+    table = parse_table(table_html)
+    config = current_app.config
+    schema_fields = parse_schema(schema)
+
+    def llm_stream(llm_schema, headers, rows):
+        return stream_table(llm_schema, headers, rows, config)
+
+    if config.get('EXTRACT_RULES_ENABLED', True) and schema_fields is not None:
+        records, report = iter_with_fallback(table, config, llm_stream, schema_fields)
+        return records, list(report)
+    return llm_stream(schema, table.headers, table.rows()), [field['field_name'] for field in schema_fields or []]
+
+
+@extract_bp.route('/extract_content/stream', methods=['POST'])
+def stream_content():
+    schema = request.form.get('schema')
+    table_id = request.form.get('table_id')
+    output = request.form.get('format', 'ndjson')
+    table_html = get_table_store().get(table_id)
+
+    if not schema or not table_html:
+        return jsonify({"error": "Missing schema or table (it may have expired)"}), 400
+    if output not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    records, field_names = stream_records(table_html, schema)
+
+    def generate():
+        try:
+            if output == 'csv':
+                yield from iter_csv(records, field_names)
+            else:
+                yield from iter_ndjson(records)
+        except Exception as e:
+            # Headers are already sent, so the error goes into the body
+            print(f"Error streaming extraction: {str(e)}")
+            if output == 'csv':
+                yield csv_error_row(f"Error extracting content: {str(e)}")
+            else:
+                yield json.dumps({"error": f"Error extracting content: {str(e)}"}) + '\n'
+
+    if output == 'csv':
+        return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename=extract_{table_id[:12]}.csv'
+        })
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
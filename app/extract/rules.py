@@ -0,0 +1,330 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.extract.chunking import ExtractionError
+from app.schema.profile import (
+    EMAIL_PATTERN, NULL_TOKENS, URL_PATTERN, parse_booleans, parse_dates, parse_numbers
+)
+
+
+def _numbers(values, profile):
+    return parse_numbers(values, (profile or {}).get('decimal_separator', '.'))
+
+
+def _coerce_integer(values, profile):
+    numbers = _numbers(values, profile)
+    # Values like "1.5" parse as numbers but are not integers
+    numbers = numbers.where(np.isclose(numbers % 1, 0) | numbers.isna())
+    return numbers.astype('Int64'), numbers.notna()
+
+
+def _coerce_decimal(values, profile):
+    numbers = _numbers(values, profile)
+    return numbers.astype('Float64'), numbers.notna()
+
+
+def _coerce_boolean(values):
+    booleans = parse_booleans(values)
+    return booleans, booleans.notna()
+
+
+def _coerce_datetime(values, profile):
+    profile = profile or {}
+    dates = parse_dates(values, profile.get('format') or 'ISO8601')
+    parsed = dates.notna()
+    text_format = '%Y-%m-%d' if profile.get('type') == 'date' else '%Y-%m-%dT%H:%M:%S'
+    return dates.dt.strftime(text_format).where(parsed, None), parsed
+
+
+def _coerce_email(values):
+    return values, values.str.match(EMAIL_PATTERN, na=False)
+
+
+def _coerce_list(values, profile):
+    allowed = (profile or {}).get('values')
+    if not allowed:
+        return _coerce_text(values)
+    return values, values.isin(allowed)
+
+
+def _coerce_link(values, hrefs):
+    if hrefs is None:
+        hrefs = pd.Series([None] * len(values), index=values.index, dtype=object)
+    # A bare URL in the cell text counts as a link too
+    hrefs = hrefs.where(hrefs.notna(), values.where(values.str.match(URL_PATTERN, na=False)))
+    links = pd.Series(
+        [{'uri': uri, 'title': title} if isinstance(uri, str) else None for uri, title in zip(hrefs, values)],
+        index=values.index, dtype=object
+    )
+    return links, hrefs.notna()
+
+
+def _coerce_text(values):
+    return values, pd.Series(True, index=values.index)
+
+
+def coerce_column(values, field_type, hrefs=None, profile=None):
+    """Coerce a column of strings to ``field_type``.
+
+    ``profile`` is the column's profile from ``app.schema.profile`` and
+    tells the parsers which decimal separator, date formats or allowed
+    values to expect. Returns the coerced values and a boolean mask of the
+    cells that parsed. Empty cells are never counted as failures.
+    """
+    if field_type == 'integer':
+        return _coerce_integer(values, profile)
+    if field_type == 'decimal':
+        return _coerce_decimal(values, profile)
+    if field_type == 'boolean':
+        return _coerce_boolean(values)
+    if field_type == 'datetime':
+        return _coerce_datetime(values, profile)
+    if field_type == 'email':
+        return _coerce_email(values)
+    if field_type == 'list_string':
+        return _coerce_list(values, profile)
+    if field_type == 'link':
+        return _coerce_link(values, hrefs)
+    return _coerce_text(values)
+
+
+def _find_column(field, headers):
+    index = field.get('column_index')
+    if index is not None and index < len(headers) and headers[index] == field.get('field_label'):
+        return index
+    normalized = [header.strip().lower() for header in headers]
+    for candidate in (field.get('field_label', ''), field.get('field_name', '').replace('_', ' ')):
+        candidate = candidate.strip().lower()
+        if candidate in normalized:
+            return normalized.index(candidate)
+    return None
+
+
+def extract_with_rules(table, fields, min_confidence=0.95):
+    """Map fields straight onto parsed columns without an LLM.
+
+    Returns ``(records, report, fallback)``. ``report`` says for each field
+    which column it came from, how confident the mapping is and which path
+    produced it. ``fallback`` lists the fields and row indexes that still
+    need the LLM: fields with no column or low confidence need every row,
+    confident fields only need the rows whose cells failed to parse.
+    """
+    headers = table.headers
+    report = {}
+    values_by_field = {}
+    llm_fields = []
+    failed_rows = {}
+
+    for field in fields:
+        name = field['field_name']
+        index = _find_column(field, headers)
+        if index is None:
+            report[name] = {'path': 'llm', 'column': None, 'confidence': 0.0}
+            llm_fields.append(field)
+            continue
+
+        raw = pd.Series(table.columns[index], dtype=object).str.strip()
+        hrefs = table.links.get(index)
+        coerced, parsed = coerce_column(
+            raw, field.get('field_type', 'string'),
+            pd.Series(hrefs, dtype=object) if hrefs else None,
+            field.get('profile')
+        )
+
+        present = ~raw.str.lower().isin(NULL_TOKENS)
+        total = int(present.sum())
+        failures = present & ~parsed
+        confidence = 1.0 if total == 0 else 1.0 - int(failures.sum()) / total
+        report[name] = {'path': 'rules', 'column': headers[index], 'confidence': round(confidence, 4)}
+
+        if confidence < min_confidence:
+            report[name]['path'] = 'llm'
+            llm_fields.append(field)
+            continue
+
+        values_by_field[name] = coerced.astype(object).where(parsed & present, None)
+        if failures.any():
+            report[name]['path'] = 'mixed'
+            failed_rows[name] = np.flatnonzero(failures.to_numpy()).tolist()
+
+    # Build records column-wise, then transpose once
+    names = list(values_by_field)
+    columns = [
+        [None if value is pd.NA or (isinstance(value, float) and np.isnan(value)) else _plain(value)
+         for value in values_by_field[name]]
+        for name in names
+    ]
+    rows = zip(*columns) if names else ([] for _ in range(table.n_rows))
+    # Every field gets a key, in schema order, even before the LLM fills it in
+    empty = dict.fromkeys(field['field_name'] for field in fields)
+    records = [dict(empty, **dict(zip(names, row))) for row in rows]
+
+    fallback = {
+        'fields': llm_fields,
+        'failed_rows': failed_rows,
+    }
+    return records, report, fallback
+
+
+def _plain(value):
+    # NumPy scalars are not JSON serializable
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+# Other names models use for a field's keys in Drupal-style schemas
+FIELD_KEYS = {
+    'field_name': ('field_name', 'machine_name', 'name'),
+    'field_label': ('field_label', 'label'),
+    'field_type': ('field_type', 'type'),
+}
+
+
+def _schema_field(field, name=None):
+    if not isinstance(field, dict):
+        return None
+    field = dict(field)
+    for key, aliases in FIELD_KEYS.items():
+        value = next((field[alias] for alias in aliases if isinstance(field.get(alias), str) and field[alias]), None)
+        if value is not None:
+            field[key] = value
+    if name and not field.get('field_name'):
+        field['field_name'] = name
+    return field if field.get('field_name') else None
+
+
+def parse_schema(schema):
+    """The fields of a schema given as JSON, or ``None`` when the rule path can't use it.
+
+    Fields come from a ``fields`` list or a ``fields`` object keyed by
+    machine name, at the top level or one level down (e.g. under
+    ``content_type``). A schema without any fields gives ``None``, so
+    extraction goes to the LLM rather than producing empty records.
+    """
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return None
+    if not isinstance(schema, dict):
+        return None
+    fields = schema.get('fields')
+    if fields is None:
+        nested = [value['fields'] for value in schema.values() if isinstance(value, dict) and 'fields' in value]
+        fields = nested[0] if len(nested) == 1 else None
+    if isinstance(fields, dict):
+        fields = [_schema_field(field, name) for name, field in fields.items()]
+    elif isinstance(fields, list):
+        fields = [_schema_field(field) for field in fields]
+    else:
+        return None
+    if not fields or not all(fields):
+        return None
+    return fields
+
+
+def match_fields(table, fields=None):
+    """Fields to extract, each matched onto a column of ``table`` where one fits.
+
+    Without ``fields`` every column becomes a field. Schema fields keep
+    their names and types and borrow the matched column's profile; fields
+    with no column keep ``column_index`` ``None`` and go to the LLM.
+    """
+    from app.schema.structure import build_table_structure
+
+    columns = build_table_structure(table)['fields']
+    if fields is None:
+        return columns
+    matched = []
+    for field in fields:
+        index = _find_column(field, table.headers)
+        if index is None:
+            matched.append(dict(field, column_index=None))
+            continue
+        column = columns[index]
+        matched.append(dict(
+            field, column_index=index, field_label=field.get('field_label') or column['field_label'],
+            field_type=field.get('field_type') or column['field_type'], profile=column['profile'],
+        ))
+    return matched
+
+
+def _plan_fallback(table, config, schema_fields=None):
+    fields = match_fields(table, schema_fields)
+    records, report, fallback = extract_with_rules(
+        table, fields, config.get('EXTRACT_RULES_MIN_CONFIDENCE', 0.95)
+    )
+
+    # Fields without a confident column need every row, others just their failed rows
+    needed = {}
+    for field in fallback['fields']:
+        for i in range(table.n_rows):
+            needed.setdefault(i, set()).add(field['field_name'])
+    for name, rows in fallback['failed_rows'].items():
+        for i in rows:
+            needed.setdefault(i, set()).add(name)
+
+    row_indexes = sorted(needed)
+    names = set().union(*needed.values()) if needed else set()
+    llm_schema = json.dumps({'fields': [
+        {key: field.get(key) for key in ('field_name', 'field_label', 'field_type')}
+        for field in fields if field['field_name'] in names
+    ]}, indent=2)
+    for name in names:
+        report[name]['llm_rows'] = sum(1 for i in row_indexes if name in needed[i])
+    return records, report, needed, row_indexes, llm_schema
+
+
+def _merge(record, llm_record, names):
+    if isinstance(llm_record, dict):
+        for name in names:
+            record[name] = llm_record.get(name)
+    return record
+
+
+def extract_with_fallback(table, config, llm_extract, schema_fields=None):
+    """Extract every row with the rule path, sending only the leftovers to ``llm_extract``.
+
+    ``schema_fields`` are the fields of the submitted schema (see
+    ``parse_schema``); without them every column is extracted under a name
+    derived from its header. ``llm_extract(schema, headers, rows)`` must
+    return one record per row. Returns ``(records, report)``.
+    """
+    records, report, needed, row_indexes, llm_schema = _plan_fallback(table, config, schema_fields)
+    if not needed:
+        return records, report
+
+    # Full rows give the model context for fields that had no matching column
+    llm_records = llm_extract(llm_schema, table.headers, [table.rows(i, i + 1)[0] for i in row_indexes])
+    if len(llm_records) != len(row_indexes):
+        raise ExtractionError(f"Expected {len(row_indexes)} records from the LLM, got {len(llm_records)}")
+    for i, llm_record in zip(row_indexes, llm_records):
+        _merge(records[i], llm_record, needed[i])
+    return records, report
+
+
+def iter_with_fallback(table, config, llm_stream, schema_fields=None):
+    """Streaming counterpart of ``extract_with_fallback``.
+
+    ``llm_stream(schema, headers, rows)`` returns an iterator of records in
+    row order. Returns ``(records, report)`` where ``records`` yields every
+    row in order as soon as its LLM leftovers, if any, have arrived.
+    """
+    records, report, needed, row_indexes, llm_schema = _plan_fallback(table, config, schema_fields)
+
+    def generate():
+        llm_records = iter(())
+        if needed:
+            llm_records = llm_stream(llm_schema, table.headers, [table.rows(i, i + 1)[0] for i in row_indexes])
+        for i, record in enumerate(records):
+            if i in needed:
+                llm_record = next(llm_records, None)
+                if llm_record is None:
+                    raise ExtractionError(f"The LLM stream ended before row {i + 1}")
+                record = _merge(record, llm_record, needed[i])
+            yield record
+
+    return generate(), report
@@ -0,0 +1,257 @@
+import csv
+import io
+import json
+import queue
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.llm import get_llm_gateway
+from app.extract.chunking import (
+    PROMPT_TEMPLATE, ExtractionError, render_rows, split_into_batches
+)
+
+
+STRUCTURE = re.compile(r'[\[\]{}"\\]')
+
+
+class RecordStreamParser:
+    """Incremental parser that pulls JSON objects out of a streamed array.
+
+    Feed it text as it arrives and it returns every record completed so far.
+    Anything before the first ``[`` or ``{`` (prose, code fences) is skipped,
+    and an array wrapped in an object like ``{"rows": [...]}`` works too.
+    Only the record currently being read is buffered.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.record_depth = None
+        self.in_string = False
+        self.started = False
+        self.done = False
+        # Offset of the character after a backslash, which may be in the next chunk
+        self._escape_at = None
+        self._offset = 0
+        self._buffer = []
+
+    def feed(self, text):
+        records = []
+        if self.done or not text:
+            return records
+        capture_from = 0 if self._buffer else None
+
+        for match in STRUCTURE.finditer(text):
+            char = match.group()
+            index = match.start()
+            if self.in_string:
+                if self._offset + index == self._escape_at:
+                    continue
+                if char == '\\':
+                    self._escape_at = self._offset + index + 1
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if not self.started:
+                if char not in '[{':
+                    continue
+                self.started = True
+            if char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+                if char == '[' and self.record_depth is None:
+                    # Records are the objects directly inside the first array
+                    self.record_depth = self.depth + 1
+                elif char == '{' and self.depth == self.record_depth:
+                    capture_from = index
+            elif char in ']}':
+                if char == '}' and self.depth == self.record_depth and capture_from is not None:
+                    self._buffer.append(text[capture_from:index + 1])
+                    records.append(json.loads(''.join(self._buffer)))
+                    self._buffer = []
+                    capture_from = None
+                self.depth -= 1
+                if self.depth <= 0:
+                    self.done = True
+                    break
+
+        self._offset += len(text)
+        if capture_from is not None and not self.done:
+            self._buffer.append(text[capture_from:])
+        return records
+
+
+def _stream_completion(client, prompt, model, max_tokens):
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=max_tokens,
+        stream=True
+    )
+    parser = RecordStreamParser()
+    try:
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            for record in parser.feed(chunk.choices[0].delta.content):
+                yield record
+            if parser.done:
+                break
+    finally:
+        close = getattr(response, 'close', None)
+        if close:
+            close()
+
+
+def _stream_batch(client, output, stop, schema, headers, batch, first_row, total_rows,
+                  model, max_tokens, max_retries):
+    import openai
+
+    prompt = PROMPT_TEMPLATE.format(
+        schema=schema,
+        first_row=first_row + 1,
+        last_row=first_row + len(batch),
+        total_rows=total_rows,
+        table_html=render_rows(headers, batch),
+        row_count=len(batch),
+    )
+
+    emitted = 0
+    last_error = None
+    for attempt in range(1, max_retries + 1):
+        try:
+            seen = 0
+            for record in _stream_completion(client, prompt, model, max_tokens):
+                if stop.is_set():
+                    return
+                seen += 1
+                # Records sent before a retry have already reached the client
+                if seen <= emitted:
+                    continue
+                output.put(('record', record))
+                emitted += 1
+                if emitted == len(batch):
+                    break
+            if emitted == len(batch):
+                output.put(('done', None))
+                return
+            raise ExtractionError(f"Expected {len(batch)} records, got {emitted}")
+        except (openai.APIError, ExtractionError, ValueError) as e:
+            last_error = e
+            print(f"Streamed batch at row {first_row + 1} failed (attempt {attempt}/{max_retries}): {str(e)}")
+            if attempt < max_retries and stop.wait(min(30, 2 ** attempt) * (0.5 + random.random())):
+                return
+        except Exception as e:
+            last_error = e
+            break
+
+    output.put(('error', ExtractionError(
+        f"Batch at row {first_row + 1} failed after {emitted} records: {last_error}"
+    )))
+
+
+def stream_batches(client, schema, headers, rows, model='gpt-4o', budget_tokens=1500,
+                   concurrency=4, max_tokens=4096, max_retries=3):
+    """Yield extracted records in row order while the completions are still streaming.
+
+    Batches run ``concurrency`` at a time and each one is read with
+    ``stream=True``, so the first records go out as soon as the model writes
+    them. Later batches only start once earlier ones have been passed on,
+    which keeps memory bounded by the batches in flight rather than the table.
+    """
+    batches = split_into_batches(headers, rows, budget_tokens)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    outputs = []
+
+    def submit(i):
+        first_row = sum(len(batch) for batch in batches[:i])
+        output = queue.Queue()
+        outputs.append(output)
+        executor.submit(
+            _stream_batch, client, output, stop, schema, headers, batches[i], first_row, len(rows),
+            model, max_tokens, max_retries
+        )
+
+    try:
+        for i in range(min(concurrency, len(batches))):
+            submit(i)
+        for i in range(len(batches)):
+            while True:
+                kind, value = outputs[i].get()
+                if kind == 'record':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    break
+            outputs[i] = None
+            if len(outputs) < len(batches):
+                submit(len(outputs))
+    finally:
+        # Also runs when the client disconnects and the generator is closed
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_table(schema, headers, rows, config, client=None):
+    return stream_batches(
+        client or get_llm_gateway(), schema, headers, rows,
+        model=config.get('EXTRACT_MODEL', 'gpt-4o'),
+        budget_tokens=config.get('EXTRACT_BATCH_TOKENS', 1500),
+        concurrency=config.get('EXTRACT_CONCURRENCY', 4),
+        max_tokens=config.get('EXTRACT_MAX_TOKENS', 4096),
+        max_retries=config.get('EXTRACT_MAX_RETRIES', 3),
+    )
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, dict) and 'uri' in value:
+        return value['uri']
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def iter_csv(records, fieldnames, chunk_rows=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    pending = 0
+    written = 0
+    try:
+        for record in records:
+            writer.writerow([_csv_value(record.get(name)) if isinstance(record, dict) else '' for name in fieldnames])
+            pending += 1
+            written += 1
+            # The first row goes out on its own so the download starts right away
+            if pending >= chunk_rows or written == 1:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+    except Exception:
+        # Rows extracted before the failure still go out ahead of the error
+        if buffer.tell():
+            yield buffer.getvalue()
+        raise
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def csv_error_row(message):
+    # A trailer row, so a download that failed part way doesn't look complete
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([f"ERROR: {message}"])
+    return buffer.getvalue()
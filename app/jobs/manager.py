@@ -0,0 +1,187 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, jsonify, redirect, request, url_for
+
+from app.db import get_connection
+from app.metrics import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+"""
+
+FINISHED = ('done', 'failed')
+
+# kind -> function(params, progress) returning a JSON-serializable result
+JOB_HANDLERS = {}
+# kind -> function(job) rendering a finished job
+JOB_VIEWS = {}
+
+
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def job_view(kind):
+    def register(func):
+        JOB_VIEWS[kind] = func
+        return func
+    return register
+
+
+class JobManager:
+    """Runs registered job handlers on a local thread pool.
+
+    Every job is a row in the ``jobs`` table, so status, progress and
+    results survive the request that started them and can be polled from
+    any worker process sharing the database.
+    """
+
+    def __init__(self, app, connect, workers=4):
+        self.app = app
+        self.connect = connect
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        db = self.connect()
+        db.executescript(SCHEMA)
+
+        # Jobs whose worker process died will never finish
+        for row in db.execute("SELECT id, owner FROM jobs WHERE status IN ('pending', 'running')").fetchall():
+            if not _owner_alive(row['owner'], self.owner):
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', updated_at = ? WHERE id = ?",
+                    (time.time(), row['id'])
+                )
+
+    def submit(self, kind, params):
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.connect().execute(
+            'INSERT INTO jobs (id, kind, status, params, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, 'pending', json.dumps(params), self.owner, now, now)
+        )
+        self._executor.submit(self._run, job_id, kind, params)
+        return job_id
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self.app.app_context():
+            self.connect().execute(
+                f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id)
+            )
+
+    def _run(self, job_id, kind, params):
+        def progress(fraction, message=None):
+            self._update(job_id, progress=max(0.0, min(1.0, fraction)), message=message)
+
+        with self.app.app_context(), metrics.trace(f"job {kind}"):
+            self._update(job_id, status='running', message='Started')
+            try:
+                result = JOB_HANDLERS[kind](params, progress)
+            except Exception as e:
+                print(f"Error in {kind} job {job_id}: {str(e)}")
+                self._update(job_id, status='failed', error=str(e), message='Failed')
+                return
+            self._update(job_id, status='done', progress=1.0, message='Done', result=json.dumps(result))
+
+    def get(self, job_id):
+        row = self.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def status(self, job_id):
+        row = self.connect().execute(
+            'SELECT id, kind, status, progress, message, error, created_at, updated_at FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_job_manager(app=None):
+    app = app or current_app._get_current_object()
+    manager = app.extensions.get('job_manager')
+    if manager is None:
+        with _manager_lock:
+            manager = app.extensions.get('job_manager')
+            if manager is None:
+                manager = JobManager(app, lambda: get_connection(app), workers=app.config.get('JOB_WORKERS', 4))
+                app.extensions['job_manager'] = manager
+    return manager
+
+
+def _owner_alive(owner, current_owner):
+    # Only processes on this host can be checked; assume remote owners are alive
+    parts = (owner or '').split(':')
+    if len(parts) != 3 or not parts[1].isdigit():
+        return False
+    host, pid, _ = parts
+    if host != socket.gethostname():
+        return True
+    if int(pid) == os.getpid():
+        # Same PID but a different run, e.g. PID 1 in a restarted container
+        return owner == current_owner
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def wants_async():
+    # Forms opt in with a hidden field, API clients by asking for JSON
+    return request.form.get('async') == '1' or request.accept_mimetypes.best == 'application/json'
+
+
+def job_links(job_id):
+    return {
+        'job_id': job_id,
+        'status_url': url_for('jobs.job_status', job_id=job_id),
+        'result_url': url_for('jobs.job_result', job_id=job_id),
+        'events_url': url_for('jobs.job_events', job_id=job_id),
+        'view_url': url_for('jobs.view_job', job_id=job_id),
+    }
+
+
+def job_response(job_id):
+    # API clients get the job links, browsers go to the progress page
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job_links(job_id)), 202
+    return redirect(url_for('jobs.view_job', job_id=job_id), code=303)
+
+
+_manager_lock = threading.Lock()
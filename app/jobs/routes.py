@@ -0,0 +1,57 @@
+import json
+
+from flask import Response, jsonify, render_template
+from app.jobs import jobs_bp
+from app.jobs.manager import FINISHED, JOB_VIEWS, get_job_manager, job_links
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = get_job_manager().status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    status.update(job_links(job_id))
+    return jsonify(status)
+
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job['status'] == 'failed':
+        return jsonify({"error": job['error'], "status": job['status']}), 500
+    if job['status'] not in FINISHED:
+        return jsonify({"status": job['status'], "progress": job['progress']}), 202
+    return jsonify({"status": job['status'], "result": job['result']})
+
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    manager = get_job_manager()
+    # One event and close, so no worker is held open; EventSource reconnects after the
+    # retry delay, which makes it poll without any extra client code
+    retry_ms = manager.app.config.get('JOB_EVENTS_RETRY_MS', 1000)
+    status = manager.status(job_id)
+    if status is None:
+        body = f"event: failed\ndata: {json.dumps({'error': 'Unknown job'})}\n\n"
+    else:
+        event = status['status'] if status['status'] in FINISHED else 'progress'
+        body = f"retry: {retry_ms}\nevent: {event}\ndata: {json.dumps(status)}\n\n"
+
+    return Response(
+        body,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@jobs_bp.route('/<job_id>/view', methods=['GET'])
+def view_job(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return render_template('jobs/job.html', error="Unknown job"), 404
+    if job['status'] not in FINISHED:
+        return render_template('jobs/job.html', job=job, links=job_links(job_id))
+    # Each blueprint renders its own finished jobs
+    return JOB_VIEWS[job['kind']](job)
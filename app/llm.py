@@ -0,0 +1,529 @@
+import asyncio
+import collections
+import contextvars
+import random
+import threading
+import time
+from functools import lru_cache
+
+from flask import current_app
+
+from app.metrics import count, span
+
+
+@lru_cache(maxsize=1)
+def retryable_errors():
+    # Errors worth retrying or sending to another backend; anything else is the request's fault.
+    # openai takes a while to import, so it's loaded with the first request rather than at startup.
+    import openai
+
+    return (
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # Returns how long the caller must wait for its token
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        if self.rate:
+            delay = self._reserve()
+            if delay:
+                time.sleep(delay)
+
+    async def acquire_async(self):
+        if self.rate:
+            delay = self._reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+
+class ConcurrencyLimit:
+    """At most ``limit`` requests in flight, shared by threads and event loops.
+
+    Sync callers block in ``acquire`` and async callers await
+    ``acquire_async``; both wait in one queue, so a backend busy on both
+    paths still has only ``limit`` requests in flight. A released slot is
+    handed straight to the longest waiter.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters = collections.deque()
+
+    def _take(self, wake):
+        # Called with the lock held; returns True when a slot was free
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        self._waiters.append(wake)
+        return False
+
+    def acquire(self):
+        event = threading.Event()
+        with self._lock:
+            if self._take(event.set):
+                return
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            # A waiter cancelled after being handed the slot gives it back
+            if future.cancelled():
+                self.release()
+            else:
+                future.set_result(None)
+
+        def wake():
+            loop.call_soon_threadsafe(resolve)
+
+        with self._lock:
+            if self._take(wake):
+                return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if wake in self._waiters:
+                    self._waiters.remove(wake)
+                    raise
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.in_flight -= 1
+                return
+            wake = self._waiters.popleft()
+        wake()
+
+
+class Backend:
+    """One OpenAI-compatible endpoint with its own connection pool and limits.
+
+    The sync client shares a keep-alive ``httpx.Client`` across threads.
+    Async clients are bound to an event loop, so ``async_client()`` builds a
+    new one that the caller keeps for that loop and closes. Both paths share
+    one ``ConcurrencyLimit`` of ``concurrency`` requests. ``model``
+    replaces the requested model name, for backends like Ollama that serve
+    other models.
+    """
+
+    def __init__(self, name, base_url=None, api_key=None, model=None, concurrency=8, rate=0.0,
+                 timeout=60.0, max_connections=20, cooldown=30.0):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.cooldown = cooldown
+        self.limit = ConcurrencyLimit(concurrency)
+        self.bucket = TokenBucket(rate)
+        self._lock = threading.Lock()
+        self._client = None
+        self.latency = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.stats = {'requests': 0, 'errors': 0}
+
+    def _limits(self):
+        import httpx
+
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    @property
+    def client(self):
+        import httpx
+        import openai
+
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    base_url=self.base_url, api_key=self.api_key, max_retries=0, timeout=self.timeout,
+                    http_client=httpx.Client(limits=self._limits(), timeout=self.timeout),
+                )
+            return self._client
+
+    def async_client(self):
+        import httpx
+        import openai
+
+        return openai.AsyncOpenAI(
+            base_url=self.base_url, api_key=self.api_key, max_retries=0, timeout=self.timeout,
+            http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout),
+        )
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def record(self, elapsed=None, error=None):
+        with self._lock:
+            self.stats['requests'] += 1
+            if error is None:
+                # Exponentially weighted, so a backend that slows down loses traffic quickly
+                self.latency = elapsed if self.latency is None else 0.7 * self.latency + 0.3 * elapsed
+                self.failures = 0
+                return
+            self.stats['errors'] += 1
+            self.failures += 1
+            # Repeated failures take the backend out of rotation for a while
+            if self.failures >= 3:
+                self.down_until = time.monotonic() + self.cooldown
+
+    def prepare(self, kwargs):
+        if self.model:
+            kwargs = dict(kwargs, model=self.model)
+        return kwargs
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                name=self.name,
+                base_url=self.base_url,
+                latency=round(self.latency, 3) if self.latency is not None else None,
+                available=self.available,
+                failures=self.failures,
+            )
+
+
+def _count_usage(backend, response):
+    # Streams carry no usage block
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        count('llm_tokens', usage.prompt_tokens or 0, backend=backend.name, direction='in')
+        count('llm_tokens', usage.completion_tokens or 0, backend=backend.name, direction='out')
+
+
+def _mark_served(response, kwargs):
+    # The response cache keys answers by the model that actually produced them
+    if not kwargs.get('stream'):
+        response._served_model = kwargs.get('model')
+    return response
+
+
+def _backoff(attempt):
+    return min(10.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+
+
+class _Stream:
+    # Holds the backend's concurrency slot until the stream is read or closed
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        if self._release:
+            self._release()
+            self._release = None
+            self._stream.close()
+
+
+class _Completions:
+    def __init__(self, gateway):
+        self._gateway = gateway
+
+    def create(self, **kwargs):
+        return self._gateway.complete(kwargs)
+
+    def served_model(self, model):
+        return self._gateway.served_model(model)
+
+
+class _AsyncCompletions:
+    def __init__(self, client):
+        self._client = client
+
+    async def create(self, **kwargs):
+        return await self._client.complete(kwargs)
+
+    def served_model(self, model):
+        return self._client.served_model(model)
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class LLMGateway:
+    """Routes chat completions across backends with retries and failover.
+
+    Exposes ``chat.completions.create`` like an ``openai.OpenAI`` client so
+    callers and the response cache don't need to know about it. Backends
+    are tried fastest first by recent latency (or in configured order with
+    ``routing='priority'``), skipping any that are cooling down after
+    repeated failures. Retryable errors move on to the next backend and
+    back off with jitter between rounds; other API errors are raised
+    straight away.
+    """
+
+    def __init__(self, backends, routing='latency', max_retries=2):
+        if not backends:
+            raise ValueError("No LLM backend configured. Set OPENAI_API_KEY or OLLAMA_API_URL.")
+        self.backends = backends
+        self.routing = routing
+        self.max_retries = max_retries
+        self.chat = _Chat(_Completions(self))
+
+    def ordered_backends(self):
+        candidates = [backend for backend in self.backends if backend.available] or list(self.backends)
+        if self.routing != 'latency':
+            return candidates
+        # Untried backends sort first so each gets measured once; failing ones go last
+        return sorted(candidates, key=lambda backend: (backend.failures > 0, backend.latency or 0.0))
+
+    def served_model(self, model):
+        # The model the next request for ``model`` will be answered by, so the
+        # response cache can look up answers stored under a failover backend's model
+        backend = self.ordered_backends()[0]
+        return backend.model or model
+
+    def attempts(self):
+        # Yields (seconds to wait first, backend); each round tries every usable backend once
+        for attempt in range(self.max_retries + 1):
+            for index, backend in enumerate(self.ordered_backends()):
+                yield (_backoff(attempt) if attempt and not index else 0), backend
+
+    def complete(self, kwargs):
+        last_error = None
+        for delay, backend in self.attempts():
+            if delay:
+                time.sleep(delay)
+            backend.bucket.acquire()
+            backend.limit.acquire()
+            started = time.monotonic()
+            prepared = backend.prepare(kwargs)
+            try:
+                with span('llm.request', backend=backend.name):
+                    response = backend.client.chat.completions.create(**prepared)
+            except retryable_errors() as e:
+                backend.limit.release()
+                backend.record(error=e)
+                last_error = e
+                print(f"LLM backend {backend.name} failed: {str(e)}")
+                continue
+            except Exception:
+                backend.limit.release()
+                raise
+            backend.record(time.monotonic() - started)
+            _count_usage(backend, response)
+            if kwargs.get('stream'):
+                return _Stream(response, backend.limit.release)
+            backend.limit.release()
+            return _mark_served(response, prepared)
+        raise last_error
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    def snapshot(self):
+        return {
+            'routing': self.routing,
+            'backends': [backend.snapshot() for backend in self.backends],
+        }
+
+
+class AsyncLLMGateway:
+    """Async counterpart of ``LLMGateway`` for one event loop.
+
+    Routing state and each backend's concurrency limit are shared with the
+    parent gateway. The HTTP clients can only be used on the loop they were
+    made on, so ``LLMLoop`` keeps a single instance on its loop for every
+    run to share.
+    """
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self._clients = {}
+        self.chat = _Chat(_AsyncCompletions(self))
+
+    def _client_for(self, backend):
+        if backend.name not in self._clients:
+            self._clients[backend.name] = backend.async_client()
+        return self._clients[backend.name]
+
+    def served_model(self, model):
+        return self.gateway.served_model(model)
+
+    async def complete(self, kwargs):
+        last_error = None
+        for delay, backend in self.gateway.attempts():
+            if delay:
+                await asyncio.sleep(delay)
+            client = self._client_for(backend)
+            await backend.bucket.acquire_async()
+            await backend.limit.acquire_async()
+            try:
+                started = time.monotonic()
+                prepared = backend.prepare(kwargs)
+                with span('llm.request', backend=backend.name):
+                    response = await client.chat.completions.create(**prepared)
+            except retryable_errors() as e:
+                backend.record(error=e)
+                last_error = e
+                print(f"LLM backend {backend.name} failed: {str(e)}")
+                continue
+            finally:
+                backend.limit.release()
+            backend.record(time.monotonic() - started)
+            _count_usage(backend, response)
+            return _mark_served(response, prepared)
+        raise last_error
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        self._clients = {}
+
+
+class LLMLoop:
+    """Background event loop that every async LLM run is handed to.
+
+    Runs that each started their own loop also got their own connection
+    pools and their own copy of every backend's concurrency limit. Here they
+    share one ``AsyncLLMGateway``, so the limits hold across runs.
+    """
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._client = AsyncLLMGateway(self.gateway)
+                self._thread = threading.Thread(target=self._loop.run_forever, name='llm-loop', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    @property
+    def client(self):
+        """The shared async client; only use it from coroutines passed to ``run``."""
+        self._start()
+        return self._client
+
+    def run(self, coroutine):
+        """Run ``coroutine`` on the shared loop and wait for its result."""
+        loop = self._start()
+        # The caller's context carries the app context and metrics trace over to the loop
+        future = contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, coroutine, loop)
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def build_backends(config):
+    common = {
+        'timeout': config.get('LLM_TIMEOUT', 60.0),
+        'max_connections': config.get('LLM_MAX_CONNECTIONS', 20),
+        'cooldown': config.get('LLM_FAILURE_COOLDOWN', 30.0),
+    }
+    backends = []
+    # Ollama used to win outright when configured, so it keeps priority
+    if config.get('OLLAMA_API_URL'):
+        backends.append(Backend(
+            'ollama', config['OLLAMA_API_URL'], config.get('OLLAMA_API_KEY') or 'ollama',
+            model=config.get('OLLAMA_MODEL'),
+            concurrency=config.get('OLLAMA_CONCURRENCY', 2),
+            rate=config.get('OLLAMA_RATE_LIMIT', 0.0),
+            **common
+        ))
+    if config.get('OPENAI_API_KEY'):
+        backends.append(Backend(
+            'openai', config.get('OPENAI_API_URL'), config['OPENAI_API_KEY'],
+            concurrency=config.get('OPENAI_CONCURRENCY', 8),
+            rate=config.get('OPENAI_RATE_LIMIT', 0.0),
+            **common
+        ))
+    return backends
+
+
+def get_llm_gateway(app=None):
+    app = app or current_app._get_current_object()
+    gateway = app.extensions.get('llm_gateway')
+    if gateway is not None:
+        return gateway
+
+    # Built under the lock so threads starting at once don't each open connection pools
+    with _gateway_lock:
+        gateway = app.extensions.get('llm_gateway')
+        if gateway is None:
+            gateway = app.extensions['llm_gateway'] = LLMGateway(
+                build_backends(app.config),
+                routing=app.config.get('LLM_ROUTING', 'latency'),
+                max_retries=app.config.get('LLM_MAX_RETRIES', 2),
+            )
+    return gateway
+
+
+def get_llm_loop(app=None):
+    app = app or current_app._get_current_object()
+    llm_loop = app.extensions.get('llm_loop')
+    if llm_loop is not None:
+        return llm_loop
+
+    gateway = get_llm_gateway(app)
+    with _gateway_lock:
+        llm_loop = app.extensions.get('llm_loop')
+        if llm_loop is None:
+            llm_loop = app.extensions['llm_loop'] = LLMLoop(gateway)
+    return llm_loop
+
+
+_gateway_lock = threading.Lock()
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.db import get_connection
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    latency REAL NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at);
+"""
+
+# Parameters that change the completion; anything else (timeouts, headers) doesn't
+KEY_PARAMS = (
+    'temperature', 'max_tokens', 'top_p', 'frequency_penalty', 'presence_penalty',
+    'response_format', 'seed', 'stop', 'tools', 'tool_choice', 'n',
+)
+
+
+def _normalize(text):
+    return ' '.join(text.split()) if isinstance(text, str) else text
+
+
+def cache_key(model, messages, params):
+    normalized = {
+        'model': model,
+        'messages': [
+            {'role': message.get('role'), 'content': _normalize(message.get('content'))}
+            for message in messages
+        ],
+        'params': {name: params[name] for name in KEY_PARAMS if params.get(name) is not None},
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Two-tier cache of chat completions: an in-memory LRU over a SQLite table.
+
+    Entries live for ``ttl`` seconds (``None`` keeps them until evicted) and
+    the disk tier drops least recently used entries past ``max_bytes``.
+    Counters track hits per tier, misses, and the model latency saved.
+    """
+
+    def __init__(self, connect, memory_entries=256, max_bytes=100 * 1024 * 1024, ttl=7 * 86400):
+        self.connect = connect
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = False
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'latency_saved': 0.0,
+        }
+
+    def _db(self):
+        connection = self.connect()
+        if not self._ready:
+            connection.executescript(SCHEMA)
+            self._ready = True
+        return connection
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry['expires_at'] is None or entry['expires_at'] > now:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    self.stats['latency_saved'] += entry['latency']
+                    return entry['response']
+                del self._memory[key]
+
+        db = self._db()
+        row = db.execute(
+            'SELECT data, latency, expires_at FROM llm_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row['expires_at'] is not None and row['expires_at'] <= now):
+            if row is not None:
+                db.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            self._count('misses')
+            return None
+
+        db.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        response = zlib.decompress(row['data']).decode('utf-8')
+        self._remember(key, {'response': response, 'latency': row['latency'], 'expires_at': row['expires_at']})
+        self._count('disk_hits')
+        self._count('latency_saved', row['latency'])
+        return response
+
+    def put(self, key, model, response, latency, ttl=None):
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl else None
+        data = zlib.compress(response.encode('utf-8'), 6)
+
+        self._remember(key, {'response': response, 'latency': latency, 'expires_at': expires_at})
+        db = self._db()
+        db.execute(
+            'INSERT OR REPLACE INTO llm_cache (key, model, data, size, latency, created_at, expires_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, model, data, len(data), latency, now, expires_at, now)
+        )
+        self._count('stores')
+        self.evict()
+
+    def evict(self):
+        db = self._db()
+        db.execute('DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for row in db.execute('SELECT key, size FROM llm_cache ORDER BY accessed_at'):
+            if total <= self.max_bytes:
+                break
+            doomed.append((row['key'],))
+            total -= row['size']
+        db.executemany('DELETE FROM llm_cache WHERE key = ?', doomed)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self._db().execute('DELETE FROM llm_cache')
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        count, total = self._db().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache'
+        ).fetchone()
+        stats['disk_entries'] = count
+        stats['disk_bytes'] = total
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+def _load_completion(payload):
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate_json(payload)
+
+
+class _CachedCompletions:
+    def __init__(self, completions, cache, enabled):
+        self._completions = completions
+        self._cache = cache
+        self._enabled = enabled
+
+    def _lookup(self, kwargs):
+        refresh = not kwargs.pop('cache', True)
+        # Streams are consumed incrementally and can't be replayed from a single payload
+        if not self._enabled or kwargs.get('stream'):
+            return None, None
+        model = kwargs.get('model')
+        # While a gateway fails over to a backend that swaps in its own model
+        # (Ollama), answers are stored and found under that model
+        served_model = getattr(self._completions, 'served_model', None)
+        if served_model:
+            model = served_model(model)
+        key = cache_key(model, kwargs.get('messages', []), kwargs)
+        if refresh:
+            return key, None
+        cached = self._cache.get(key)
+        return key, (_load_completion(cached) if cached is not None else None)
+
+    def _store(self, key, kwargs, response, started):
+        if key is None:
+            return
+        # Keyed by the model that actually answered, which can differ from the one
+        # looked up when the expected backend failed
+        model = getattr(response, '_served_model', None) or kwargs.get('model')
+        key = cache_key(model, kwargs.get('messages', []), kwargs)
+        self._cache.put(key, model, response.model_dump_json(), time.monotonic() - started)
+
+    def create(self, **kwargs):
+        key, cached = self._lookup(kwargs)
+        if cached is not None:
+            return cached
+        started = time.monotonic()
+        response = self._completions.create(**kwargs)
+        self._store(key, kwargs, response, started)
+        return response
+
+
+class _AsyncCachedCompletions(_CachedCompletions):
+    async def create(self, **kwargs):
+        key, cached = self._lookup(kwargs)
+        if cached is not None:
+            return cached
+        started = time.monotonic()
+        response = await self._completions.create(**kwargs)
+        self._store(key, kwargs, response, started)
+        return response
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class CachedClient:
+    """Wraps an ``openai.OpenAI``/``AsyncOpenAI`` client so chat completions go through the cache.
+
+    Pass ``cache=False`` to ``chat.completions.create`` to skip the lookup
+    for one call and overwrite the stored entry with the fresh response;
+    every other attribute is forwarded to the wrapped client.
+    """
+
+    supports_cache_bypass = True
+
+    def __init__(self, client, cache, enabled=True, is_async=False):
+        self._client = client
+        completions_class = _AsyncCachedCompletions if is_async else _CachedCompletions
+        self.chat = _Chat(completions_class(client.chat.completions, cache, enabled))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def get_llm_cache(app=None):
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('llm_cache')
+    if cache is None:
+        config = app.config
+        cache = app.extensions.setdefault('llm_cache', LLMCache(
+            lambda: get_connection(app),
+            memory_entries=config.get('LLM_CACHE_MEMORY_ENTRIES', 256),
+            max_bytes=config.get('LLM_CACHE_MAX_BYTES', 100 * 1024 * 1024),
+            ttl=config.get('LLM_CACHE_TTL', 7 * 86400),
+        ))
+    return cache
+
+
+def cached_client(client, app=None, is_async=False):
+    app = app or current_app._get_current_object()
+    return CachedClient(
+        client, get_llm_cache(app),
+        enabled=app.config.get('LLM_CACHE_ENABLED', True),
+        is_async=is_async,
+    )
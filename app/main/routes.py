@@ -1,5 +1,8 @@
-from flask import render_template
+from flask import Response, current_app, jsonify, render_template
 from app.main import main_bp
+from app.llm import build_backends, get_llm_gateway
+from app.llm_cache import get_llm_cache
+from app.metrics import metrics
 
 @main_bp.route('/')
 def index():
@@ -7,4 +10,20 @@ def index():
 
 @main_bp.route('/about')
 def about():
-    return render_template('main/about.html') 
\ No newline at end of file
+    return render_template('main/about.html')
+
+@main_bp.route('/llm_stats')
+def llm_stats():
+    # With no backend configured there's no gateway to report on, only the cache
+    if build_backends(current_app.config):
+        gateway = get_llm_gateway().snapshot()
+    else:
+        gateway = {'routing': current_app.config.get('LLM_ROUTING', 'latency'), 'backends': []}
+    return jsonify({
+        'gateway': gateway,
+        'cache': get_llm_cache().snapshot(),
+    })
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
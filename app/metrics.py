@@ -0,0 +1,234 @@
+import contextvars
+import threading
+import time
+from collections import deque
+
+from flask import g, request
+
+
+# Seconds; covers quick parses up to slow browser settles and LLM calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+class _NullSpan:
+    # Shared no-op span so disabled metrics cost one attribute check per call
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class _Span:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.trace = _trace.get()
+        if self.trace is not None:
+            self.depth = self.trace['depth']
+            self.trace['depth'] += 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.observe('stage', elapsed, error=exc_type is not None, stage=self.name, **self.labels)
+        if self.trace is not None:
+            self.trace['depth'] -= 1
+            self.trace['spans'].append({
+                'name': self.name,
+                'labels': self.labels,
+                'start': self.started - self.trace['started'],
+                'seconds': elapsed,
+                'depth': self.depth,
+            })
+        return False
+
+
+class _Trace:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.trace = {'name': self.name, 'started': time.perf_counter(), 'depth': 0, 'spans': []}
+        self.token = _trace.set(self.trace)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _trace.reset(self.token)
+        except ValueError:
+            # Streamed responses can finish in a different context than they started in
+            pass
+        trace = self.trace
+        # Requests that touched no instrumented stage aren't worth keeping
+        if trace['spans']:
+            self.metrics.keep_trace({
+                'name': trace['name'],
+                'at': time.time(),
+                'seconds': time.perf_counter() - trace['started'],
+                'error': exc_type is not None,
+                'spans': sorted(trace['spans'], key=lambda span: span['start']),
+            })
+        return False
+
+
+class Metrics:
+    """In-process counters, span timings and recent per-request traces.
+
+    ``span(name)`` times a stage into the ``stage`` histogram (labelled with
+    the stage name) and, inside a ``trace()``, into that request's
+    breakdown. ``count(name, value)`` bumps a counter. Both are no-ops
+    when disabled. ``render_prometheus()`` writes
+    everything in the Prometheus text exposition format.
+    """
+
+    def __init__(self, enabled=True, recent=50):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._traces = deque(maxlen=recent)
+
+    def configure(self, enabled=True, recent=50):
+        with self._lock:
+            self.enabled = enabled
+            self._traces = deque(self._traces, maxlen=recent)
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, labels)
+
+    def trace(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Trace(self, name)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, error=False, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0, 'errors': 0}
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            if error:
+                histogram['errors'] += 1
+
+    def keep_trace(self, trace):
+        with self._lock:
+            self._traces.appendleft(trace)
+
+    def recent_traces(self):
+        with self._lock:
+            return list(self._traces)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._traces.clear()
+
+    def render_prometheus(self, prefix='migrator'):
+        def metric_name(name):
+            return f"{prefix}_{name.replace('.', '_')}"
+
+        def labels_text(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+            return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: dict(value, buckets=list(value['buckets'])) for key, value in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        lines = []
+        for name in sorted(counters):
+            full_name = metric_name(name) + '_total'
+            lines.append(f'# TYPE {full_name} counter')
+            for key, value in sorted(counters[name].items()):
+                lines.append(f'{full_name}{labels_text(key)} {value}')
+
+        for name in sorted(histograms):
+            full_name = metric_name(name) + '_seconds'
+            lines.append(f'# TYPE {full_name} histogram')
+            for key, histogram in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, histogram['buckets']):
+                    cumulative += bucket
+                    lines.append(f'{full_name}_bucket{labels_text(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{full_name}_bucket{labels_text(key, [("le", "+Inf")])} {histogram["count"]}')
+                lines.append(f'{full_name}_sum{labels_text(key)} {histogram["sum"]:.6f}')
+                lines.append(f'{full_name}_count{labels_text(key)} {histogram["count"]}')
+            errors_name = metric_name(name) + '_errors_total'
+            lines.append(f'# TYPE {errors_name} counter')
+            for key, histogram in sorted(histograms[name].items()):
+                lines.append(f'{errors_name}{labels_text(key)} {histogram["errors"]}')
+        return '\n'.join(lines) + '\n'
+
+
+# One registry per process, like the Prometheus client libraries; spans and
+# counters are recorded from worker threads that have no app context.
+metrics = Metrics(enabled=False)
+
+
+def init_metrics(app):
+    config = app.config
+    metrics.configure(
+        enabled=config.get('METRICS_ENABLED', True),
+        recent=config.get('METRICS_RECENT_TRACES', 50),
+    )
+    app.extensions['metrics'] = metrics
+
+    if metrics.enabled:
+        @app.before_request
+        def start_request_trace():
+            g.metrics_trace = metrics.trace(f"{request.method} {request.path}")
+            g.metrics_trace.__enter__()
+
+        @app.teardown_request
+        def finish_request_trace(error=None):
+            trace = g.pop('metrics_trace', None)
+            if trace is not None:
+                trace.__exit__(type(error) if error else None, error, None)
+    return metrics
+
+
+def span(name, **labels):
+    return metrics.span(name, **labels)
+
+
+def count(name, value=1, **labels):
+    metrics.count(name, value, **labels)
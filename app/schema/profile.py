@@ -0,0 +1,271 @@
+import numpy as np
+import pandas as pd
+
+
+NULL_TOKENS = {'', '-', '--', '—', '–', 'n/a', 'na', 'null', 'none', 'nan', '?'}
+TRUE_TOKENS = {'true', 'yes', 'y', 't', 'on', '✓', '✔'}
+FALSE_TOKENS = {'false', 'no', 'n', 'f', 'off', '✗', '✘'}
+CURRENCY_CHARS = '$€£¥₹₩₽¢'
+CURRENCY = f'[{CURRENCY_CHARS}]'
+NUMBER_NOISE_CHARS = " \t\u00a0\u202f'’%" + CURRENCY_CHARS
+NUMBER_NOISE = r"[\s'’%]|" + CURRENCY
+NUMERIC_SHAPE = r'^[+\-−(]?\d[\d.,]*\)?$'
+URL_PATTERN = r'^(?:https?://|www\.)\S+$'
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$'
+DATE_HINT = r'\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|[A-Za-z]{3,9}\.? \d{1,2},? \d{4}|\d{1,2} [A-Za-z]{3,9}\.? \d{4}'
+DATE_FORMATS = (
+    'ISO8601',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%d.%m.%Y',
+    '%Y/%m/%d',
+    '%m/%d/%y',
+    '%B %d, %Y',
+    '%b %d, %Y',
+    '%d %B %Y',
+    '%d %b %Y',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %I:%M %p',
+    '%d/%m/%Y %H:%M',
+)
+# Strings longer than this don't fit a Drupal plain string field
+STRING_MAX_LENGTH = 255
+
+
+def _weighted(mask, counts):
+    return int(counts[np.asarray(mask, dtype=bool)].sum())
+
+
+def detect_decimal_separator(values):
+    """Guess whether numbers in ``values`` use "1,234.5" or "1.234,5"."""
+    # Evidence for each convention: decimal tails and thousands groups
+    us = values.str.contains(r'\d\.\d{1,2}$|,\d{3}\.|,\d{3},', regex=True).sum()
+    eu = values.str.contains(r'\d,\d{1,2}$|\.\d{3},|\.\d{3}\.', regex=True).sum()
+    return ',' if eu > us else '.'
+
+
+def _number_table(decimal_separator):
+    # One str.translate pass drops the noise and normalizes separators and minus signs
+    table = {ord(char): None for char in NUMBER_NOISE_CHARS + '()' + ('.' if decimal_separator == ',' else ',')}
+    table[ord('−')] = '-'
+    if decimal_separator == ',':
+        table[ord(',')] = '.'
+    return table
+
+
+def parse_numbers(values, decimal_separator='.'):
+    """Parse strings with thousands separators, currency, signs and
+    accounting-style parentheses into floats (NaN where unparseable)."""
+    # Plain numbers parse in C; only the rest go through the string clean-up
+    if decimal_separator == '.':
+        numbers = pd.to_numeric(values, errors='coerce').astype(float)
+    else:
+        numbers = pd.Series(np.nan, index=values.index)
+    rest = numbers.isna().to_numpy()
+    if not rest.any():
+        return numbers
+    raw = values[rest]
+    negative = raw.str.startswith('(').to_numpy(dtype=bool, na_value=False)
+    parsed = pd.to_numeric(raw.str.translate(_number_table(decimal_separator)), errors='coerce').to_numpy(dtype=float)
+    numbers[rest] = np.where(negative, -parsed, parsed)
+    return numbers
+
+
+def parse_booleans(values):
+    lowered = values.str.lower()
+    result = pd.Series(pd.NA, index=values.index, dtype='boolean')
+    result[lowered.isin(TRUE_TOKENS)] = True
+    result[lowered.isin(FALSE_TOKENS)] = False
+    return result
+
+
+def parse_dates(values, formats):
+    """Parse with each format in turn, later formats only filling what earlier ones missed."""
+    if isinstance(formats, str):
+        formats = [formats]
+    dates = None
+    for date_format in formats:
+        todo = values if dates is None else values[dates.isna()]
+        if not len(todo):
+            break
+        parsed = pd.to_datetime(todo, format=date_format, errors='coerce')
+        if getattr(parsed.dt, 'tz', None) is not None:
+            parsed = parsed.dt.tz_convert(None)
+        dates = parsed if dates is None else dates.fillna(parsed)
+    return dates
+
+
+def _date_formats(sample):
+    # Greedily pick the formats that cover the sample, most productive first
+    formats = []
+    remaining = sample
+    while len(remaining) and len(formats) < 3:
+        best, best_count = None, 0
+        for date_format in DATE_FORMATS:
+            if date_format in formats:
+                continue
+            try:
+                count = int(parse_dates(remaining, date_format).notna().sum())
+            except (ValueError, TypeError):
+                continue
+            if count > best_count:
+                best, best_count = date_format, count
+        if best is None:
+            break
+        formats.append(best)
+        remaining = remaining[parse_dates(remaining, best).isna()]
+    return formats
+
+
+def _scalar(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+def _sample(values, size):
+    # Evenly spaced, so a column that changes halfway down still shows it
+    if len(values) <= size:
+        return values
+    return values.iloc[np.linspace(0, len(values) - 1, size).astype(int)]
+
+
+def _candidates(sample, min_share):
+    """Types worth checking against the whole column, most specific first."""
+    def share(mask):
+        return mask.sum() / len(sample)
+
+    kinds = []
+    lowered = sample.str.lower()
+    booleans = lowered.isin(TRUE_TOKENS | FALSE_TOKENS)
+    # "0"/"1" columns stay numeric; a boolean needs at least one word
+    if share(booleans) >= min_share and (~sample[booleans].str.isdigit()).any():
+        kinds.append('boolean')
+    if share(sample.str.replace(NUMBER_NOISE, '', regex=True).str.match(NUMERIC_SHAPE, na=False)) >= min_share:
+        kinds.append('number')
+    if share(sample.str.contains(DATE_HINT, regex=True)) >= min_share:
+        kinds.append('date')
+    if share(sample.str.match(URL_PATTERN, na=False)) >= min_share:
+        kinds.append('link')
+    if share(sample.str.match(EMAIL_PATTERN, na=False)) >= min_share:
+        kinds.append('email')
+    return kinds
+
+
+def profile_column(values, hrefs=None, min_confidence=0.9, enum_max=20, sample_size=1000):
+    """Profile every value of a column of strings.
+
+    Returns the inferred ``type`` with the share of non-null values that
+    parse as it (``confidence``), null ratio, cardinality, the most common
+    values, and whatever a coercer needs to parse the column again:
+    ``decimal_separator`` for numbers, ``format`` for dates and the allowed
+    ``values`` for enums. A sample of distinct values picks the candidate
+    types; the winner's confidence is measured over every value, and all of
+    the work is done once per distinct value rather than once per row.
+    """
+    series = pd.Series(values, dtype=object).fillna('')
+    total = len(series)
+    codes, uniques = pd.factorize(series, sort=False)
+    counts = np.bincount(codes, minlength=len(uniques)) if total else np.zeros(0, dtype=int)
+    # Strip once per distinct value, then merge values that only differed in whitespace
+    codes, uniques = pd.factorize(pd.Series([str(value).strip() for value in uniques], dtype=object), sort=False)
+    counts = np.bincount(codes, weights=counts, minlength=len(uniques)).astype(int)
+    uniques = pd.Series(uniques, dtype=object)
+
+    null = np.fromiter((value.lower() in NULL_TOKENS for value in uniques), dtype=bool, count=len(uniques))
+    non_null = total - _weighted(null, counts)
+    present = uniques[~null].reset_index(drop=True)
+    present_counts = counts[~null]
+
+    profile = {
+        'type': 'string',
+        'confidence': 1.0,
+        'rows': total,
+        'null_ratio': round(1 - non_null / total, 4) if total else 0.0,
+        'distinct': int(len(present)),
+        'unique_ratio': round(len(present) / non_null, 4) if non_null else 0.0,
+        'max_length': max(map(len, present), default=0),
+        'top_values': [
+            [present.iloc[i], int(present_counts[i])] for i in np.argsort(-present_counts, kind='stable')[:3]
+        ],
+    }
+    if not non_null:
+        profile['type'] = 'empty'
+        return profile
+
+    def share(mask):
+        return _weighted(mask, present_counts) / non_null
+
+    sample = _sample(present, sample_size)
+    # Leave some slack so a sample that just misses doesn't hide the type
+    kinds = _candidates(sample, min_confidence - 0.1)
+    if hrefs is not None and 'link' not in kinds and any(href is not None for href in hrefs):
+        kinds.append('link')
+
+    for kind in kinds:
+        details = {}
+        if kind == 'boolean':
+            confidence = share(present.str.lower().isin(TRUE_TOKENS | FALSE_TOKENS).to_numpy())
+        elif kind == 'number':
+            separator = detect_decimal_separator(sample)
+            numbers = parse_numbers(present, separator)
+            parsed = numbers.notna().to_numpy()
+            confidence = share(parsed)
+            # Any value written with a decimal part makes the column decimal, even "1.00"
+            fractional = present.str.contains(separator, regex=False).to_numpy() & parsed
+            kind = 'decimal' if fractional.any() else 'integer'
+            details = {
+                'decimal_separator': separator,
+                'min': _scalar(numbers[parsed].min()) if parsed.any() else None,
+                'max': _scalar(numbers[parsed].max()) if parsed.any() else None,
+            }
+            currency = sample.str.extract(f'({CURRENCY})', expand=False).dropna()
+            if len(currency):
+                details['currency'] = currency.mode().iloc[0]
+            if kind == 'integer' and parsed.any():
+                details['min'], details['max'] = int(details['min']), int(details['max'])
+        elif kind == 'date':
+            formats = _date_formats(sample)
+            if not formats:
+                continue
+            dates = parse_dates(present, formats)
+            parsed = dates.notna().to_numpy()
+            confidence = share(parsed)
+            valid = dates[parsed]
+            kind = 'datetime' if (valid.dt.normalize() != valid).any() else 'date'
+            details = {
+                'format': formats,
+                'min': _scalar(valid.min()) if len(valid) else None,
+                'max': _scalar(valid.max()) if len(valid) else None,
+            }
+        elif kind == 'link':
+            confidence = share(present.str.match(URL_PATTERN, na=False).to_numpy())
+            if hrefs is not None:
+                # Cells holding an <a href> count as links even if the text doesn't look like one
+                linked = sum(1 for href in hrefs if href is not None)
+                confidence = max(confidence, linked / non_null)
+        else:
+            confidence = share(present.str.match(EMAIL_PATTERN, na=False).to_numpy())
+
+        if confidence >= min_confidence:
+            profile.update(details)
+            profile['type'] = kind
+            profile['confidence'] = round(min(confidence, 1.0), 4)
+            return profile
+
+    if profile['max_length'] > STRING_MAX_LENGTH:
+        profile['type'] = 'text_long'
+    elif 1 < len(present) <= enum_max and non_null >= 2 * len(present):
+        # Few distinct values that repeat a lot look like a fixed set of options
+        profile['type'] = 'enum'
+        profile['values'] = sorted(present.tolist())
+    return profile
+
+
+def profile_table(table, min_confidence=0.9):
+    return [
+        profile_column(column, table.links.get(i), min_confidence)
+        for i, column in enumerate(table.columns)
+    ]
@@ -0,0 +1,202 @@
+import threading
+from functools import lru_cache
+
+from flask import current_app
+
+from app.extract.chunking import estimate_tokens, render_rows
+
+
+# Braces are doubled since the templates below are filled in with str.format
+INSTRUCTIONS = """Create a complete Drupal content type configuration that includes:
+1. Machine names for fields (lowercase with underscores)
+2. Appropriate field types (text, long text, integer, decimal, link, etc.)
+3. Required field settings
+4. Field widget settings
+5. Display settings
+
+Return the schema as valid JSON that could be used for content type configuration, with
+one entry per column in a top-level "fields" list. Each field must have "field_name" (the
+machine name), "field_label" (the column header exactly as given) and "field_type", followed
+by its other settings. For example:
+{{"content_type_name": "...", "fields": [{{"field_name": "field_price", "field_label": "Price", "field_type": "decimal", "required": true, "description": "..."}}]}}
+Include field descriptions based on the data patterns observed."""
+
+PROMPT_TEMPLATE = """Generate a Drupal 11 content type schema for a table with {n_rows} rows and these columns.
+
+Column profiles measured over every row (inferred Drupal field type first):
+{column_profiles}
+
+Representative rows ({sample_rows} of {n_rows}, styling and attributes removed):
+{table_html}
+
+""" + INSTRUCTIONS
+
+FULL_PROMPT_TEMPLATE = """Generate a Drupal 11 content type schema based on this HTML table:
+
+```html
+{table_html}
+```
+
+""" + INSTRUCTIONS
+
+# Cells longer than this are cut in the sample; the profile still covers the full value
+CELL_CHARS = 120
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    # tiktoken is a requirement; a missing install should fail, not quietly change the counts
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # Encodings are downloaded on first use, which fails on machines without network
+        # access (set TIKTOKEN_CACHE_DIR to a pre-filled cache there)
+        print(f"Error loading tiktoken encoding, estimating tokens instead: {str(e)}")
+        return None
+
+
+def tokenizer_name(model='gpt-4'):
+    return 'tiktoken' if _encoding(model) else 'estimate'
+
+
+def count_tokens(text, model='gpt-4'):
+    # Without the encoding fall back to the four-characters-per-token estimate
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _clip(value):
+    return value if len(value) <= CELL_CHARS else value[:CELL_CHARS - 1] + '…'
+
+
+def representative_rows(table, profiles, limit):
+    """Pick up to ``limit`` row indexes that show the variety in the table.
+
+    Rows holding each column's extremes, every enum value, an empty cell
+    and the longest text come first, then evenly spaced rows fill the rest,
+    so a sorted or grouped table is not represented by its first page only.
+    Indexes come back in that priority order.
+    """
+    import pandas as pd
+
+    from app.schema.profile import NULL_TOKENS, parse_numbers
+
+    if limit <= 0 or not table.n_rows:
+        return []
+    wanted = [0]
+    for column, profile in zip(table.columns, profiles):
+        if profile['type'] == 'enum':
+            first_seen = {}
+            for i, value in enumerate(column):
+                if value not in first_seen:
+                    first_seen[value] = i
+            wanted.extend(first_seen.values())
+        if profile['null_ratio']:
+            wanted.append(next((i for i, value in enumerate(column) if value.lower() in NULL_TOKENS), 0))
+        if profile['max_length'] > CELL_CHARS:
+            wanted.append(max(range(table.n_rows), key=lambda i: len(column[i])))
+        if profile['type'] in ('integer', 'decimal'):
+            numbers = parse_numbers(pd.Series(column, dtype=object), profile.get('decimal_separator', '.'))
+            if numbers.notna().any():
+                wanted.extend([int(numbers.idxmin()), int(numbers.idxmax())])
+    step = max(1, table.n_rows // limit)
+    wanted.extend(range(0, table.n_rows, step))
+    wanted.append(table.n_rows - 1)
+
+    # dict.fromkeys keeps the priority order and drops repeats
+    return list(dict.fromkeys(wanted))[:limit]
+
+
+def build_schema_prompt(table, table_structure, column_profiles, budget_tokens=3000, sample_rows=20,
+                        model='gpt-4'):
+    """Build a compact schema prompt that fits ``budget_tokens``.
+
+    Sends headers, attribute-free sample rows and the column profiles
+    instead of the page's table markup. Rows are dropped until the prompt
+    fits; the profiles always go in. Returns ``(prompt, sample_count)``.
+    """
+    profiles = [field['profile'] for field in table_structure['fields']]
+    indexes = representative_rows(table, profiles, sample_rows)
+
+    def render(count):
+        # The most telling rows survive a tight budget, shown in table order
+        rows = [[_clip(value) for value in table.rows(i, i + 1)[0]] for i in sorted(indexes[:count])]
+        return PROMPT_TEMPLATE.format(
+            n_rows=table.n_rows,
+            column_profiles=column_profiles,
+            sample_rows=len(rows),
+            table_html=render_rows([_clip(header) for header in table.headers], rows),
+        )
+
+    # Binary search for the most rows that still fit the budget
+    low, high = 0, len(indexes)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(render(middle), model) <= budget_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return render(low), low
+
+
+def full_prompt_tokens(table_html, model='gpt-4'):
+    # What the old prompt with the whole table HTML would have cost, counted the same
+    # way as the compact prompt so the saving compares like with like
+    return count_tokens(FULL_PROMPT_TEMPLATE.format(table_html=table_html), model)
+
+
+class PromptStats:
+    """Running totals of schema prompt sizes, savings and model latency.
+
+    Both the prompt and the full-table prompt it replaced are counted with
+    ``tokenizer``: tiktoken, or the length estimate when its encoding can't
+    be loaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+        self.latency = 0.0
+        self.last = None
+
+    def record(self, prompt_tokens, full_tokens, latency, sample_rows):
+        entry = {
+            'prompt_tokens': prompt_tokens,
+            'tokenizer': tokenizer_name(),
+            'full_tokens': full_tokens,
+            'tokens_saved': max(0, full_tokens - prompt_tokens),
+            'latency': round(latency, 3),
+            'sample_rows': sample_rows,
+        }
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.tokens_saved += entry['tokens_saved']
+            self.latency += latency
+            self.last = entry
+        return entry
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'tokens_saved': self.tokens_saved,
+                'average_latency': round(self.latency / self.calls, 3) if self.calls else 0.0,
+                'tokenizer': tokenizer_name(),
+                'last': self.last,
+            }
+
+
+def get_prompt_stats(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.setdefault('schema_prompt_stats', PromptStats())
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import re
+import time
+from difflib import SequenceMatcher
+
+from flask import current_app
+
+from app.db import get_connection
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schema_registry (
+    fingerprint TEXT PRIMARY KEY,
+    shape TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    schema TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS schema_registry_shape ON schema_registry (shape);
+"""
+
+
+def normalize_header(header):
+    return re.sub(r'[^a-z0-9]+', ' ', header.lower()).strip()
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value).encode('utf-8')).hexdigest()
+
+
+def table_shape(table_structure):
+    # Column count and type sequence; tables can only near-match within one shape
+    return _digest([field['field_type'] for field in table_structure['fields']])
+
+
+def table_fingerprint(table_structure):
+    return _digest([
+        [normalize_header(field['field_label']), field['field_type']]
+        for field in table_structure['fields']
+    ])
+
+
+def header_similarity(left, right):
+    if len(left) != len(right):
+        return 0.0
+    if not left:
+        return 1.0
+    return sum(SequenceMatcher(None, a, b).ratio() for a, b in zip(left, right)) / len(left)
+
+
+class SchemaRegistry:
+    """Generated schemas keyed by the structural fingerprint of their table.
+
+    The fingerprint covers normalized header names and inferred field types,
+    so pages sharing a layout share one schema. With ``near_match`` above
+    zero, a table whose shape matches but whose headers differ slightly
+    reuses the closest stored schema whose header similarity reaches it.
+    """
+
+    def __init__(self, connect, near_match=0.9):
+        self.connect = connect
+        self.near_match = near_match
+        self._ready = False
+
+    def _db(self):
+        connection = self.connect()
+        if not self._ready:
+            connection.executescript(SCHEMA)
+            self._ready = True
+        return connection
+
+    def lookup(self, table_structure):
+        db = self._db()
+        fingerprint = table_fingerprint(table_structure)
+        row = db.execute(
+            'SELECT schema FROM schema_registry WHERE fingerprint = ?', (fingerprint,)
+        ).fetchone()
+        if row is not None:
+            db.execute('UPDATE schema_registry SET hits = hits + 1 WHERE fingerprint = ?', (fingerprint,))
+            return {'schema': row['schema'], 'match': 'exact', 'similarity': 1.0, 'fingerprint': fingerprint}
+
+        if not self.near_match:
+            return None
+
+        headers = [normalize_header(field['field_label']) for field in table_structure['fields']]
+        best = None
+        for candidate in db.execute(
+            'SELECT fingerprint, headers, schema FROM schema_registry WHERE shape = ?',
+            (table_shape(table_structure),)
+        ):
+            similarity = header_similarity(headers, json.loads(candidate['headers']))
+            if similarity >= self.near_match and (best is None or similarity > best['similarity']):
+                best = {
+                    'schema': candidate['schema'],
+                    'match': 'near',
+                    'similarity': similarity,
+                    'fingerprint': candidate['fingerprint'],
+                }
+        if best:
+            db.execute('UPDATE schema_registry SET hits = hits + 1 WHERE fingerprint = ?', (best['fingerprint'],))
+        return best
+
+    def store(self, table_structure, schema):
+        fingerprint = table_fingerprint(table_structure)
+        headers = [normalize_header(field['field_label']) for field in table_structure['fields']]
+        self._db().execute(
+            'INSERT OR REPLACE INTO schema_registry (fingerprint, shape, headers, schema, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (fingerprint, table_shape(table_structure), json.dumps(headers), schema, time.time())
+        )
+        return fingerprint
+
+
+def get_schema_registry(app=None):
+    app = app or current_app._get_current_object()
+    registry = app.extensions.get('schema_registry')
+    if registry is None:
+        registry = app.extensions.setdefault('schema_registry', SchemaRegistry(
+            lambda: get_connection(app),
+            near_match=app.config.get('SCHEMA_NEAR_MATCH', 0.9),
+        ))
+    return registry
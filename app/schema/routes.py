@@ -1,140 +1,155 @@
-from flask import render_template, request, jsonify, session, redirect, url_for
+from flask import current_app, render_template, request, jsonify, session, redirect, url_for
 from app.schema import schema_bp
-from app.utils import openai, load_dotenv
-import pandas as pd
-from bs4 import BeautifulSoup
+from app.table_store import get_table_store
+from app.schema.structure import build_table_structure, describe_profiles
+from app.schema.prompt import build_schema_prompt, count_tokens, full_prompt_tokens, get_prompt_stats
+from app.scrape.tables import parse_table
+from app.llm import get_llm_gateway
+from app.metrics import span
+from app.llm_cache import cached_client
+from app.schema.registry import get_schema_registry
+from app.scrape.crawl_state import get_crawl_state, table_hash
+from app.scrape.dedupe import get_table_index
+from app.jobs.manager import get_job_manager, job_handler, job_response, job_view, wants_async
 import time
-import lxml
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import json
 
-def generate_schema_from_table(table_html):
+def format_schema_response(schema):
+    # Validate and format JSON
     try:
-        # Parse the table HTML and extract text content
-        soup = BeautifulSoup(table_html, 'lxml')
-        
-        # Debug print to see what we're working with
-        #print(f"Raw table HTML received: {table_html[:500]}")
-        
-        # Extract headers and data from the table
-        headers = []
-        data = []
-        
-        # Try multiple methods to find headers
-        # First try finding th elements
-        header_cells = soup.find_all('th')
-        if header_cells:
-            headers = [th.get_text(strip=True) for th in header_cells]
-        else:
-            # If no th elements, try the first row
-            first_row = soup.find('tr')
-            if first_row:
-                headers = [td.get_text(strip=True) for td in first_row.find_all('td')]
-        
-        # Get data rows
-        rows = soup.find_all('tr')
-        for row in rows[1:]:  # Skip the first row as it's headers
-            cells = row.find_all('td')
-            if cells:
-                row_data = []
-                for cell in cells:
-                    # Get all text content, including from nested elements
-                    text_content = ' '.join(cell.stripped_strings)
-                    row_data.append(text_content)
-                if row_data:
-                    data.append(row_data)
-        
-        print(f"Extracted headers: {headers}")
-        print(f"Sample data rows: {data[:2]}")
-        
-        # Create a structured representation of the table
-        table_structure = {
-            "content_type_name": "table_content",
-            "fields": []
-        }
-        
-        # Create field definitions based on headers and data
-        for i, header in enumerate(headers):
-            field = {
-                "field_name": header.lower().replace(' ', '_'),
-                "field_label": header,
-                "field_type": "string",  # Default type
-                "required": True,
-                "sample_values": [row[i] for row in data[:3] if i < len(row)]
-            }
-            
-            # Try to determine field type from sample data
-            sample_values = field["sample_values"]
-            if sample_values:
-                if all(val.isdigit() for val in sample_values):
-                    field["field_type"] = "integer"
-                elif all(val.replace('.', '').isdigit() for val in sample_values):
-                    field["field_type"] = "decimal"
-                elif all(len(val) > 100 for val in sample_values):
-                    field["field_type"] = "text_long"
-                elif any('<a href' in val.lower() for val in sample_values):
-                    field["field_type"] = "link"
-            
-            table_structure["fields"].append(field)
-        
-        # Convert to JSON for the prompt
-        table_json = json.dumps(table_structure, indent=2)
-        
-        # Clean and escape the HTML table string
-        cleaned_table_html = table_html.replace('\n', ' ').replace('\r', '').strip()
-        
-        prompt = f"""Generate a Drupal 11 content type schema based on this HTML table:
-
-```html
-{cleaned_table_html}
-```
+        parsed_schema = json.loads(schema)
+        return json.dumps(parsed_schema, indent=2)
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {str(e)}")
+        # Try to extract JSON from the response
+        import re
+        json_match = re.search(r'\{.*\}', schema, re.DOTALL)
+        if json_match:
+            return json_match.group()
+        raise ValueError("Response is not valid JSON")
 
-Create a complete Drupal content type configuration that includes:
-1. Machine names for fields (lowercase with underscores)
-2. Appropriate field types (text, long text, integer, decimal, link, etc.)
-3. Required field settings
-4. Field widget settings
-5. Display settings
 
-Return the schema as valid JSON that could be used for content type configuration.
-        Include field descriptions based on the data patterns observed."""
+def generate_schema_from_table(table_html):
+    try:
+        # A table that hasn't changed since its last schema keeps that schema
+        state = get_crawl_state()
+        key = table_hash(table_html) if state else None
+        if state:
+            stored = state.get_result(key, 'schema')
+            if stored is not None:
+                print("Table unchanged since its schema was generated, reusing it")
+                return stored
+            # Near-duplicates of a table (the same grid on another page) share its schema
+            index = get_table_index()
+            canonical = index.canonical(key) if index else None
+            stored = state.get_result(canonical, 'schema') if canonical and canonical != key else None
+            if stored is not None:
+                print(f"Reusing the schema of near-duplicate table {canonical[:12]}")
+                state.put_result(key, 'schema', stored)
+                return stored
+        
+        # Describe the table's fields from a profile of every value
+        with span('schema.profile'):
+            table = parse_table(table_html)
+            table_structure = build_table_structure(table)
+        print(f"Extracted headers: {[field['field_label'] for field in table_structure['fields']]}")
+        
+        # Tables with the same layout reuse the schema generated for the first one
+        registry = get_schema_registry() if current_app.config.get('SCHEMA_REGISTRY_ENABLED', True) else None
+        if registry:
+            match = registry.lookup(table_structure)
+            if match:
+                print(f"Reusing {match['match']} schema match {match['fingerprint'][:12]} ({match['similarity']:.2f})")
+                if state:
+                    state.put_result(key, 'schema', match['schema'])
+                return match['schema']
+        
+        # Headers, representative rows and column profiles instead of the page markup
+        config = current_app.config
+        with span('schema.prompt'):
+            prompt, sample_rows = build_schema_prompt(
+                table, table_structure, describe_profiles(table_structure),
+                budget_tokens=config.get('SCHEMA_PROMPT_TOKENS', 3000),
+                sample_rows=config.get('SCHEMA_SAMPLE_ROWS', 20),
+            )
+            prompt_tokens = count_tokens(prompt)
         
         print(f"Sending prompt to OpenAI: {prompt[:500]}...")
         
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=2000
+        client = cached_client(get_llm_gateway())
+        started = time.monotonic()
+        with span('schema.llm'):
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.5,
+                max_tokens=2000
+            )
+        report = get_prompt_stats().record(
+            prompt_tokens, full_prompt_tokens(table_html), time.monotonic() - started, sample_rows
         )
+        print(f"Schema prompt used {report['prompt_tokens']} tokens ({report['tokens_saved']} saved, "
+              f"{sample_rows} sample rows), model call took {report['latency']:.2f}s")
         
         schema = response.choices[0].message.content
         print(f"Received response from OpenAI: {schema[:200]}...")
         
-        # Validate and format JSON
-        try:
-            parsed_schema = json.loads(schema)
-            return json.dumps(parsed_schema, indent=2)
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
-            # Try to extract JSON from the response
-            import re
-            json_match = re.search(r'\{.*\}', schema, re.DOTALL)
-            if json_match:
-                return json_match.group()
-            raise ValueError("Response is not valid JSON")
+        with span('schema.postprocess'):
+            schema = format_schema_response(schema)
+        if registry:
+            registry.store(table_structure, schema)
+        if state:
+            state.put_result(key, 'schema', schema)
+        return schema
         
     except Exception as e:
         print(f"Error in generate_schema_from_table: {str(e)}")
         return None
 
 
+def pretty_print_schema(schema):
+    # Try to pretty print the JSON if possible
+    try:
+        parsed_schema = json.loads(schema)
+        return json.dumps(parsed_schema, indent=2)
+    except:
+        return schema
+
+
+def render_schema(schema, table_id):
+    session['current_schema'] = True
+    return render_template('schema/schema.html', 
+                         schema=schema, 
+                         table_id=table_id)
+
+
+@job_handler('schema')
+def schema_job(params, progress):
+    table_html = get_table_store().get(params['table_id'])
+    if not table_html:
+        raise ValueError("Unknown or expired table, please scrape the page again")
+    progress(0.1, 'Generating schema')
+    schema = generate_schema_from_table(table_html)
+    if not schema:
+        raise ValueError("Failed to generate schema. Please try again.")
+    return {'schema': pretty_print_schema(schema), 'table_id': params['table_id']}
+
+
+@job_view('schema')
+def schema_job_view(job):
+    if job['error']:
+        return render_template('schema/schema.html', 
+                             error=f"Error generating schema: {job['error']}")
+    return render_schema(job['result']['schema'], job['result']['table_id'])
+
+
+@schema_bp.route('/prompt_stats', methods=['GET'])
+def prompt_stats():
+    return jsonify(get_prompt_stats().snapshot())
+
+
 @schema_bp.route('/generate_schema', methods=['GET', 'POST'])
 def generate_schema():
     # Check if we have a table selected
@@ -143,39 +158,14 @@ def generate_schema():
         
     try:
         if request.method == 'POST':
-            table_html = request.form.get('table_html')
+            table_id = request.form.get('table_id')
+            table_html = get_table_store().get(table_id)
             if not table_html:
-                return jsonify({"error": "No table HTML provided"}), 400
+                return jsonify({"error": "Unknown or expired table, please scrape the page again"}), 400
             
-            # Debug the received HTML
-            print("\n=== RECEIVED HTML ===")
-            print(table_html)
-            print("\n=== END RECEIVED HTML ===")
-            
-            # Clean and escape the HTML table string - use repr() to preserve all characters
-            cleaned_table_html = repr(table_html)[1:-1]  # Remove the outer quotes from repr()
-            
-            prompt = f"""Generate a Drupal 11 content type schema based on this HTML table.
-            Analyze this exact HTML table structure:
-
-            {cleaned_table_html}
-
-            Create a complete Drupal content type configuration that includes:
-            1. Machine names for fields (lowercase with underscores)
-            2. Appropriate field types (text, long text, integer, decimal, link, etc.)
-            3. Required field settings
-            4. Field widget settings
-            5. Display settings
-
-            Return the schema as valid JSON that could be used for content type configuration.
-            Include field descriptions based on the data patterns observed."""
-            
-            # Debug the final prompt
-            print("\n=== FINAL PROMPT ===")
-
-
-            print(prompt)
-            print("\n=== END FINAL PROMPT ===")
+            # Run in the background and hand back a job to follow
+            if wants_async():
+                return job_response(get_job_manager().submit('schema', {'table_id': table_id}))
             
             schema = generate_schema_from_table(table_html)
             if not schema:
@@ -183,19 +173,7 @@ def generate_schema():
                 return render_template('schema/schema.html', 
                                      error="Failed to generate schema. Please try again.")
             
-            # Try to pretty print the JSON if possible
-            try:
-                parsed_schema = json.loads(schema)
-                pretty_schema = json.dumps(parsed_schema, indent=2)
-            except:
-                pretty_schema = schema
-            
-            if schema:
-                session['current_schema'] = True
-                
-            return render_template('schema/schema.html', 
-                                 schema=pretty_schema, 
-                                 table_html=table_html)
+            return render_schema(pretty_print_schema(schema), table_id)
         else:
             # GET request - only allow if we have a table
             return redirect(url_for('scrape.scrape_form'))
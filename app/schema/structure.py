@@ -0,0 +1,75 @@
+import re
+
+from app.scrape.tables import parse_table
+
+
+def field_name_for(header):
+    return re.sub(r'\W+', '_', header.strip().lower()).strip('_') or 'field'
+
+
+# Profiled column types mapped onto Drupal field types
+FIELD_TYPES = {
+    'integer': 'integer',
+    'decimal': 'decimal',
+    'boolean': 'boolean',
+    'date': 'datetime',
+    'datetime': 'datetime',
+    'email': 'email',
+    'link': 'link',
+    'enum': 'list_string',
+    'text_long': 'text_long',
+}
+
+
+def build_table_structure(table):
+    """Describe a table's fields from its headers and a profile of every value.
+
+    ``table`` is table HTML or an already parsed table. Each field records
+    the column it came from so extractors can map fields back onto columns,
+    and keeps its column profile so they can parse the values the same way.
+    """
+    # Profiling needs pandas, which is only loaded once a table is described
+    from app.schema.profile import profile_table
+
+    if isinstance(table, str):
+        table = parse_table(table)
+
+    table_structure = {
+        "content_type_name": "table_content",
+        "fields": []
+    }
+
+    for i, (header, profile) in enumerate(zip(table.headers, profile_table(table))):
+        table_structure["fields"].append({
+            "field_name": field_name_for(header),
+            "field_label": header,
+            "field_type": FIELD_TYPES.get(profile['type'], 'string'),
+            "required": profile['null_ratio'] == 0,
+            "column_index": i,
+            "sample_values": table.columns[i][:3],
+            "profile": profile,
+        })
+
+    return table_structure
+
+
+def describe_profiles(table_structure):
+    # One line per field so the prompt carries what every row showed, not just a sample
+    lines = []
+    for field in table_structure['fields']:
+        profile = field['profile']
+        parts = [
+            f"type {profile['type']} ({profile['confidence']:.0%} of values)",
+            f"{profile['null_ratio']:.0%} empty",
+            f"{profile['distinct']} distinct",
+        ]
+        if 'values' in profile:
+            parts.append('values: ' + ', '.join(profile['values']))
+        if 'format' in profile:
+            parts.append('format: ' + ' or '.join(profile['format']))
+        if profile.get('min') is not None:
+            parts.append(f"range {profile['min']} to {profile['max']}")
+        if 'currency' in profile:
+            parts.append(f"currency {profile['currency']}")
+        lines.append(f"- {field['field_label']} -> {field['field_type']}: " + '; '.join(parts))
+    return '\n'.join(lines)
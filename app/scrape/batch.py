@@ -0,0 +1,392 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from flask import current_app
+from lxml import etree
+
+from app.scrape.crawl_state import (
+    add_to_report, compare_tables, count_changes, empty_report, get_crawl_state, page_hash, table_hash,
+)
+from app.scrape.dedupe import get_table_index
+from app.scrape.fetcher import get_fetcher
+from app.scrape.parallel import TableParser, get_table_parser
+from app.scrape.tables import iter_table_html
+from app.table_store import get_table_store
+
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+# Used when no pooled parser is passed in
+IN_PROCESS_PARSER = TableParser(workers=0)
+
+
+def load_sitemap(source, session=None, depth=0):
+    # Sitemap indexes point at further sitemaps, follow them a few levels deep
+    if source.startswith(('http://', 'https://')):
+        session = session or requests.Session()
+        response = session.get(source, timeout=30)
+        response.raise_for_status()
+        content = response.content
+    else:
+        with open(source, 'rb') as f:
+            content = f.read()
+
+    root = etree.fromstring(content, parser=etree.XMLParser(recover=True, resolve_entities=False))
+    urls = []
+    for loc in root.iter(f'{SITEMAP_NS}loc', 'loc'):
+        location = (loc.text or '').strip()
+        if not location:
+            continue
+        parent = loc.getparent()
+        if parent is not None and parent.tag in (f'{SITEMAP_NS}sitemap', 'sitemap'):
+            if depth < 3:
+                urls.extend(load_sitemap(location, session, depth + 1))
+        else:
+            urls.append(location)
+    return urls
+
+
+def load_url_list(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least ``interval`` seconds."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CrawlJob:
+    """A batch of URLs with resumable state kept in its own directory.
+
+    ``state.json`` tracks every URL's status and is rewritten atomically
+    once ``save_every`` URLs have finished or ``save_interval`` seconds have
+    passed, and when the run ends; URLs in flight only change in memory.
+    ``results.ndjson`` gets one line per finished URL with its extracted
+    tables. After a crash, URLs finished since the last save are crawled
+    again on resume, so their results can appear twice.
+    """
+
+    def __init__(self, job_dir, state, save_every=100, save_interval=2.0):
+        self.job_dir = job_dir
+        self.state = state
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    @property
+    def id(self):
+        return self.state['id']
+
+    @property
+    def state_path(self):
+        return os.path.join(self.job_dir, 'state.json')
+
+    @property
+    def results_path(self):
+        return os.path.join(self.job_dir, 'results.ndjson')
+
+    @classmethod
+    def create(cls, jobs_dir, urls, source=None):
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        state = {
+            'id': job_id,
+            'source': source,
+            'status': 'pending',
+            'created_at': time.time(),
+            'updated_at': time.time(),
+            # dict.fromkeys keeps the order and drops duplicate URLs
+            'urls': {url: {'status': 'pending', 'attempts': 0} for url in dict.fromkeys(urls)},
+        }
+        job = cls(job_dir, state)
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, jobs_dir, job_id):
+        job_dir = os.path.join(jobs_dir, job_id)
+        with open(os.path.join(job_dir, 'state.json')) as f:
+            return cls(job_dir, json.load(f))
+
+    @classmethod
+    def list(cls, jobs_dir):
+        if not os.path.isdir(jobs_dir):
+            return []
+        jobs = []
+        for job_id in os.listdir(jobs_dir):
+            try:
+                jobs.append(cls.load(jobs_dir, job_id))
+            except (OSError, ValueError):
+                continue
+        return sorted(jobs, key=lambda job: job.state['created_at'], reverse=True)
+
+    def save(self, wait=True):
+        # One writer at a time; a batched save that finds one running leaves it to the next
+        if not self._save_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                self.state['updated_at'] = time.time()
+                data = json.dumps(self.state)
+                self._unsaved = 0
+                self._saved_at = time.monotonic()
+            # Workers can keep updating URLs while the file is written
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.state_path)
+        finally:
+            self._save_lock.release()
+
+    def pending_urls(self):
+        # Anything not finished is retried on resume, including URLs that were in flight
+        return [url for url, entry in self.state['urls'].items() if entry['status'] not in ('done', 'failed')]
+
+    def update_url(self, url, **fields):
+        with self._lock:
+            self.state['urls'][url].update(fields)
+            if fields.get('status') not in ('done', 'failed'):
+                return
+            self._unsaved += 1
+            due = self._unsaved >= self.save_every or time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save(wait=False)
+
+    def append_result(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            with open(self.results_path, 'a') as f:
+                f.write(line)
+
+    def add_changes(self, changes):
+        with self._lock:
+            add_to_report(self.state.setdefault('changes', empty_report()), changes)
+
+    def progress(self):
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        with self._lock:
+            for entry in self.state['urls'].values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            total = len(self.state['urls'])
+            status = self.state['status']
+            changes = self.state.get('changes')
+        return {
+            'id': self.id,
+            'status': status,
+            'total': total,
+            'counts': counts,
+            'percent': round(100.0 * (counts['done'] + counts['failed']) / total, 1) if total else 100.0,
+            'source': self.state.get('source'),
+            # How pages and tables compare with their previous crawl
+            'changes': changes,
+            'created_at': self.state['created_at'],
+            'updated_at': self.state['updated_at'],
+        }
+
+
+def _mark_duplicates(tables, matches):
+    # Point tables seen on other pages at their canonical table
+    for table in tables:
+        match = matches.get(table['index'])
+        if match:
+            table['canonical'] = match['canonical']
+            table['duplicate'] = match['match'] if match['page_count'] > 1 else None
+    return tables
+
+
+def _store_tables(store, serialized):
+    # Kept in the table store so a later interactive scrape of a not-modified page can reuse them
+    table_ids = {}
+    for i, table_html in serialized:
+        try:
+            table_ids[i] = store.put(table_html)
+        except Exception as e:
+            print(f"Error storing table {i}: {str(e)}")
+    return table_ids
+
+
+def extract_tables(page_source, parser=None, state=None, index=None, url=None, store=None):
+    # With a crawl state, tables extracted before (here or on another page) come from it
+    serialized = list(iter_table_html(page_source))
+    hashes = {i: table_hash(table_html) for i, table_html in serialized}
+    table_ids = _store_tables(store, serialized) if store else {}
+    matches = {i: index.add(hashes[i], url, table_html) for i, table_html in serialized} if index else {}
+    tables = {}
+    if state:
+        for i, _ in serialized:
+            stored = state.get_result(hashes[i], 'rows')
+            # A copy of a table from another page that only differs in attributes parses the same
+            source = (matches.get(i) or {}).get('same_content')
+            if stored is None and source:
+                stored = state.get_result(source, 'rows')
+                if stored is not None:
+                    state.put_result(hashes[i], 'rows', stored)
+            if stored is not None:
+                tables[i] = stored
+    pending = [table for table in serialized if table[0] not in tables]
+    for entry in (parser or IN_PROCESS_PARSER).parse(pending):
+        i = entry['index']
+        if 'error' in entry:
+            tables[i] = {'error': entry['error']}
+            continue
+        tables[i] = {'columns': entry['table'].headers, 'rows': entry['table'].rows()}
+        if state:
+            state.put_result(hashes[i], 'rows', tables[i])
+    tables = [dict(tables[i], index=i, hash=hashes[i], table_id=table_ids.get(i)) for i, _ in serialized]
+    return _mark_duplicates(tables, matches)
+
+
+def _stored_tables(state, page):
+    # An unchanged page's tables from the crawl state, or None once any have expired
+    tables = []
+    for i, (value, table_id) in enumerate(page['tables']):
+        stored = state.get_result(value, 'rows')
+        if stored is None:
+            return None
+        tables.append(dict(stored, index=i, hash=value, table_id=table_id))
+    return tables
+
+
+def crawl_page(url, fetch, parser=None, state=None, index=None, store=None):
+    """Fetch a page and extract its tables, skipping work a crawl state has seen.
+
+    Returns ``(fetched, tables, changes)``. ``changes`` says how the page
+    and its tables compare with the last crawl, and is ``None`` without a
+    crawl state. With a table ``index``, tables also found on other pages
+    get their ``canonical`` table and the kind of ``duplicate`` they are.
+    With a table ``store``, each table's HTML is kept there under its
+    ``table_id``.
+    """
+    if state is None:
+        fetched = fetch(url)
+        return fetched, extract_tables(fetched['html'], parser, index=index, url=url, store=store), None
+
+    previous = state.page(url)
+    validators = state.validators(url)
+    fetched = fetch(url, validators) if validators else fetch(url)
+    tables = None
+    if fetched.get('not_modified'):
+        tables = _stored_tables(state, previous)
+        if tables is None:
+            fetched = fetch(url)
+        elif index:
+            _mark_duplicates(tables, {table['index']: index.add(table['hash'], url) for table in tables})
+    if tables is None:
+        tables = extract_tables(fetched['html'], parser, state, index, url, store)
+
+    hashes = [table['hash'] for table in tables]
+    statuses, removed = compare_tables([value for value, _ in previous['tables']] if previous else None, hashes)
+    if fetched.get('not_modified'):
+        page_change = 'not_modified'
+        state.mark_checked(url)
+    else:
+        if previous is None:
+            page_change = 'new'
+        else:
+            page_change = 'unchanged' if previous['page_hash'] == page_hash(hashes) else 'changed'
+        state.record_page(url, fetched, [[table['hash'], table['table_id']] for table in tables])
+    for table, status in zip(tables, statuses):
+        table['change'] = status
+    return fetched, tables, {'page': page_change, 'tables': count_changes(statuses, removed)}
+
+
+def run_job(job, fetch, workers=4, max_retries=3, backoff=2.0, rate_limiter=None, parser=None, state=None,
+            index=None, store=None):
+    rate_limiter = rate_limiter or HostRateLimiter()
+    job.state['status'] = 'running'
+    job.save()
+
+    def process(url):
+        # max_retries counts this run's attempts, so a resumed URL gets all of them again;
+        # the stored count keeps the total across runs
+        entry = job.state['urls'][url]
+        attempts = 0
+        while True:
+            attempts += 1
+            job.update_url(url, status='running', attempts=entry.get('attempts', 0) + 1)
+            rate_limiter.wait(url)
+            try:
+                fetched, tables, changes = crawl_page(url, fetch, parser, state, index, store)
+            except Exception as e:
+                if attempts >= max_retries:
+                    print(f"Giving up on {url} after {attempts} attempts: {str(e)}")
+                    job.update_url(url, status='failed', error=str(e), finished_at=time.time())
+                    job.append_result({'url': url, 'error': str(e)})
+                    return
+                # Exponential backoff with jitter so retries don't arrive in lockstep
+                time.sleep(backoff * (2 ** (attempts - 1)) * (0.5 + random.random()))
+                continue
+
+            job.append_result({'url': url, 'tier': fetched.get('tier'), 'tables': tables, 'changes': changes})
+            if changes:
+                job.add_changes(changes)
+            job.update_url(url, status='done', tables=len(tables), changes=changes, error=None, finished_at=time.time())
+            return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(process, job.pending_urls()))
+
+    progress = job.progress()
+    job.state['status'] = 'failed' if progress['counts']['failed'] == progress['total'] else 'done'
+    job.save()
+    return job
+
+
+def get_jobs_dir(app=None):
+    app = app or current_app._get_current_object()
+    return app.config.get('CRAWL_JOBS_DIR') or os.path.join(app.instance_path, 'crawl_jobs')
+
+
+def run_job_for_app(app, job):
+    config = app.config
+    return run_job(
+        job,
+        get_fetcher(app).fetch,
+        workers=config.get('CRAWL_WORKERS', 4),
+        max_retries=config.get('CRAWL_MAX_RETRIES', 3),
+        backoff=config.get('CRAWL_BACKOFF', 2.0),
+        rate_limiter=HostRateLimiter(config.get('CRAWL_HOST_INTERVAL', 1.0)),
+        parser=get_table_parser(app),
+        state=get_crawl_state(app),
+        index=get_table_index(app),
+        store=get_table_store(app),
+    )
+
+
+def start_job(app, job):
+    def target():
+        with app.app_context():
+            try:
+                run_job_for_app(app, job)
+            except Exception as e:
+                print(f"Error running crawl job {job.id}: {str(e)}")
+                job.state['status'] = 'failed'
+                job.save()
+
+    thread = threading.Thread(target=target, name=f"crawl-{job.id}", daemon=True)
+    thread.start()
+    return thread
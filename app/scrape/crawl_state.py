@@ -0,0 +1,209 @@
+import hashlib
+import json
+import time
+import zlib
+
+from flask import current_app
+
+from app.db import get_connection
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    page_hash TEXT NOT NULL,
+    tables TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS crawl_results (
+    table_hash TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (table_hash, stage)
+);
+CREATE INDEX IF NOT EXISTS crawl_results_accessed_at ON crawl_results (accessed_at);
+"""
+
+TABLE_CHANGES = ('new', 'changed', 'unchanged', 'removed')
+PAGE_CHANGES = ('new', 'changed', 'unchanged', 'not_modified')
+
+
+def table_hash(table_html):
+    # Whitespace differences from reformatted markup don't count as a change
+    # (split/join is about three times faster than a regex on big tables)
+    normalized = ' '.join(table_html.split()).replace('> <', '><')
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def page_hash(table_hashes):
+    # Only the tables count, so banners, timestamps and ads don't mark a page changed
+    return hashlib.sha256(json.dumps(table_hashes).encode('utf-8')).hexdigest()
+
+
+def stage_key(stage, *inputs):
+    # Results that depend on more than the table (a schema, settings) are stored per input
+    return f"{stage}:{hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()[:16]}"
+
+
+def compare_tables(previous, current):
+    """Classify a page's tables against the hashes from its last crawl.
+
+    Returns one status per current table plus the number of removed ones.
+    A table whose hash was on the page before is ``unchanged`` even if it
+    moved; otherwise it's ``changed`` when it replaces an unmatched table
+    at the same position and ``new`` when it doesn't. ``previous`` is
+    ``None`` for a page that was never crawled.
+    """
+    if previous is None:
+        return ['new'] * len(current), 0
+
+    positions = {}
+    for i, value in enumerate(previous):
+        positions.setdefault(value, []).append(i)
+    statuses = []
+    matched = set()
+    for value in current:
+        if positions.get(value):
+            matched.add(positions[value].pop(0))
+            statuses.append('unchanged')
+        else:
+            statuses.append(None)
+
+    unmatched = set(range(len(previous))) - matched
+    for i, status in enumerate(statuses):
+        if status is None:
+            statuses[i] = 'changed' if i in unmatched else 'new'
+            unmatched.discard(i)
+    return statuses, len(unmatched)
+
+
+def empty_report():
+    return {
+        'pages': dict.fromkeys(PAGE_CHANGES, 0),
+        'tables': dict.fromkeys(TABLE_CHANGES, 0),
+    }
+
+
+def count_changes(statuses, removed):
+    counts = dict.fromkeys(TABLE_CHANGES, 0)
+    for status in statuses:
+        counts[status] += 1
+    counts['removed'] = removed
+    return counts
+
+
+def add_to_report(report, changes):
+    """Add one page's ``{'page': ..., 'tables': counts}`` to a run's report."""
+    report['pages'][changes['page']] += 1
+    for status, value in changes['tables'].items():
+        report['tables'][status] += value
+    return report
+
+
+def format_report(report):
+    pages = ', '.join(f"{report['pages'][key]} {key.replace('_', ' ')}" for key in PAGE_CHANGES)
+    tables = ', '.join(f"{report['tables'][key]} {key}" for key in TABLE_CHANGES)
+    return f"Pages: {pages}. Tables: {tables}."
+
+
+class CrawlState:
+    """What was found at each URL on its last crawl, and the work done on it.
+
+    Pages keep their HTTP validators (ETag, Last-Modified) for conditional
+    requests, and the normalized hash of every table on them. Results of
+    later stages (parsed rows, schemas, extracted records) are stored by
+    table hash, so an unchanged table, on this page or any other, is never
+    processed twice. Results nobody has read for ``ttl`` seconds are dropped.
+    """
+
+    def __init__(self, connect, ttl=30 * 86400):
+        self.connect = connect
+        self.ttl = ttl
+        self._ready = False
+
+    def _db(self):
+        connection = self.connect()
+        if not self._ready:
+            connection.executescript(SCHEMA)
+            self._ready = True
+        return connection
+
+    def page(self, url):
+        row = self._db().execute('SELECT * FROM crawl_pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        page = dict(row)
+        # [[table_hash, table_id], ...] in page order
+        page['tables'] = json.loads(page['tables'])
+        return page
+
+    def validators(self, url):
+        page = self.page(url)
+        if page is None or not (page['etag'] or page['last_modified']):
+            return None
+        return {'etag': page['etag'], 'last_modified': page['last_modified']}
+
+    def record_page(self, url, fetched, tables):
+        """Store a fetched page's validators and its ``(table_hash, table_id)`` pairs."""
+        now = time.time()
+        self._db().execute(
+            'INSERT OR REPLACE INTO crawl_pages '
+            '(url, etag, last_modified, page_hash, tables, fetched_at, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (url, fetched.get('etag'), fetched.get('last_modified'),
+             page_hash([value for value, _ in tables]), json.dumps(tables), now, now)
+        )
+
+    def mark_checked(self, url):
+        self._db().execute('UPDATE crawl_pages SET checked_at = ? WHERE url = ?', (time.time(), url))
+
+    def get_result(self, table_hash, stage):
+        db = self._db()
+        row = db.execute(
+            'SELECT data FROM crawl_results WHERE table_hash = ? AND stage = ?', (table_hash, stage)
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute(
+            'UPDATE crawl_results SET accessed_at = ? WHERE table_hash = ? AND stage = ?',
+            (time.time(), table_hash, stage)
+        )
+        return json.loads(zlib.decompress(row['data']))
+
+    def put_result(self, table_hash, stage, result):
+        now = time.time()
+        data = zlib.compress(json.dumps(result).encode('utf-8'), 6)
+        db = self._db()
+        db.execute(
+            'INSERT OR REPLACE INTO crawl_results (table_hash, stage, data, created_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (table_hash, stage, data, now, now)
+        )
+        if self.ttl:
+            db.execute('DELETE FROM crawl_results WHERE accessed_at < ?', (now - self.ttl,))
+
+    def stats(self):
+        db = self._db()
+        pages = db.execute('SELECT COUNT(*) FROM crawl_pages').fetchone()[0]
+        results, size = db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM crawl_results'
+        ).fetchone()
+        return {'pages': pages, 'results': results, 'bytes': size}
+
+
+def get_crawl_state(app=None):
+    """The app's crawl state, or ``None`` when CRAWL_STATE_ENABLED is off."""
+    app = app or current_app._get_current_object()
+    if not app.config.get('CRAWL_STATE_ENABLED', True):
+        return None
+    state = app.extensions.get('crawl_state')
+    if state is None:
+        state = app.extensions.setdefault('crawl_state', CrawlState(
+            lambda: get_connection(app),
+            ttl=app.config.get('CRAWL_STATE_TTL', 30 * 86400),
+        ))
+    return state
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+
+from flask import current_app
+
+from app.db import get_connection
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_signatures (
+    table_hash TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    signature BLOB NOT NULL,
+    n_rows INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS table_signatures_canonical ON table_signatures (canonical);
+CREATE INDEX IF NOT EXISTS table_signatures_content_hash ON table_signatures (content_hash);
+CREATE TABLE IF NOT EXISTS table_bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    table_hash TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, table_hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS table_pages (
+    canonical TEXT NOT NULL,
+    url TEXT NOT NULL,
+    table_hash TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (canonical, url, table_hash)
+) WITHOUT ROWID;
+"""
+
+TAG = re.compile(r'<[^>]*>')
+TAG_ATTRIBUTES = re.compile(r'<(/?[a-zA-Z][\w:-]*)([^>]*)>')
+SPAN_ATTRIBUTE = re.compile(r'\b(rowspan|colspan)\s*=\s*["\']?\s*(\d+)', re.IGNORECASE)
+ROW_MARK = '\x00'
+# Permutations are (a * x + b) mod a Mersenne prime, cut to 32 bits; the
+# product wraps around 64 bits, which mixes the shingles further
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# Pages listed per canonical table; a site-wide table can be on thousands
+PAGE_LIMIT = 20
+
+
+def row_shingles(table_html):
+    """The set of a table's rows as text, hashed to 32-bit integers.
+
+    Rows are cut at ``<tr`` in the serialized table, so this needs no
+    parse; tags are dropped and whitespace and case are normalized, so
+    styling and markup changes don't make two tables look different.
+    """
+    marked = table_html.replace('<tr>', ROW_MARK).replace('<tr ', ROW_MARK + '<tr ')
+    rows = set()
+    for row in TAG.sub(' ', marked).split(ROW_MARK)[1:]:
+        text = ' '.join(row.split()).lower()
+        if text:
+            rows.add(zlib.crc32(text.encode('utf-8')))
+    return rows
+
+
+def content_hash(table_html):
+    """Hash of what parsing a table depends on: its text, tags and cell spans.
+
+    Tables that only differ in other attributes (classes, styles, ids,
+    links) parse to the same rows, so they can share parsed results.
+    """
+    def tag(match):
+        spans = ''.join(f' {name.lower()}={value}' for name, value in SPAN_ATTRIBUTE.findall(match.group(2)))
+        return f'<{match.group(1).lower()}{spans}>'
+
+    normalized = ' '.join(TAG_ATTRIBUTES.sub(tag, table_html).split()).replace('> <', '><')
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _permutations(num_perm):
+    import numpy as np
+
+    # Fixed seeds, so signatures stay comparable across runs and processes
+    generator = np.random.RandomState(1)
+    a = generator.randint(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    b = generator.randint(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(shingles, num_perm=128, chunk_size=8192):
+    """MinHash signature of a set of integer shingles, as a uint64 array."""
+    import numpy as np
+
+    a, b = _permutations(num_perm)
+    values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    signature = np.full(num_perm, MAX_HASH, dtype=np.uint64)
+    prime, mask = np.uint64(MERSENNE_PRIME), np.uint64(MAX_HASH)
+    # A few thousand rows at a time keeps the rows x permutations matrix small
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size, None]
+        np.minimum(signature, (((chunk * a + b) % prime) & mask).min(axis=0), out=signature)
+    return signature
+
+
+def similarity(left, right):
+    """Estimated Jaccard similarity of the row sets behind two signatures."""
+    return float((left == right).mean())
+
+
+def lsh_params(threshold, num_perm=128):
+    """Pick ``(bands, rows)`` for the LSH index.
+
+    Two tables with similarity ``s`` share a bucket with probability
+    ``1 - (1 - s**rows)**bands``, which rises steeply around
+    ``(1 / bands) ** (1 / rows)``. This takes the steepest split whose
+    midpoint is still at or below ``threshold``, so tables above it are
+    very likely to meet as candidates; candidates are then checked
+    against the threshold with their full signatures.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if (1.0 / bands) ** (1.0 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+def _buckets(signature, bands, rows):
+    buckets = []
+    for band in range(bands):
+        digest = hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+class TableIndex:
+    """Persistent MinHash/LSH index of every table seen, for near-duplicates.
+
+    Each table's signature is banded into buckets; tables sharing any
+    bucket are candidates, and the closest candidate whose estimated
+    similarity reaches ``threshold`` makes the new table a duplicate of
+    that candidate's canonical table. Tables with the same hash are exact
+    duplicates and never need their signature. The pages each canonical
+    table appeared on are kept with it. Changing ``num_perm`` starts the
+    index over; changing ``threshold`` only rebuilds its buckets.
+    """
+
+    def __init__(self, connect, threshold=0.8, num_perm=128):
+        self.connect = connect
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._ready = False
+        self._lock = threading.Lock()
+        # Matching and inserting a table happen as one step, so two workers
+        # seeing the same new table don't both make it canonical
+        self._add_lock = threading.Lock()
+
+    def _db(self):
+        connection = self.connect()
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    connection.executescript(SCHEMA)
+                    self._check_layout(connection)
+                    self._ready = True
+        return connection
+
+    def _check_layout(self, db):
+        layout = {'num_perm': self.num_perm, 'bands': self.bands, 'rows': self.rows}
+        row = db.execute("SELECT value FROM table_index_meta WHERE key = 'layout'").fetchone()
+        stored = json.loads(row['value']) if row else None
+        if stored == layout:
+            return
+        if stored and stored['num_perm'] != self.num_perm:
+            print(f"Table index signatures have {stored['num_perm']} permutations, not {self.num_perm}; starting over")
+            db.execute('DELETE FROM table_signatures')
+            db.execute('DELETE FROM table_pages')
+        self._rebuild_bands(db)
+        db.execute(
+            "INSERT OR REPLACE INTO table_index_meta (key, value) VALUES ('layout', ?)", (json.dumps(layout),)
+        )
+
+    def _rebuild_bands(self, db):
+        import numpy as np
+
+        db.execute('BEGIN')
+        try:
+            db.execute('DELETE FROM table_bands')
+            for row in db.execute('SELECT table_hash, signature FROM table_signatures').fetchall():
+                signature = np.frombuffer(row['signature'], dtype=np.uint64)
+                db.executemany(
+                    'INSERT OR IGNORE INTO table_bands (band, bucket, table_hash) VALUES (?, ?, ?)',
+                    [(band, bucket, row['table_hash']) for band, bucket in _buckets(signature, self.bands, self.rows)]
+                )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def candidates(self, signature):
+        """Tables sharing at least one bucket with ``signature``."""
+        buckets = _buckets(signature, self.bands, self.rows)
+        placeholders = ', '.join('(?, ?)' for _ in buckets)
+        # CROSS JOIN keeps the buckets as the outer loop, so each one is a
+        # primary key lookup instead of a scan of every band
+        return self._db().execute(
+            f'WITH wanted (band, bucket) AS (VALUES {placeholders}) '
+            'SELECT s.table_hash, s.canonical, s.signature FROM table_signatures s WHERE s.table_hash IN ('
+            'SELECT b.table_hash FROM wanted CROSS JOIN table_bands b '
+            'ON b.band = wanted.band AND b.bucket = wanted.bucket)',
+            [value for bucket in buckets for value in bucket]
+        ).fetchall()
+
+    def query(self, signature):
+        """Return ``(table_hash, canonical, similarity)`` for the closest match, or ``None``."""
+        import numpy as np
+
+        best = None
+        for candidate in self.candidates(signature):
+            score = similarity(signature, np.frombuffer(candidate['signature'], dtype=np.uint64))
+            if score >= self.threshold and (best is None or score > best[2]):
+                best = (candidate['table_hash'], candidate['canonical'], score)
+        return best
+
+    def add(self, table_hash, url, table_html=None):
+        """Index a table found at ``url`` and return how it matched.
+
+        Returns ``{'canonical', 'match', 'similarity', 'same_content',
+        'pages', 'page_count'}``. ``match`` is ``'near'`` for a
+        near-duplicate of an earlier table, ``'exact'`` for a table also
+        found on other pages, and ``None`` for a table seen nowhere else.
+        ``same_content`` is an earlier table that parses to the same rows
+        (see ``content_hash``), or ``None``. ``pages`` lists the first
+        ``PAGE_LIMIT`` pages the canonical table or one of its duplicates
+        appeared on. ``table_html`` is only needed for tables not indexed
+        yet; without it, or when the table has no rows, nothing is indexed
+        and ``None`` comes back.
+        """
+        db = self._db()
+        known = self._known(db, table_hash)
+        if known is None:
+            if table_html is None:
+                return None
+            shingles = row_shingles(table_html)
+            if not shingles:
+                return None
+            signature = minhash(shingles, self.num_perm)
+            content = content_hash(table_html)
+            with self._add_lock:
+                # IMMEDIATE takes the write lock first, so other processes wait here too
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    known = self._known(db, table_hash)
+                    if known is None:
+                        found = self.query(signature)
+                        canonical, score = (found[1], found[2]) if found else (table_hash, 1.0)
+                        db.execute(
+                            'INSERT INTO table_signatures (table_hash, canonical, similarity, signature, n_rows, '
+                            'created_at, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (table_hash, canonical, score, signature.tobytes(), len(shingles), time.time(), content)
+                        )
+                        db.executemany(
+                            'INSERT OR IGNORE INTO table_bands (band, bucket, table_hash) VALUES (?, ?, ?)',
+                            [(band, bucket, table_hash)
+                             for band, bucket in _buckets(signature, self.bands, self.rows)]
+                        )
+                        known = self._known(db, table_hash)
+                    db.execute('COMMIT')
+                except Exception:
+                    db.execute('ROLLBACK')
+                    raise
+        canonical, score = known['canonical'], known['similarity']
+
+        db.execute(
+            'INSERT OR REPLACE INTO table_pages (canonical, url, table_hash, seen_at) VALUES (?, ?, ?, ?)',
+            (canonical, url, table_hash, time.time())
+        )
+        if canonical != table_hash:
+            match = 'near'
+        elif db.execute(
+            'SELECT 1 FROM table_pages WHERE canonical = ? AND table_hash = ? AND url != ? LIMIT 1',
+            (canonical, table_hash, url)
+        ).fetchone():
+            match = 'exact'
+        else:
+            match = None
+        return {
+            'canonical': canonical,
+            'match': match,
+            'similarity': score,
+            'same_content': self._same_content(db, table_hash, known['content_hash']),
+            'pages': self.pages(canonical, PAGE_LIMIT),
+            'page_count': self.page_count(canonical),
+        }
+
+    def _known(self, db, table_hash):
+        return db.execute(
+            'SELECT canonical, similarity, content_hash FROM table_signatures WHERE table_hash = ?', (table_hash,)
+        ).fetchone()
+
+    def _same_content(self, db, table_hash, content):
+        if content is None:
+            return None
+        row = db.execute(
+            'SELECT table_hash FROM table_signatures WHERE content_hash = ? AND table_hash != ? '
+            'ORDER BY created_at LIMIT 1', (content, table_hash)
+        ).fetchone()
+        return row['table_hash'] if row else None
+
+    def canonical(self, table_hash):
+        row = self._db().execute(
+            'SELECT canonical FROM table_signatures WHERE table_hash = ?', (table_hash,)
+        ).fetchone()
+        return row['canonical'] if row else None
+
+    def pages(self, canonical, limit=-1):
+        return [row['url'] for row in self._db().execute(
+            'SELECT DISTINCT url FROM table_pages WHERE canonical = ? ORDER BY url LIMIT ?', (canonical, limit)
+        )]
+
+    def page_count(self, canonical):
+        return self._db().execute(
+            'SELECT COUNT(DISTINCT url) FROM table_pages WHERE canonical = ?', (canonical,)
+        ).fetchone()[0]
+
+    def groups(self, limit=50):
+        """Canonical tables seen on more than one page, most widespread first."""
+        rows = self._db().execute(
+            'SELECT canonical, COUNT(DISTINCT url) AS pages, COUNT(DISTINCT table_hash) AS tables '
+            'FROM table_pages GROUP BY canonical HAVING pages > 1 ORDER BY pages DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [
+            {
+                'canonical': row['canonical'],
+                'tables': row['tables'],
+                'page_count': row['pages'],
+                'pages': self.pages(row['canonical'], PAGE_LIMIT),
+            }
+            for row in rows
+        ]
+
+    def stats(self):
+        db = self._db()
+        tables, canonical = db.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT canonical) FROM table_signatures'
+        ).fetchone()
+        return {
+            'tables': tables,
+            'canonical': canonical,
+            'threshold': self.threshold,
+            'bands': self.bands,
+            'rows': self.rows,
+        }
+
+
+def get_table_index(app=None):
+    """The app's duplicate table index, or ``None`` when DEDUPE_ENABLED is off."""
+    app = app or current_app._get_current_object()
+    if not app.config.get('DEDUPE_ENABLED', True):
+        return None
+    index = app.extensions.get('table_index')
+    if index is None:
+        index = app.extensions.setdefault('table_index', TableIndex(
+            lambda: get_connection(app),
+            threshold=app.config.get('DEDUPE_THRESHOLD', 0.8),
+            num_perm=app.config.get('DEDUPE_NUM_PERM', 128),
+        ))
+    return index
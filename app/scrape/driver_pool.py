@@ -0,0 +1,254 @@
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+from app.metrics import span
+
+
+class DriverPoolTimeout(Exception):
+    pass
+
+
+def get_driver(page_load_timeout=30):
+    # Imported here so the pool module stays cheap to import
+    import undetected_chromedriver as uc
+
+    try:
+        options = uc.ChromeOptions()
+
+        # Add additional arguments to better mimic a real browser
+        options.add_argument('--disable-blink-features=AutomationControlled')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-infobars')
+        options.add_argument('--disable-popup-blocking')
+        options.add_argument('--start-maximized')
+
+        # Add random user agent
+        options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
+
+        # Keep the necessary arguments
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--headless=new')
+
+        # Initialize the driver with additional configurations
+        driver = uc.Chrome(
+            options=options,
+            version_main=131,
+            use_subprocess=True,  # This can help with detection evasion
+            delay=2  # Add a small delay to seem more human-like
+        )
+
+        # Set page load timeout
+        driver.set_page_load_timeout(page_load_timeout)
+
+        # Add additional properties to make detection harder
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+        return driver
+    except Exception as e:
+        print(f"Error creating driver: {str(e)}")
+        raise
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+
+class DriverPool:
+    """Bounded pool of warm Chrome drivers.
+
+    At most ``size`` drivers exist at once. Drivers are reset between
+    checkouts and restarted after ``max_uses`` pages, after ``max_age``
+    seconds, or whenever they fail a health check.
+    """
+
+    def __init__(self, factory, size=2, max_uses=25, max_age=1800, checkout_timeout=60):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.checkout_timeout = checkout_timeout
+
+        # LIFO so the most recently used (warmest) driver is handed out first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'crashed': 0,
+            'checkouts': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _create(self):
+        with span('browser.start'):
+            pooled = PooledDriver(self.factory())
+        self._count('created')
+        return pooled
+
+    def _is_healthy(self, pooled):
+        try:
+            pooled.driver.execute_script("return 1")
+            return bool(pooled.driver.window_handles)
+        except Exception:
+            return False
+
+    def _is_expired(self, pooled):
+        if self.max_uses and pooled.uses >= self.max_uses:
+            return True
+        return bool(self.max_age) and time.monotonic() - pooled.created_at >= self.max_age
+
+    def _reset(self, pooled):
+        # Storage must be cleared while still on the scraped origin
+        driver = pooled.driver
+        driver.execute_script(
+            "try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}"
+        )
+        driver.delete_all_cookies()
+        driver.get('about:blank')
+
+    def _discard(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            print(f"Error quitting driver: {str(e)}")
+
+    def checkout(self):
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise DriverPoolTimeout(
+                f"No browser became available within {self.checkout_timeout}s"
+            )
+        self._count('wait_seconds', time.monotonic() - started)
+        self._count('checkouts')
+
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self._is_healthy(pooled):
+                    self._count('reused')
+                    return pooled
+                self._count('crashed')
+                self._discard(pooled)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, pooled, broken=False):
+        try:
+            pooled.uses += 1
+            if broken or not self._is_healthy(pooled):
+                self._count('crashed')
+                self._discard(pooled)
+            elif self._closed or self._is_expired(pooled):
+                self._count('recycled')
+                self._discard(pooled)
+            else:
+                try:
+                    self._reset(pooled)
+                    self._idle.put(pooled)
+                except Exception as e:
+                    print(f"Error resetting driver, discarding it: {str(e)}")
+                    self._count('crashed')
+                    self._discard(pooled)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def driver(self):
+        # Includes waiting for a free driver and starting Chrome if the pool is cold
+        with span('browser.checkout'):
+            pooled = self.checkout()
+        broken = False
+        try:
+            yield pooled.driver
+        except Exception:
+            # A failed page is fine, a dead browser is not
+            broken = not self._is_healthy(pooled)
+            raise
+        finally:
+            self.checkin(pooled, broken=broken)
+
+    def warm(self, count):
+        # Start drivers ahead of the first request. All are checked out before
+        # any goes back, otherwise the LIFO queue hands out the same one each time.
+        warmed = []
+        try:
+            for _ in range(min(count, self.size)):
+                warmed.append(self.checkout())
+        finally:
+            for pooled in warmed:
+                self.checkin(pooled)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+
+def get_driver_pool(app=None):
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('driver_pool')
+    if pool is not None:
+        return pool
+
+    with _pool_lock:
+        pool = app.extensions.get('driver_pool')
+        if pool is None:
+            config = app.config
+            page_load_timeout = config.get('DRIVER_PAGE_LOAD_TIMEOUT', 30)
+            pool = DriverPool(
+                lambda: get_driver(page_load_timeout),
+                size=config.get('DRIVER_POOL_SIZE', 2),
+                max_uses=config.get('DRIVER_MAX_USES', 25),
+                max_age=config.get('DRIVER_MAX_AGE', 1800),
+                checkout_timeout=config.get('DRIVER_CHECKOUT_TIMEOUT', 60),
+            )
+            app.extensions['driver_pool'] = pool
+            atexit.register(pool.close)
+
+            prewarm = config.get('DRIVER_POOL_PREWARM', 0)
+            if prewarm:
+                threading.Thread(target=_prewarm, args=(pool, prewarm), daemon=True).start()
+    return pool
+
+
+def _prewarm(pool, count):
+    try:
+        pool.warm(count)
+    except Exception as e:
+        print(f"Error warming driver pool: {str(e)}")
+
+
+_pool_lock = threading.Lock()
@@ -0,0 +1,281 @@
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+from app.metrics import count, span
+from app.scrape.driver_pool import get_driver_pool
+from app.scrape.readiness import wait_until_ready
+from app.scrape.tables import iter_tables
+
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
+
+# Markers of pages that only render real content after running JavaScript
+CHALLENGE_PATTERNS = re.compile(
+    rb'just a moment\.\.\.|cf-browser-verification|cf-challenge|challenge-platform'
+    rb'|attention required! \| cloudflare|please enable (?:javascript|js)'
+    rb'|enable javascript (?:and cookies )?to continue|_incapsula_resource|px-captcha',
+    re.IGNORECASE
+)
+
+
+def has_table(content):
+    # Cheap byte scan first, then confirm by parsing up to the first table
+    if b'<table' not in content.lower():
+        return False
+    return next(iter_tables(content), None) is not None
+
+
+def looks_like_challenge(response, tables):
+    if not CHALLENGE_PATTERNS.search(response.content[:20000]):
+        return False
+    if response.status_code in (403, 429, 503):
+        return True
+    # "Please enable JavaScript" is also a common <noscript> notice on pages that work fine
+    return not tables and len(response.content) < 50000
+
+
+class BrowserDomains:
+    """Persisted set of domains whose tables only appear in a real browser."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._domains = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._domains = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading browser domains: {str(e)}")
+
+    def __contains__(self, domain):
+        with self._lock:
+            return domain in self._domains
+
+    def add(self, domain, reason):
+        with self._lock:
+            if domain in self._domains:
+                return
+            self._domains[domain] = {'reason': reason, 'learned_at': time.time()}
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._domains, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving browser domains: {str(e)}")
+
+
+class TieredFetcher:
+    """Fetch pages over plain HTTP, escalating to Chrome only when needed.
+
+    A page goes to the browser tier when the HTTP response has no <table>,
+    looks like a JavaScript challenge, fails outright, or when its domain
+    has been learned to need a browser.
+    """
+
+    def __init__(self, browser_fetch, browser_domains=None, http_enabled=True,
+                 timeout=15, pool_size=10, user_agent=DEFAULT_USER_AGENT):
+        self.browser_fetch = browser_fetch
+        self.browser_domains = browser_domains if browser_domains is not None else BrowserDomains()
+        self.http_enabled = http_enabled
+        self.timeout = timeout
+        self.user_agent = user_agent
+
+        # One adapter shared by every thread's session so connections are pooled across requests
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {
+            tier: {'hits': 0, 'attempts': 0, 'seconds': 0.0, 'bytes': 0}
+            for tier in ('http', 'browser')
+        }
+        self.escalations = {}
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            session.headers.update({
+                'User-Agent': self.user_agent,
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9',
+            })
+            self._local.session = session
+        return session
+
+    def _record(self, tier, seconds, size, hit):
+        with self._lock:
+            stats = self.stats[tier]
+            stats['attempts'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += size
+            if hit:
+                stats['hits'] += 1
+
+    def _escalate(self, reason):
+        with self._lock:
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+
+    def fetch_http(self, url, validators=None):
+        # ETag/Last-Modified from the last crawl let the server answer 304 Not Modified
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        started = time.monotonic()
+        with span('fetch.http'):
+            response = self._session().get(url, timeout=self.timeout, headers=headers)
+        elapsed = time.monotonic() - started
+        count('bytes_fetched', len(response.content), tier='http')
+        page = {
+            'tier': 'http',
+            'url': response.url,
+            'status': response.status_code,
+            'elapsed': elapsed,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+        if response.status_code == 304 and headers:
+            self._record('http', elapsed, len(response.content), True)
+            count('pages_not_modified')
+            # Servers may leave the validators out of a 304, the ones sent still hold
+            return dict(
+                page, html=None, not_modified=True,
+                etag=page['etag'] or validators.get('etag'),
+                last_modified=page['last_modified'] or validators.get('last_modified'),
+            ), None
+        tables = has_table(response.content)
+        if looks_like_challenge(response, tables):
+            self._record('http', elapsed, len(response.content), False)
+            # Tables behind a challenge status don't prove the domain needs a browser
+            return None, 'challenge_with_tables' if tables else 'challenge'
+        if not response.ok:
+            self._record('http', elapsed, len(response.content), False)
+            response.raise_for_status()
+        if not tables:
+            self._record('http', elapsed, len(response.content), False)
+            return None, 'no_tables'
+
+        self._record('http', elapsed, len(response.content), True)
+        return dict(page, html=response.text), None
+
+    def fetch(self, url, validators=None):
+        """Fetch a page; with ``validators`` an unchanged page comes back as
+        ``{'not_modified': True, 'html': None, ...}`` instead of its content."""
+        domain = urlparse(url).netloc
+        reason = None
+
+        if not self.http_enabled:
+            reason = 'http_disabled'
+        elif domain in self.browser_domains:
+            reason = 'learned_domain'
+        else:
+            try:
+                result, reason = self.fetch_http(url, validators)
+                if result:
+                    return result
+            except requests.RequestException as e:
+                print(f"HTTP fetch failed for {url}, falling back to browser: {str(e)}")
+                reason = 'http_error'
+        self._escalate(reason)
+
+        started = time.monotonic()
+        with span('fetch.browser'):
+            page_source = self.browser_fetch(url)
+        elapsed = time.monotonic() - started
+        count('bytes_fetched', len(page_source), tier='browser')
+        found_tables = has_table(page_source.encode('utf-8'))
+        self._record('browser', elapsed, len(page_source), found_tables)
+
+        # Only remember domains where the browser actually made a difference
+        if reason in ('challenge', 'no_tables') and found_tables:
+            self.browser_domains.add(domain, reason)
+
+        return {
+            'html': page_source,
+            'tier': 'browser',
+            'url': url,
+            'status': None,
+            'elapsed': elapsed,
+            'etag': None,
+            'last_modified': None,
+            'escalation': reason,
+        }
+
+    def snapshot(self):
+        with self._lock:
+            tiers = {tier: dict(stats) for tier, stats in self.stats.items()}
+            escalations = dict(self.escalations)
+        for stats in tiers.values():
+            stats['avg_seconds'] = stats['seconds'] / stats['attempts'] if stats['attempts'] else 0.0
+        return {'tiers': tiers, 'escalations': escalations}
+
+
+# Outer HTML of the page's top-level tables, nested tables stay inside theirs
+TABLES_SCRIPT = """
+return Array.from(document.querySelectorAll('table'))
+    .filter(table => !table.parentElement || !table.parentElement.closest('table'))
+    .map(table => table.outerHTML);
+"""
+
+
+def browser_fetch(url, tables_only=False):
+    with get_driver_pool().driver() as driver:
+        with span('browser.load'):
+            driver.get(url)
+
+        # Wait until the page has settled instead of sleeping a fixed time
+        with span('browser.settle'):
+            wait_until_ready(driver, url)
+
+        # Get page source after JavaScript execution
+        if tables_only:
+            # Skip sending the rest of the page over the driver connection
+            return '<html><body>' + ''.join(driver.execute_script(TABLES_SCRIPT)) + '</body></html>'
+        return driver.execute_script("return document.documentElement.outerHTML")
+
+
+def get_fetcher(app=None):
+    app = app or current_app._get_current_object()
+    fetcher = app.extensions.get('fetcher')
+    if fetcher is None:
+        config = app.config
+        path = config.get('FETCH_BROWSER_DOMAINS_PATH') or os.path.join(
+            app.instance_path, 'browser_domains.json'
+        )
+
+        tables_only = config.get('FETCH_BROWSER_TABLES_ONLY', False)
+
+        def fetch_in_app(url):
+            # Browser fetches may run on worker threads without an app context
+            with app.app_context():
+                return browser_fetch(url, tables_only=tables_only)
+
+        fetcher = app.extensions.setdefault('fetcher', TieredFetcher(
+            fetch_in_app,
+            browser_domains=BrowserDomains(path),
+            http_enabled=config.get('FETCH_HTTP_ENABLED', True),
+            timeout=config.get('FETCH_HTTP_TIMEOUT', 15),
+            pool_size=config.get('FETCH_HTTP_POOL_SIZE', 10),
+        ))
+    return fetcher
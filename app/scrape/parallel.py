@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+from app.scrape.tables import parse_table, summarize_table
+
+
+def parse_one(job):
+    """Parse one ``(index, table_html, sample_rows)`` job, in a worker or in-process.
+
+    Returns ``{'index', 'summary'}`` with ``sample_rows``, otherwise
+    ``{'index', 'table'}`` with the full columnar ``ParsedTable``. A table
+    that fails comes back as ``{'index', 'error'}`` instead of failing the page.
+    """
+    index, table_html, sample_rows = job
+    try:
+        if sample_rows is None:
+            return {'index': index, 'table': parse_table(table_html)}
+        return {'index': index, 'summary': summarize_table(table_html, sample_rows)}
+    except Exception as e:
+        return {'index': index, 'error': f"{type(e).__name__}: {str(e)}"}
+
+
+class TableParser:
+    """Parses a page's tables, in worker processes when the page is big enough.
+
+    Pages with fewer than ``min_tables`` tables or less than ``min_bytes``
+    of table markup are parsed in-process, where sending the HTML to a
+    worker would cost more than it saves. Results come back in the order
+    the tables were given. The pool is started on first use with the
+    ``spawn`` method, since forking a process that runs request and job
+    threads isn't safe.
+    """
+
+    def __init__(self, workers=None, min_bytes=2 * 1024 * 1024, min_tables=2):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.min_bytes = min_bytes
+        self.min_tables = min_tables
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {'in_process': 0, 'pooled': 0, 'failures': 0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def use_pool(self, tables):
+        return (
+            self.workers > 1
+            and len(tables) >= self.min_tables
+            and sum(len(table_html) for _, table_html in tables) >= self.min_bytes
+        )
+
+    def parse(self, tables, sample_rows=None):
+        """Parse ``(index, table_html)`` pairs; see ``parse_one`` for the results."""
+        jobs = [(index, table_html, sample_rows) for index, table_html in tables]
+        if not self.use_pool(tables):
+            self.stats['in_process'] += 1
+            return [parse_one(job) for job in jobs]
+
+        self.stats['pooled'] += 1
+        # A few chunks per worker keeps one huge table from holding up the rest
+        chunksize = max(1, len(jobs) // (self.workers * 4))
+        try:
+            return list(self._pool().map(parse_one, jobs, chunksize=chunksize))
+        except BrokenProcessPool as e:
+            # A worker died (out of memory, killed); start a new pool next time
+            print(f"Table parser pool failed, parsing in-process: {str(e)}")
+            self.stats['failures'] += 1
+            self.close()
+            return [parse_one(job) for job in jobs]
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def get_table_parser(app=None):
+    app = app or current_app._get_current_object()
+    parser = app.extensions.get('table_parser')
+    if parser is None:
+        config = app.config
+        parser = app.extensions.setdefault('table_parser', TableParser(
+            workers=config.get('TABLE_PARSE_WORKERS'),
+            min_bytes=config.get('TABLE_PARSE_POOL_MIN_BYTES', 2 * 1024 * 1024),
+            min_tables=config.get('TABLE_PARSE_POOL_MIN_TABLES', 2),
+        ))
+    return parser
@@ -0,0 +1,278 @@
+import atexit
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from flask import current_app
+
+
+# Resolves once the DOM has seen no mutations for `quietMs`, or gives up after `maxMs`
+DOM_QUIET_SCRIPT = """
+const quietMs = arguments[0], maxMs = arguments[1], done = arguments[arguments.length - 1];
+const start = performance.now();
+let last = start;
+const observer = new MutationObserver(() => { last = performance.now(); });
+observer.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true, characterData: true
+});
+(function check() {
+    const now = performance.now();
+    if (document.readyState !== 'loading' && now - last >= quietMs) {
+        observer.disconnect();
+        done(true);
+    } else if (now - start >= maxMs) {
+        observer.disconnect();
+        done(false);
+    } else {
+        setTimeout(check, 50);
+    }
+})();
+"""
+
+CHALLENGE_SCRIPT = """
+const title = (document.title || '').toLowerCase();
+return title.includes('just a moment') || title.includes('attention required')
+    || !!document.querySelector('#challenge-form, #cf-challenge-running, .cf-browser-verification');
+"""
+
+POLL_INTERVAL = 0.1
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
+
+
+def _poll(driver, predicate, deadline):
+    while True:
+        if predicate(driver):
+            return True
+        if _remaining(deadline) <= 0:
+            return False
+        time.sleep(min(POLL_INTERVAL, _remaining(deadline)))
+
+
+class BodyReady:
+    name = 'body'
+
+    def wait(self, driver, deadline):
+        return _poll(
+            driver,
+            lambda d: d.execute_script(
+                "return document.readyState !== 'loading' && !!document.body"
+            ),
+            deadline
+        )
+
+
+class ChallengeCleared:
+    # Anti-bot interstitials (e.g. Cloudflare) replace themselves once passed
+    name = 'challenge'
+
+    def wait(self, driver, deadline):
+        return _poll(driver, lambda d: not d.execute_script(CHALLENGE_SCRIPT), deadline)
+
+
+class DomQuiet:
+    name = 'dom_quiet'
+
+    def __init__(self, quiet_ms=300):
+        self.quiet_ms = quiet_ms
+
+    def wait(self, driver, deadline):
+        max_ms = int(_remaining(deadline) * 1000)
+        if max_ms <= 0:
+            return False
+        # Pooled drivers are shared, so the next user gets the timeout it had before
+        previous = driver.timeouts.script
+        driver.set_script_timeout(max_ms / 1000 + 5)
+        try:
+            return bool(driver.execute_async_script(DOM_QUIET_SCRIPT, self.quiet_ms, max_ms))
+        finally:
+            driver.set_script_timeout(previous)
+
+
+class TableCount:
+    name = 'tables'
+
+    def __init__(self, min_tables=1):
+        self.min_tables = min_tables
+
+    def wait(self, driver, deadline):
+        return _poll(
+            driver,
+            lambda d: d.execute_script(
+                "return document.getElementsByTagName('table').length"
+            ) >= self.min_tables,
+            deadline
+        )
+
+
+class NetworkIdle:
+    # Idle once no new resource entries have appeared for the quiet window
+    name = 'network_idle'
+
+    def __init__(self, quiet_ms=500):
+        self.quiet_ms = quiet_ms
+
+    def wait(self, driver, deadline):
+        count = None
+        changed_at = time.monotonic()
+
+        def idle(d):
+            nonlocal count, changed_at
+            current = d.execute_script(
+                "return [document.readyState, performance.getEntriesByType('resource').length]"
+            )
+            if current != count:
+                count = current
+                changed_at = time.monotonic()
+                return False
+            return current[0] == 'complete' and time.monotonic() - changed_at >= self.quiet_ms / 1000
+
+        return _poll(driver, idle, deadline)
+
+
+class DomainProfiles:
+    """Remembers how long each domain took to settle, persisted as JSON.
+
+    A new domain is saved right away; updates to known domains are written
+    at most every ``save_interval`` seconds, and by ``flush`` at exit.
+    """
+
+    def __init__(self, path=None, alpha=0.3, save_interval=30.0):
+        self.path = path
+        self.alpha = alpha
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading readiness profiles: {str(e)}")
+
+    def get(self, domain):
+        with self._lock:
+            return self._profiles.get(domain)
+
+    def record(self, domain, seconds, settled):
+        with self._lock:
+            profile = self._profiles.get(domain)
+            is_new = profile is None
+            if is_new:
+                profile = {'settle_seconds': seconds, 'samples': 0, 'timeouts': 0}
+            else:
+                # Exponentially weighted so one slow page doesn't dominate
+                profile['settle_seconds'] += self.alpha * (seconds - profile['settle_seconds'])
+            profile['samples'] += 1
+            if not settled:
+                profile['timeouts'] += 1
+            self._profiles[domain] = profile
+            self._dirty = True
+            if is_new or time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._profiles, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving readiness profiles: {str(e)}")
+
+
+def build_strategies(names, config):
+    strategies = []
+    for name in names:
+        name = name.strip()
+        if name == 'body':
+            strategies.append(BodyReady())
+        elif name == 'challenge':
+            strategies.append(ChallengeCleared())
+        elif name == 'dom_quiet':
+            strategies.append(DomQuiet(config.get('SCRAPE_QUIET_MS', 300)))
+        elif name == 'tables':
+            strategies.append(TableCount(config.get('SCRAPE_MIN_TABLES', 1)))
+        elif name == 'network_idle':
+            strategies.append(NetworkIdle(config.get('SCRAPE_QUIET_MS', 300)))
+        elif name:
+            raise ValueError(f"Unknown readiness strategy: {name}")
+    return strategies
+
+
+def get_domain_profiles(app=None):
+    app = app or current_app._get_current_object()
+    profiles = app.extensions.get('readiness_profiles')
+    if profiles is None:
+        path = app.config.get('SCRAPE_PROFILE_PATH') or os.path.join(
+            app.instance_path, 'readiness_profiles.json'
+        )
+        profiles = app.extensions.setdefault('readiness_profiles', DomainProfiles(
+            path, save_interval=app.config.get('SCRAPE_PROFILE_SAVE_INTERVAL', 30.0)
+        ))
+        atexit.register(profiles.flush)
+    return profiles
+
+
+def _has_tables(driver):
+    try:
+        return driver.execute_script("return document.getElementsByTagName('table').length") > 0
+    except Exception:
+        return False
+
+
+def wait_until_ready(driver, url, config=None, profiles=None):
+    """Run the configured readiness strategies against a loaded page.
+
+    Every strategy shares one deadline. Domains with a learned profile get a
+    deadline sized to what they needed before, so pages that never go fully
+    quiet stop early; if that deadline passes before any table has rendered
+    the wait is extended up to the hard timeout so slow SPAs are still
+    captured. Returns a dict with the elapsed time and whether the page
+    settled.
+    """
+    config = config if config is not None else current_app.config
+    profiles = profiles if profiles is not None else get_domain_profiles()
+
+    domain = urlparse(url).netloc
+    hard_timeout = config.get('SCRAPE_READY_TIMEOUT', 30)
+    timeout = hard_timeout
+    profile = profiles.get(domain) if profiles else None
+    if profile:
+        timeout = min(hard_timeout, max(2.0, profile['settle_seconds'] * 3))
+
+    names = config.get('SCRAPE_READINESS', 'body,challenge,dom_quiet').split(',')
+    started = time.monotonic()
+    deadline = started + timeout
+    settled = True
+    for strategy in build_strategies(names, config):
+        ready = strategy.wait(driver, deadline)
+        if not ready and timeout < hard_timeout and not _has_tables(driver):
+            deadline = started + hard_timeout
+            timeout = hard_timeout
+            ready = strategy.wait(driver, deadline)
+        if not ready:
+            print(f"Readiness strategy '{strategy.name}' timed out for {url}")
+            settled = False
+            break
+
+    elapsed = time.monotonic() - started
+    if profiles:
+        profiles.record(domain, elapsed, settled)
+    return {'elapsed': elapsed, 'settled': settled, 'timeout': timeout}
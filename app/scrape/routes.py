@@ -1,17 +1,14 @@
-from flask import render_template, request, jsonify, session, redirect, url_for
+from flask import Response, current_app, render_template, request, jsonify, session
 from app.scrape import scrape_bp
-import pandas as pd
-from bs4 import BeautifulSoup
-import time
-import lxml
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import openai
-import json
-import os
-from dotenv import load_dotenv
+from app.metrics import count, span
+from app.scrape.crawl_state import compare_tables, count_changes, get_crawl_state, page_hash, table_hash
+from app.scrape.dedupe import get_table_index
+from app.scrape.fetcher import get_fetcher
+from app.scrape.parallel import get_table_parser
+from app.scrape.tables import iter_table_html, parse_table
+from app.table_store import get_parsed_tables, get_table_store
+from app.scrape.batch import CrawlJob, get_jobs_dir, load_sitemap, start_job
+from app.jobs.manager import get_job_manager, job_handler, job_response, job_view, wants_async
 
 
 @scrape_bp.route('/scrape_form', methods=['GET', 'POST'])
@@ -23,190 +20,283 @@ def scrape():
     url = request.args.get('url', '')  # Get URL from query parameters
     return render_template('scrape/scrape.html', url=url)
 
+class ScrapeError(Exception):
+    pass
+
+
+def _no_progress(fraction, message=None):
+    pass
+
+
+def scrape_tables(url, progress=_no_progress):
+    # Plain HTTP first, Chrome only when the page needs it
+    state = get_crawl_state()
+    previous = state.page(url) if state else None
+    progress(0.05, 'Fetching page')
+    with span('scrape.fetch'):
+        fetched = get_fetcher().fetch(url, state.validators(url) if state else None)
+    
+    store = get_table_store()
+    tables = None
+    if fetched.get('not_modified'):
+        # Nothing changed on the server; reuse the stored tables while they're all still there
+        tables = [(i, store.get(table_id)) for i, (_, table_id) in enumerate(previous['tables'])]
+        if any(table_html is None for _, table_html in tables):
+            with span('scrape.fetch'):
+                fetched = get_fetcher().fetch(url)
+            tables = None
+    if tables is None:
+        progress(0.5, f"Fetched page ({fetched['tier']}), parsing tables")
+        tables = iter_table_html(fetched['html'])
+    else:
+        progress(0.5, 'Page not modified, using the stored tables')
+    
+    # Walk the page's tables as the parser reaches them, storing each one's
+    # HTML server-side; only its ID goes back to the browser
+    serialized = []
+    results = []
+    table_ids = {}
+    hashes = []
+    with span('scrape.parse'):
+        for i, table_html in tables:
+            hashes.append(table_hash(table_html))
+            try:
+                table_ids[i] = store.put(table_html)
+                serialized.append((i, table_html))
+            except Exception as table_error:
+                print(f"Error storing table {i}: {str(table_error)}")
+                results.append({'index': i, 'error': str(table_error)})
+    count('tables_found', len(hashes))
+    
+    if not hashes:
+        raise ScrapeError("No tables found on the page")
+    progress(0.6, f"Stored {len(serialized)} tables, summarizing")
+    
+    # What changed since the last scrape of this URL
+    statuses, removed = compare_tables([value for value, _ in previous['tables']] if previous else None, hashes)
+    if fetched.get('not_modified'):
+        page_change = 'not_modified'
+    elif previous is None:
+        page_change = 'new'
+    else:
+        page_change = 'unchanged' if previous['page_hash'] == page_hash(hashes) else 'changed'
+    if fetched.get('not_modified'):
+        state.mark_checked(url)
+    elif state:
+        state.record_page(url, fetched, [[value, table_ids.get(i)] for i, value in enumerate(hashes)])
+    
+    # Tables already seen on other pages, as they are or nearly
+    matches = {}
+    index = get_table_index()
+    if index:
+        with span('scrape.dedupe'):
+            matches = {i: index.add(hashes[i], url, table_html) for i, table_html in serialized}
+    duplicates = {
+        i: match for i, match in matches.items() if match and match['match'] and match['page_count'] > 1
+    }
+    
+    # Shape, headers and first rows, in worker processes when the page is big;
+    # the full table is only parsed when it's opened. Tables summarized
+    # before, here or on another page, aren't parsed again, and neither are
+    # copies that only differ from a summarized table in their attributes.
+    sample_rows = current_app.config.get('TABLE_PREVIEW_ROWS', 5)
+    stage = f'summary:{sample_rows}'
+    parsed = []
+    if state:
+        for i, _ in serialized:
+            summary = state.get_result(hashes[i], stage)
+            source = (matches.get(i) or {}).get('same_content')
+            if summary is None and source:
+                summary = state.get_result(source, stage)
+                if summary is not None:
+                    state.put_result(hashes[i], stage, summary)
+            if summary is not None:
+                parsed.append({'index': i, 'summary': summary})
+    reused = {entry['index'] for entry in parsed}
+    with span('scrape.preview'):
+        for entry in get_table_parser().parse([table for table in serialized if table[0] not in reused], sample_rows):
+            if state and 'summary' in entry:
+                state.put_result(hashes[entry['index']], stage, entry['summary'])
+            parsed.append(entry)
+    
+    for entry in parsed:
+        i = entry['index']
+        if 'error' in entry:
+            print(f"Error processing table {i}: {entry['error']}")
+            results.append({'index': i, 'table_id': table_ids[i], 'error': entry['error']})
+            continue
+        summary = entry['summary']
+        count('table_rows', summary['n_rows'])
+        if summary['n_rows'] and summary['n_cols']:
+            results.append({
+                'index': i, 'table_id': table_ids[i], 'summary': summary,
+                'change': statuses[i], 'duplicate': duplicates.get(i),
+            })
+    results.sort(key=lambda table: table['index'])
+    
+    if not any('summary' in table for table in results):
+        raise ScrapeError("Found tables but couldn't process them properly.")
+    
+    changes = {'page': page_change, 'tables': count_changes(statuses, removed)}
+    return {'url': url, 'tier': fetched['tier'], 'tables': results, 'changes': changes}
+
+
+def render_scrape_results(result):
+    table_ids = {table['index']: table['table_id'] for table in result['tables'] if 'summary' in table}
+    table_summaries = {table['index']: table['summary'] for table in result['tables'] if 'summary' in table}
+    table_errors = {table['index']: table['error'] for table in result['tables'] if 'error' in table}
+    # Changes are only worth showing when the page was scraped before
+    changes = result.get('changes')
+    if changes and changes['page'] == 'new':
+        changes = None
+    table_changes = {table['index']: table.get('change') for table in result['tables'] if 'summary' in table}
+    duplicates = {table['index']: table['duplicate'] for table in result['tables'] if table.get('duplicate')}
+    
+    session['current_table'] = True
+    session['current_schema'] = False  # Explicitly set schema to False
+    session['table_ids'] = table_ids
+    
+    return render_template('scrape/scrape_webpage.html', 
+                         tables=table_summaries,
+                         table_errors=table_errors,
+                         changes=changes,
+                         table_changes=table_changes,
+                         duplicates=duplicates,
+                         page_size=current_app.config.get('TABLE_PAGE_SIZE', 50),
+                         table_ids=table_ids,
+                         url=result['url'])
+
+
+@job_handler('scrape')
+def scrape_job(params, progress):
+    return scrape_tables(params['url'], progress)
+
+
+@job_view('scrape')
+def scrape_job_view(job):
+    if job['error']:
+        return render_template('scrape/scrape_webpage.html',
+                             url=job['params']['url'],
+                             error=f"Error scraping URL: {job['error']}")
+    return render_scrape_results(job['result'])
+
+
 @scrape_bp.route('/scrape_webpage', methods=['POST'])
 def scrape_webpage():
     url = request.form['url']
     session['last_url'] = url
 
-    load_dotenv()
-    # # Set your OpenAI API key
-    openai.api_key = os.getenv('OPENAI_API_KEY')
-    if not openai.api_key:
-        raise ValueError("No OpenAI API key found. Please set OPENAI_API_KEY in your .env file.")
+    # Run in the background and hand back a job to follow
+    if wants_async():
+        return job_response(get_job_manager().submit('scrape', {'url': url}))
     
-    driver = None
     try:
-        driver = get_driver()
-        driver.get(url)
-        
-        # Wait longer for Cloudflare to clear and page to load
-        time.sleep(5)  # Add initial wait for Cloudflare
-        
-        # Wait for body to be present
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        
-        # Additional wait for any dynamic content
-        time.sleep(2)
-        
-        # Get page source after JavaScript execution
-        page_source = driver.execute_script("return document.documentElement.outerHTML")
-        
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(page_source, 'lxml')
-        
-        # Find all tables
-        tables = soup.find_all('table')
-        
-        if not tables:
-            return render_template('scrape.html', 
-                                 error="No tables found on the page")
-        
-        # Store original table HTML and create previews
-        original_tables = {}
-        table_previews = {}
-        
-        for i, table in enumerate(tables):
-            try:
-                # Store original HTML
-                original_tables[i] = str(table)
-                
-                # Create preview with Bootstrap table classes
-                df = html_table_to_dataframe(table)
-                if not df.empty:
-                    table_previews[i] = df.to_html(
-                        classes='table table-striped table-bordered',
-                        index=False,
-                        escape=False
-                    )
-            except Exception as table_error:
-                print(f"Error processing table {i}: {str(table_error)}")
-                continue
-        
-        if not table_previews:
-            return render_template('scrape.html', 
-                                 error="Found tables but couldn't process them properly.")
-        
-        if table_previews:
-            session['current_table'] = True
-            session['current_schema'] = False  # Explicitly set schema to False
-            session['original_tables'] = original_tables
-        
-        return render_template('scrape/scrape_webpage.html', 
-                             tables=table_previews,
-                             original_tables=original_tables,
-                             url=url)
-                                 
+        return render_scrape_results(scrape_tables(url))
     except Exception as e:
         return render_template('scrape/scrape_webpage.html', 
                              error=f"Error scraping URL: {str(e)}")
-    finally:
-        if driver:
-            driver.quit()
 
-    # Scrape the webpage
-    # return render_template('scrape/scrape_webpage.html', url=url)
+
+@scrape_bp.route('/fetch_stats', methods=['GET'])
+def fetch_stats():
+    return jsonify(get_fetcher().snapshot())
+
+
+@scrape_bp.route('/duplicates', methods=['GET'])
+def duplicates():
+    # Tables found on more than one page, each with the pages it appeared on
+    index = get_table_index()
+    if index is None:
+        return jsonify({"error": "Duplicate detection is turned off (DEDUPE_ENABLED=0)"}), 404
+    return jsonify({'stats': index.stats(), 'groups': index.groups(_int_arg('limit', 50))})
+
+
+@scrape_bp.route('/batch', methods=['POST'])
+def start_batch():
+    payload = request.get_json(silent=True) or {}
+    urls = payload.get('urls') or []
+    sitemap = payload.get('sitemap')
+
+    try:
+        if sitemap:
+            urls = urls + load_sitemap(sitemap)
+    except Exception as e:
+        return jsonify({"error": f"Error loading sitemap: {str(e)}"}), 400
+
+    if not urls:
+        return jsonify({"error": "Provide 'urls' or a 'sitemap'"}), 400
+
+    job = CrawlJob.create(get_jobs_dir(), urls, source=sitemap or 'api')
+    start_job(current_app._get_current_object(), job)
+    return jsonify(job.progress()), 202
+
+
+@scrape_bp.route('/batch/<job_id>', methods=['GET'])
+def batch_status(job_id):
+    try:
+        job = CrawlJob.load(get_jobs_dir(), job_id)
+    except (OSError, ValueError):
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.progress())
+
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def rows_page(table, page, per_page):
+    pages = max(1, -(-table.n_rows // per_page))
+    page = min(max(1, page), pages)
+    start = (page - 1) * per_page
+    return {
+        'headers': table.headers,
+        'rows': table.rows(start, start + per_page),
+        'page': page,
+        'per_page': per_page,
+        'pages': pages,
+        'total_rows': table.n_rows,
+        'first_row': start + 1 if table.n_rows else 0,
+    }
+
+
+@scrape_bp.route('/table/<table_id>/rows', methods=['GET'])
+def table_rows(table_id):
+    # Parsed on the first request, later pages come from the parsed table cache
+    table = get_parsed_tables().get(table_id)
+    if table is None:
+        return jsonify({"error": "This table has expired, please scrape the page again."}), 404
+    config = current_app.config
+    per_page = min(max(1, _int_arg('per_page', config.get('TABLE_PAGE_SIZE', 50))),
+                   config.get('TABLE_PAGE_SIZE_MAX', 500))
+    result = rows_page(table, _int_arg('page', 1), per_page)
+    result['table_id'] = table_id
+    return jsonify(result)
 
 
 @scrape_bp.route('/table_to_csv', methods=['POST'])
 def table_to_csv():
     table_index = int(request.form['table_index'])
-    table_html = request.form['table_html']
+    table_html = get_table_store().get(request.form.get('table_id'))
+    if table_html is None:
+        return render_template('scrape/scrape_webpage.html',
+                             error="This table has expired, please scrape the page again.")
     
     try:
-        # Parse the HTML string with BeautifulSoup first
-        soup = BeautifulSoup(table_html, 'html.parser')
-        selected_table = html_table_to_dataframe(soup)
-        
-        # Convert to CSV and send as download
-        return selected_table.to_csv(index=False), {
-            'Content-Type': 'text/csv',
+        # Stream the CSV in chunks straight from the parsed columns
+        return Response(parse_table(table_html).iter_csv(), mimetype='text/csv', headers={
             'Content-Disposition': f'attachment; filename=table_{table_index}.csv'
-        }
+        })
     except Exception as e:
         return render_template('scrape/scrape_webpage.html', 
                              error=f"Error extracting table: {str(e)}")
 
 
-def get_driver():
-    try:
-        options = uc.ChromeOptions()
-        
-        # Add additional arguments to better mimic a real browser
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_argument('--disable-extensions')
-        options.add_argument('--disable-infobars')
-        options.add_argument('--disable-popup-blocking')
-        options.add_argument('--start-maximized')
-        
-        # Add random user agent
-        options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
-        
-        # Keep the necessary arguments
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--headless=new')
-        
-        # Initialize the driver with additional configurations
-        driver = uc.Chrome(
-            options=options,
-            version_main=131,
-            use_subprocess=True,  # This can help with detection evasion
-            delay=2  # Add a small delay to seem more human-like
-        )
-        
-        # Set page load timeout
-        driver.set_page_load_timeout(30)
-        
-        # Add additional properties to make detection harder
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
-        return driver
-    except Exception as e:
-        print(f"Error creating driver: {str(e)}")
-        raise
-
 def html_table_to_dataframe(table):
-    # Extract headers
-    headers = []
-    
-    # Try to find headers in thead first
-    thead = table.find('thead')
-    if thead:
-        header_row = thead.find('tr')
-        if header_row:
-            headers = [th.get_text(strip=True) for th in header_row.find_all(['th', 'td'])]
-    
-    # If no headers found in thead, look in first row
-    if not headers:
-        first_row = table.find('tr')
-        if first_row:
-            headers = [cell.get_text(strip=True) for cell in first_row.find_all(['th', 'td'])]
-    
-    # If still no headers, generate column names
-    if not headers:
-        # Find the row with maximum columns to determine number of columns
-        max_cols = 0
-        for row in table.find_all('tr'):
-            cols = len(row.find_all(['td', 'th']))
-            max_cols = max(max_cols, cols)
-        headers = [f'Column {i+1}' for i in range(max_cols)]
-    
-    # Extract rows from tbody if it exists, otherwise from table
-    tbody = table.find('tbody')
-    rows_container = tbody if tbody else table
-    
-    rows = []
-    for tr in rows_container.find_all('tr'):
-        # Skip header row if we're processing the whole table
-        if not tbody and tr == table.find('tr') and headers == [cell.get_text(strip=True) for cell in tr.find_all(['th', 'td'])]:
-            continue
-            
-        row = [td.get_text(strip=True) for td in tr.find_all(['td', 'th'])]
-        if row and len(row) == len(headers):  # Only append rows that match header length
-            rows.append(row)
-    
-    # Create DataFrame
-    df = pd.DataFrame(rows, columns=headers)
-    return df
+    # Single pass over the rows; see app.scrape.tables for span and header handling
+    with span('table.parse'):
+        parsed = parse_table(table)
+    with span('table.dataframe'):
+        return parsed.to_dataframe()
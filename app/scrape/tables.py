@@ -0,0 +1,309 @@
+import csv
+import io
+
+from lxml import etree
+
+
+SECTION_TAGS = ('thead', 'tbody', 'tfoot')
+CELL_TAGS = ('td', 'th')
+HTML_PARSER = etree.HTMLParser()
+
+
+def _span(cell, name):
+    try:
+        return max(1, min(int(cell.get(name, 1)), 1000))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _cell_text(cell):
+    # Leaf cells skip the XPath text_content() call, the common case by far
+    text = cell.text if len(cell) == 0 else ''.join(cell.itertext())
+    if not text:
+        return ''
+    # Collapse whitespace the way a browser renders it
+    return ' '.join(text.split())
+
+
+def _first_href(cell):
+    for link in cell.iter('a'):
+        href = link.get('href')
+        if href:
+            return href.strip()
+    return None
+
+
+def _iter_rows(table):
+    # Direct rows only, so rows of nested tables are never picked up.
+    # Browsers render <thead> first and <tfoot> last no matter where they appear.
+    head, body, foot = [], [], []
+    sections = {'thead': head, 'tbody': body, 'tfoot': foot}
+    for child in table:
+        tag = child.tag if isinstance(child.tag, str) else None
+        if tag == 'tr':
+            body.append(('tbody', child))
+        elif tag in SECTION_TAGS:
+            sections[tag].extend((tag, tr) for tr in child if tr.tag == 'tr')
+    return head + body + foot
+
+
+def to_element(table):
+    # Accept table HTML, an lxml element, or a BeautifulSoup tag
+    if isinstance(table, etree._Element):
+        element = table
+    else:
+        markup = table if isinstance(table, (str, bytes)) else str(table)
+        if not markup.strip():
+            raise ValueError("Empty table HTML")
+        # Plain etree elements iterate noticeably faster than lxml.html ones
+        element = etree.fromstring(markup, HTML_PARSER)
+    if element.tag != 'table':
+        found = next(element.iter('table'), None)
+        if found is None:
+            raise ValueError("No <table> element found")
+        element = found
+    return element
+
+
+def _release(element):
+    # Drop the element's content and everything parsed before it, so only the
+    # path from the root to the parser's position stays in memory
+    element.clear()
+    node = element
+    while node is not None:
+        parent = node.getparent()
+        if parent is not None:
+            while node.getprevious() is not None:
+                del parent[0]
+        node = parent
+
+
+def iter_tables(source, chunk_size=1 << 20):
+    """Yield a page's top-level ``<table>`` elements as the parser reaches them.
+
+    ``source`` is the page as a string or bytes, or an iterable of chunks.
+    Nested tables come inside the table that holds them, so
+    ``top.iter('table')`` over each yielded table visits the same tables in
+    the same order as ``iter('table')`` over a fully parsed document. Each
+    table is cleared once the caller moves on, and the markup before it is
+    dropped as the page is read, so memory follows the largest table
+    instead of the whole page; finish with a table before advancing.
+    """
+    chunks = source
+    if isinstance(source, (str, bytes)):
+        chunks = (source[i:i + chunk_size] for i in range(0, len(source), chunk_size))
+    # Scripts, styles and inline SVG are released too, they can be most of a page
+    parser = etree.HTMLPullParser(events=('end',), tag=('table', 'script', 'style', 'svg'))
+
+    def finished():
+        for _, element in parser.read_events():
+            if next(element.iterancestors('table'), None) is not None:
+                continue
+            if element.tag == 'table':
+                yield element
+            _release(element)
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from finished()
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        # Nothing parseable at all, which means no tables either
+        return
+    yield from finished()
+
+
+def iter_table_html(source):
+    """Yield ``(index, table_html)`` for every table on a page, nested ones included."""
+    index = 0
+    for top in iter_tables(source):
+        for table in top.iter('table'):
+            yield index, etree.tostring(table, encoding='unicode', method='html', with_tail=False)
+            index += 1
+
+
+def _dedupe(headers):
+    seen = {}
+    result = []
+    for i, header in enumerate(headers):
+        header = header or f'Column {i+1}'
+        if header in seen:
+            seen[header] += 1
+            header = f'{header}.{seen[header]}'
+        else:
+            seen[header] = 0
+        result.append(header)
+    return result
+
+
+class ParsedTable:
+    def __init__(self, headers, columns, n_rows, links=None, total_rows=None):
+        self.headers = headers
+        self.columns = columns
+        self.n_rows = n_rows
+        # column index -> per-row href of the cell's first link (None when it has none)
+        self.links = links or {}
+        # Rows in the whole table when only the first n_rows were parsed
+        self.total_rows = n_rows if total_rows is None else total_rows
+
+    @property
+    def shape(self):
+        return (self.n_rows, len(self.headers))
+
+    def rows(self, start=0, stop=None):
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        return [list(row) for row in zip(*(column[start:stop] for column in self.columns))]
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(dict(zip(self.headers, self.columns)), columns=self.headers)
+
+    def iter_csv(self, chunk_rows=1000):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.headers)
+        for start in range(0, self.n_rows, chunk_rows):
+            writer.writerows(zip(*(column[start:start + chunk_rows] for column in self.columns)))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def to_csv(self):
+        return ''.join(self.iter_csv())
+
+
+def parse_table(table, limit=None):
+    """Parse a table into column arrays in a single pass over its rows.
+
+    ``rowspan``/``colspan`` cells are copied into every slot they cover,
+    ragged rows are padded with empty strings, and header rows come from
+    ``<thead>`` or a leading row made only of ``<th>`` cells. With
+    ``limit``, only the first ``limit`` body rows are parsed and the rest
+    are just counted into ``total_rows``.
+    """
+    element = to_element(table)
+    rows = iter(_iter_rows(element))
+    skipped = 0
+
+    header_rows = []
+    columns = []
+    n_rows = 0
+    # column index -> [rows remaining, text] for cells spanning down from earlier rows
+    carried = {}
+    links = {}
+    in_header = True
+
+    for section, tr in rows:
+        slots = {}
+        # Columns whose rowspan starts in this row; they're carried from the next row on
+        started = set()
+        row_links = {}
+        col = 0
+        all_th = True
+        for cell in tr:
+            if cell.tag not in CELL_TAGS:
+                continue
+            while col in carried:
+                col += 1
+            if cell.tag != 'th':
+                all_th = False
+            text = _cell_text(cell)
+            if len(cell):
+                href = _first_href(cell)
+                if href:
+                    row_links[col] = href
+            if cell.get('colspan') is None and cell.get('rowspan') is None:
+                slots[col] = text
+                col += 1
+                continue
+            rowspan = _span(cell, 'rowspan')
+            colspan = _span(cell, 'colspan')
+            for offset in range(colspan):
+                slots[col + offset] = text
+                if rowspan > 1:
+                    carried[col + offset] = [rowspan - 1, text]
+                    started.add(col + offset)
+            col += colspan
+
+        # Fill slots covered by cells spanning down from earlier rows. A cell of
+        # this row overlapping one (a table model error) keeps its slot, but the
+        # span still counts the row so it ends where it should.
+        for index, (remaining, text) in list(carried.items()):
+            if index in started:
+                continue
+            slots.setdefault(index, text)
+            if remaining <= 1:
+                del carried[index]
+            else:
+                carried[index][0] = remaining - 1
+
+        if not slots:
+            continue
+        width = max(slots) + 1
+
+        if in_header and (section == 'thead' or (all_th and not header_rows and n_rows == 0)):
+            header_rows.append([slots.get(i, '') for i in range(width)])
+            continue
+        in_header = False
+
+        # New columns are backfilled so every column stays n_rows long
+        while len(columns) < width:
+            columns.append([''] * n_rows)
+        for i, column in enumerate(columns):
+            column.append(slots.get(i, ''))
+        for i, href in row_links.items():
+            if i not in links:
+                links[i] = [None] * n_rows
+            links[i].append(href)
+        n_rows += 1
+        for column_links in links.values():
+            if len(column_links) < n_rows:
+                column_links.append(None)
+        # One extra row in case the first one turns out to be the header
+        if limit is not None and n_rows > limit:
+            # Rows made only of cells spanning down from above aren't counted
+            skipped = sum(1 for _, tr in rows if any(cell.tag in CELL_TAGS for cell in tr))
+            break
+
+    # Tables without <thead>/<th> use their first row as the header, like the old parser
+    if not header_rows and n_rows:
+        header_rows.append([column[0] for column in columns])
+        columns = [column[1:] for column in columns]
+        links = {i: column_links[1:] for i, column_links in links.items()}
+        n_rows -= 1
+
+    total_rows = n_rows + skipped
+    if limit is not None and n_rows > limit:
+        columns = [column[:limit] for column in columns]
+        links = {i: column_links[:limit] for i, column_links in links.items()}
+        n_rows = limit
+
+    width = max([len(columns)] + [len(row) for row in header_rows])
+    while len(columns) < width:
+        columns.append([''] * n_rows)
+
+    headers = []
+    for i in range(width):
+        parts = []
+        for row in header_rows:
+            text = row[i] if i < len(row) else ''
+            if text and text not in parts:
+                parts.append(text)
+        headers.append(' '.join(parts))
+
+    return ParsedTable(_dedupe(headers), columns, n_rows, links, total_rows)
+
+
+def summarize_table(table, sample_rows=5):
+    """Shape, headers and the first ``sample_rows`` rows, without parsing the rest."""
+    parsed = parse_table(table, limit=sample_rows)
+    return {
+        'n_rows': parsed.total_rows,
+        'n_cols': len(parsed.headers),
+        'headers': parsed.headers,
+        'rows': parsed.rows(),
+    }
@@ -0,0 +1,169 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.db import get_connection
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_store (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS table_store_accessed_at ON table_store (accessed_at);
+"""
+
+
+def table_id_for(table_html):
+    # The crawl state's hash, so a table keeps one id in the store and the crawl state
+    # (imported here because app.scrape's routes import this module)
+    from app.scrape.crawl_state import table_hash
+    return table_hash(table_html)
+
+
+class TableStore:
+    """Content-addressed store for table HTML, kept in the app database.
+
+    Tables are zlib-compressed and keyed by ``table_hash`` of their HTML, so
+    storing the same table twice is free. Entries expire ``ttl`` seconds
+    after they were last read, and the least recently used entries are
+    evicted once the store exceeds ``max_bytes`` or ``max_entries``.
+    """
+
+    def __init__(self, connect, ttl=86400, max_bytes=200 * 1024 * 1024, max_entries=10000):
+        self.connect = connect
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _db(self):
+        connection = self.connect()
+        if not self._ready:
+            with self._lock:
+                connection.executescript(SCHEMA)
+                self._ready = True
+        return connection
+
+    def put(self, table_html):
+        table_id = table_id_for(table_html)
+        now = time.time()
+        db = self._db()
+        updated = db.execute(
+            'UPDATE table_store SET accessed_at = ? WHERE id = ?', (now, table_id)
+        ).rowcount
+        if not updated:
+            data = zlib.compress(table_html.encode('utf-8'), 6)
+            db.execute(
+                'INSERT OR IGNORE INTO table_store (id, data, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (table_id, data, len(data), now, now)
+            )
+            self.evict()
+        return table_id
+
+    def get(self, table_id):
+        if not table_id:
+            return None
+        db = self._db()
+        row = db.execute(
+            'SELECT data, accessed_at FROM table_store WHERE id = ?', (table_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if self.ttl and now - row['accessed_at'] > self.ttl:
+            db.execute('DELETE FROM table_store WHERE id = ?', (table_id,))
+            return None
+        db.execute('UPDATE table_store SET accessed_at = ? WHERE id = ?', (now, table_id))
+        return zlib.decompress(row['data']).decode('utf-8')
+
+    def evict(self):
+        db = self._db()
+        if self.ttl:
+            db.execute('DELETE FROM table_store WHERE accessed_at < ?', (time.time() - self.ttl,))
+
+        count, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM table_store').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk from least recently used, deleting until both limits hold
+        doomed = []
+        for row in db.execute('SELECT id, size FROM table_store ORDER BY accessed_at'):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((row['id'],))
+            count -= 1
+            total -= row['size']
+        db.executemany('DELETE FROM table_store WHERE id = ?', doomed)
+
+    def stats(self):
+        count, total = self._db().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM table_store'
+        ).fetchone()
+        return {'entries': count, 'bytes': total}
+
+
+def get_table_store(app=None):
+    app = app or current_app._get_current_object()
+    store = app.extensions.get('table_store')
+    if store is None:
+        config = app.config
+        store = app.extensions.setdefault('table_store', TableStore(
+            lambda: get_connection(app),
+            ttl=config.get('TABLE_STORE_TTL', 86400),
+            max_bytes=config.get('TABLE_STORE_MAX_BYTES', 200 * 1024 * 1024),
+            max_entries=config.get('TABLE_STORE_MAX_ENTRIES', 10000),
+        ))
+    return store
+
+
+class ParsedTableCache:
+    """The most recently opened tables, kept parsed.
+
+    Paging through a table's preview parses it once on the first page
+    instead of on every request. ``parse`` turns stored HTML into a table.
+    """
+
+    def __init__(self, store, parse, max_entries=4):
+        self.store = store
+        self.parse = parse
+        self.max_entries = max_entries
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, table_id):
+        with self._lock:
+            table = self._tables.get(table_id)
+            if table is not None:
+                self._tables.move_to_end(table_id)
+                return table
+
+        table_html = self.store.get(table_id)
+        if table_html is None:
+            return None
+        table = self.parse(table_html)
+        with self._lock:
+            self._tables[table_id] = table
+            while len(self._tables) > self.max_entries:
+                self._tables.popitem(last=False)
+        return table
+
+
+def get_parsed_tables(app=None):
+    app = app or current_app._get_current_object()
+    tables = app.extensions.get('parsed_tables')
+    if tables is None:
+        from app.scrape.tables import parse_table
+
+        tables = app.extensions.setdefault('parsed_tables', ParsedTableCache(
+            get_table_store(app), parse_table,
+            max_entries=app.config.get('TABLE_PARSE_CACHE_ENTRIES', 4),
+        ))
+    return tables
@@ -0,0 +1,146 @@
+"""Benchmark near-duplicate table lookup as the index grows.
+
+Usage: python benchmarks/bench_dedupe.py [--rows 10000 100000 1000000] [--threshold 0.8]
+
+Fills a table index (app/scrape/dedupe.py) with synthetic tables of
+--table-rows rows each until it holds each --rows total, then looks up
+--queries tables: half are near-duplicates of indexed tables with a few
+rows changed, half are new. LSH lookup time is compared with a linear scan
+over every stored signature, and recall and false matches are counted.
+
+Exits with status 1 when LSH lookup time grows at least as fast as the
+corpus, i.e. when lookup isn't sublinear.
+"""
+import argparse
+import html
+import math
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks import corpus
+from app.scrape.crawl_state import table_hash
+from app.scrape.dedupe import TableIndex, minhash, row_shingles, similarity
+
+
+def make_rows(rng, n_rows):
+    return [
+        f'<tr><td>{rng.randrange(10 ** 6)}</td><td>{html.escape(rng.choice(corpus.WORDS))}</td>'
+        f'<td>{rng.randrange(100000) / 100:.2f}</td><td>2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}</td></tr>'
+        for _ in range(n_rows)
+    ]
+
+
+def table_html(rows):
+    return '<table><tr><th>Code</th><th>Label</th><th>Amount</th><th>Updated</th></tr>' + ''.join(rows) + '</table>'
+
+
+def near_copy(rng, rows, changed):
+    # The same table with a share of its rows replaced, as on a paginated or personalized copy
+    rows = list(rows)
+    for i in rng.sample(range(len(rows)), max(1, int(len(rows) * changed))):
+        rows[i] = make_rows(rng, 1)[0]
+    return rows
+
+
+def connect(path):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return lambda: connection
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000], help='corpus sizes in rows')
+    parser.add_argument('--table-rows', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--changed', type=float, default=0.05, help='share of rows changed in a near-duplicate')
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='migrator-dedupe-')
+    index = TableIndex(connect(os.path.join(workdir, 'index.db')), args.threshold, args.num_perm)
+    print(f"threshold {args.threshold}: {index.bands} bands of {index.rows} rows, {args.num_perm} permutations")
+    print(f"{'rows':>10} {'tables':>8} {'index s':>8} {'LSH ms':>8} {'scan ms':>8} {'candidates':>10} "
+          f"{'recall':>7} {'false':>6}")
+
+    indexed_rows = []  # rows of every table in the index, to draw near-duplicates from
+    signatures = []
+    index_seconds = 0.0
+    timings = []
+    for total_rows in sorted(args.rows):
+        # Grow the index to this size
+        started = time.perf_counter()
+        while len(indexed_rows) * args.table_rows < total_rows:
+            rows = make_rows(rng, args.table_rows)
+            markup = table_html(rows)
+            index.add(table_hash(markup), f'/page/{len(indexed_rows)}', markup)
+            indexed_rows.append(rows)
+            signatures.append(minhash(row_shingles(markup), args.num_perm))
+        index_seconds += time.perf_counter() - started
+        matrix = np.vstack(signatures)
+
+        queries = []
+        for i in range(args.queries):
+            if i % 2 == 0:
+                source = rng.randrange(len(indexed_rows))
+                queries.append((source, near_copy(rng, indexed_rows[source], args.changed)))
+            else:
+                queries.append((None, make_rows(rng, args.table_rows)))
+        query_signatures = [(source, minhash(row_shingles(table_html(rows)), args.num_perm)) for source, rows in queries]
+
+        lsh_times, scan_times, candidates = [], [], []
+        found = false_matches = 0
+        for source, signature in query_signatures:
+            started = time.perf_counter()
+            match = index.query(signature)
+            lsh_times.append(time.perf_counter() - started)
+            candidates.append(len(index.candidates(signature)))
+
+            # Linear scan: every stored signature against the query
+            started = time.perf_counter()
+            scores = (matrix == signature).mean(axis=1)
+            scores.argmax()
+            scan_times.append(time.perf_counter() - started)
+
+            if source is not None and match and similarity(signature, signatures[source]) >= args.threshold:
+                found += 1
+            elif source is None and match:
+                false_matches += 1
+
+        near_queries = sum(1 for source, _ in queries if source is not None)
+        lsh_ms = statistics.median(lsh_times) * 1000
+        timings.append((len(indexed_rows) * args.table_rows, lsh_ms))
+        print(
+            f"{len(indexed_rows) * args.table_rows:>10} {len(indexed_rows):>8} {index_seconds:>8.1f} "
+            f"{lsh_ms:>8.2f} {statistics.median(scan_times) * 1000:>8.2f} {statistics.mean(candidates):>10.1f} "
+            f"{found / near_queries:>7.0%} {false_matches:>6}"
+        )
+
+    if len(timings) < 2:
+        return 0
+    (first_rows, first_ms), (last_rows, last_ms) = timings[0], timings[-1]
+    # Slope of lookup time against corpus size on a log-log scale: 1 is linear
+    slope = math.log(max(last_ms, 1e-6) / max(first_ms, 1e-6)) / math.log(last_rows / first_rows)
+    print(f"\nCorpus grew {last_rows / first_rows:.0f}x, LSH lookup {last_ms / first_ms:.1f}x (growth exponent {slope:.2f})")
+    if slope >= 1:
+        print("Lookup time is growing linearly with the corpus")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""Benchmark the scrape -> schema -> extract pipeline on synthetic pages.
+
+Usage:
+    python benchmarks/bench_pipeline.py                      # run, compare with the baseline
+    python benchmarks/bench_pipeline.py --save               # run, store the results as the baseline
+    python benchmarks/bench_pipeline.py --rows 1000 --case csv --case structure
+    python benchmarks/bench_pipeline.py --write-corpus /tmp/corpus
+
+Each case runs in a fresh process so its peak RSS is its own. Wall time is
+the median of --repeat runs; allocations are measured in one more run under
+tracemalloc, which is too slow to time. The LLM is a local mock server (see
+mock_llm.py) and pages are served over HTTP from corpus.py, so the pipeline
+case exercises the real fetch, parse, schema and extract code.
+
+Exits with status 1 when a case is slower or uses more memory than the
+baseline by more than the thresholds. Baselines are only comparable on
+the machine that recorded them.
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import corpus, mock_llm
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Metrics compared against the baseline, with the smallest change worth reporting
+COMPARED = {'seconds': 0.01, 'peak_alloc_mb': 1.0, 'peak_rss_mb': 5.0}
+# Sending every row through the mock model gets slow past this size
+MAX_ROWS = {'extract_llm': 10000}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def records_html(rows, seed):
+    from lxml import html as lxml_html
+    from lxml import etree
+
+    document = lxml_html.document_fromstring(corpus.make_page(rows, seed=seed))
+    table = document.get_element_by_id('records')
+    return etree.tostring(table, encoding='unicode', method='html', with_tail=False)
+
+
+def setup_dataframe(rows, seed, servers):
+    # Every table on a fetched page to a DataFrame, the way the page is walked in scrape_tables
+    from app.scrape.routes import html_table_to_dataframe
+    from app.scrape.tables import iter_tables
+
+    page = corpus.make_page(rows, seed=seed)
+
+    def run():
+        for top in iter_tables(page):
+            for table in top.iter('table'):
+                html_table_to_dataframe(table)
+    return run
+
+
+def setup_preview(rows, seed, servers):
+    # The scrape listing's summaries, then opening the records table at page one
+    from app.scrape.routes import rows_page
+    from app.scrape.tables import iter_tables, parse_table, summarize_table
+
+    page = corpus.make_page(rows, seed=seed)
+    table_html = records_html(rows, seed)
+
+    def run():
+        for top in iter_tables(page):
+            for table in top.iter('table'):
+                summarize_table(table)
+        rows_page(parse_table(table_html), 1, 50)
+    return run
+
+
+def setup_csv(rows, seed, servers):
+    from app.scrape.tables import parse_table
+
+    table_html = records_html(rows, seed)
+
+    def run():
+        size = 0
+        for chunk in parse_table(table_html).iter_csv():
+            size += len(chunk)
+        return size
+    return run
+
+
+def setup_structure(rows, seed, servers):
+    from app.schema.structure import build_table_structure
+
+    table_html = records_html(rows, seed)
+    return lambda: build_table_structure(table_html)
+
+
+def _app(servers, **overrides):
+    from app import create_app
+    from config import Config
+
+    workdir = tempfile.mkdtemp(prefix='migrator-bench-')
+    settings = dict(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        FETCH_BROWSER_DOMAINS_PATH=os.path.join(workdir, 'browser_domains.json'),
+        OPENAI_API_KEY='benchmark',
+        OPENAI_API_URL=servers['llm'],
+        OLLAMA_API_URL=None,
+        # Every run has to do the work again
+        LLM_CACHE_ENABLED=False,
+        SCHEMA_REGISTRY_ENABLED=False,
+        CRAWL_STATE_ENABLED=False,
+        DEDUPE_ENABLED=False,
+        METRICS_ENABLED=False,
+    )
+    settings.update(overrides)
+    return create_app(type('BenchmarkConfig', (Config,), settings))
+
+
+def setup_pipeline(rows, seed, servers):
+    from app.extract.routes import extract_records, render_extraction
+    from app.schema.routes import generate_schema_from_table
+    from app.scrape.routes import scrape_tables
+    from app.table_store import get_table_store
+
+    app = _app(servers)
+    url = f"{servers['pages']}/page/{rows}-{seed}.html"
+    index = corpus.records_table_index()
+
+    def run():
+        with app.test_request_context():
+            result = scrape_tables(url)
+            table_id = next(table['table_id'] for table in result['tables'] if table['index'] == index)
+            table_html = get_table_store().get(table_id)
+            schema = generate_schema_from_table(table_html)
+            if not schema:
+                raise RuntimeError("Schema generation failed")
+            records, report = extract_records(table_html, schema)
+            render_extraction(records, report)
+        if len(records) < rows:
+            raise RuntimeError(f"Extracted {len(records)} of {rows} rows")
+    return run
+
+
+def setup_extract_llm(rows, seed, servers):
+    # Every row through the batched model path, as with EXTRACT_RULES_ENABLED=0
+    from app.extract.routes import extract_records
+    from app.schema.structure import build_table_structure
+
+    app = _app(servers, EXTRACT_RULES_ENABLED=False)
+    table_html = records_html(rows, seed)
+    schema = json.dumps({'fields': [
+        {key: field[key] for key in ('field_name', 'field_label', 'field_type')}
+        for field in build_table_structure(table_html)['fields']
+    ]})
+
+    def run():
+        with app.app_context():
+            records, _ = extract_records(table_html, schema)
+        if len(records) < rows:
+            raise RuntimeError(f"Extracted {len(records)} of {rows} rows")
+    return run
+
+
+CASES = {
+    'dataframe': setup_dataframe,
+    'preview': setup_preview,
+    'csv': setup_csv,
+    'structure': setup_structure,
+    'pipeline': setup_pipeline,
+    'extract_llm': setup_extract_llm,
+}
+
+
+def measure(name, rows, seed, repeat, servers, verbose, results):
+    # Runs in its own process
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        run = CASES[name](rows, seed, servers)
+        rss_before = peak_rss_mb()
+        timings = []
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        peak_rss = peak_rss_mb()
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak_alloc = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results.put({
+            'seconds': statistics.median(timings),
+            'min_seconds': min(timings),
+            'peak_rss_mb': peak_rss,
+            'rss_growth_mb': peak_rss - rss_before if peak_rss is not None else None,
+            'peak_alloc_mb': peak_alloc / (1024 * 1024),
+        })
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+
+
+def run_case(name, rows, args, servers):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(
+        target=measure, args=(name, rows, args.seed, args.repeat, servers, args.verbose, results)
+    )
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def compare(key, result, baseline, args):
+    """Return a list of regression messages for one case."""
+    previous = baseline.get('results', {}).get(key)
+    if not previous:
+        return []
+    problems = []
+    for metric, min_delta in COMPARED.items():
+        old, new = previous.get(metric), result.get(metric)
+        if old is None or new is None:
+            continue
+        threshold = args.threshold if metric == 'seconds' else args.memory_threshold
+        if new - old > max(min_delta, old * threshold):
+            problems.append(f"{key} {metric}: {old:.3f} -> {new:.3f} (+{(new - old) / old:.0%})")
+    return problems
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, baseline, results):
+    baseline = dict(baseline)
+    baseline['python'] = platform.python_version()
+    baseline['machine'] = platform.platform()
+    baseline['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    # Cases that weren't run this time keep their old numbers
+    baseline['results'] = dict(baseline.get('results', {}), **results)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def _format(value, previous=None):
+    if value is None:
+        return '-'
+    text = f'{value:.3f}' if value < 100 else f'{value:.0f}'
+    if previous:
+        text += f' ({(value - previous) / previous:+.0%})'
+    return text
+
+
+def write_corpus(directory, sizes, seed):
+    os.makedirs(directory, exist_ok=True)
+    for rows in sizes:
+        path = os.path.join(directory, f'page_{rows}_{seed}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(corpus.make_page(rows, seed=seed))
+        print(f"Wrote {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='records table sizes')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='cases to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, 0.2 = 20%%')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='allowed memory growth')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='seconds the mock model takes per request')
+    parser.add_argument('--write-corpus', metavar='DIR', help='write the generated pages to DIR and exit')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own output")
+    args = parser.parse_args(argv)
+
+    if args.write_corpus:
+        write_corpus(args.write_corpus, args.rows, args.seed)
+        return 0
+
+    llm_url, _ = mock_llm.start(args.llm_latency)
+    servers = {'pages': corpus.serve(), 'llm': llm_url}
+    baseline = load_baseline(args.baseline)
+    previous = baseline.get('results', {})
+
+    print(f"{'case':<24} {'median s':>16} {'min s':>8} {'peak RSS MB':>16} {'RSS growth':>11} {'peak alloc MB':>16}")
+    results, problems, failed = {}, [], False
+    for name in args.case or CASES:
+        for rows in args.rows:
+            key = f'{name}/{rows}'
+            if rows > MAX_ROWS.get(name, rows):
+                print(f"{key:<24} skipped, over {MAX_ROWS[name]} rows")
+                continue
+            result = run_case(name, rows, args, servers)
+            if 'error' in result:
+                failed = True
+                print(f"{key:<24} failed\n{result['error']}")
+                continue
+            results[key] = result
+            old = previous.get(key, {})
+            print(
+                f"{key:<24} {_format(result['seconds'], old.get('seconds')):>16} {_format(result['min_seconds']):>8} "
+                f"{_format(result['peak_rss_mb'], old.get('peak_rss_mb')):>16} {_format(result['rss_growth_mb']):>11} "
+                f"{_format(result['peak_alloc_mb'], old.get('peak_alloc_mb')):>16}"
+            )
+            problems.extend(compare(key, result, baseline, args))
+
+    if args.save:
+        save_baseline(args.baseline, baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+    elif not previous:
+        print(f"No baseline at {args.baseline}, run with --save to record one")
+
+    if problems:
+        print('\nRegressions over the thresholds:')
+        for problem in problems:
+            print(f'  {problem}')
+    return 1 if (problems and not args.save) or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
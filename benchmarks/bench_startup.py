@@ -0,0 +1,96 @@
+"""Check that the app starts within its import-time budget.
+
+Usage: python benchmarks/bench_startup.py [--budget-ms 800] [--runs 5]
+
+Runs ``create_app()`` under ``python -X importtime`` in fresh interpreters
+and reports the median time spent importing and the slowest modules.
+Exits with status 1 when the median is over the budget, or when a module
+that should only load on first use (pandas, openai, the browser driver,
+...) is imported at startup. The module check holds on any machine; the
+budget depends on the machine, so set it for the one running the check.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Loaded on first use by the code that needs them, never by create_app()
+LAZY_MODULES = ('pandas', 'numpy', 'openai', 'httpx', 'tiktoken', 'bs4', 'selenium', 'undetected_chromedriver')
+MARKER = '-- create_app --'
+
+STARTUP = f"""
+import json, sys, time
+sys.stderr.write({MARKER!r} + '\\n')
+sys.stderr.flush()
+started = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return ``{module: (self_us, cumulative_us)}`` for top-level imports after the marker."""
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    modules = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        # One space separates the column; more indentation marks a nested import
+        modules[name[1:].rstrip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure():
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP],
+        cwd=ROOT, env=environment, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr)
+    # Nested imports are indented, so the top-level ones add up to the total
+    report['import_ms'] = sum(cumulative for name, (_, cumulative) in modules.items() if not name.startswith(' ')) / 1000
+    report['modules'] = modules
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--budget-ms', type=float, default=800.0, help='median import time allowed for create_app()')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    args = parser.parse_args(argv)
+
+    reports = [measure() for _ in range(args.runs)]
+    import_ms = statistics.median(report['import_ms'] for report in reports)
+    startup_ms = statistics.median(report['seconds'] for report in reports) * 1000
+
+    slowest = sorted(reports[-1]['modules'].items(), key=lambda item: -item[1][1])[:args.top]
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+    print(f"\ncreate_app(): {import_ms:.0f} ms importing, {startup_ms:.0f} ms in total "
+          f"(median of {args.runs}, budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    loaded = sorted({module for report in reports for module in report['loaded']})
+    if loaded:
+        failed = True
+        print(f"Imported at startup but should load on first use: {', '.join(loaded)}")
+    if import_ms > args.budget_ms:
+        failed = True
+        print(f"Import time is over the budget by {import_ms - args.budget_ms:.0f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
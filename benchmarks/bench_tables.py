@@ -0,0 +1,76 @@
+"""Compare the lxml table parser with the old BeautifulSoup implementation.
+
+Usage: python benchmarks/bench_tables.py [rows ...]   (default: 10000 100000)
+"""
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from app.scrape.tables import parse_table
+
+
+def make_table(n_rows, n_cols=6):
+    header = ''.join(f'<th>Column {c}</th>' for c in range(n_cols))
+    body = ''.join(
+        '<tr>' + ''.join(f'<td>r{r} c{c}</td>' for c in range(n_cols)) + '</tr>'
+        for r in range(n_rows)
+    )
+    return f'<table><tr>{header}</tr>{body}</table>'
+
+
+def legacy_html_table_to_dataframe(table):
+    # The BeautifulSoup implementation this benchmark replaced
+    headers = []
+    thead = table.find('thead')
+    if thead:
+        header_row = thead.find('tr')
+        if header_row:
+            headers = [th.get_text(strip=True) for th in header_row.find_all(['th', 'td'])]
+    if not headers:
+        first_row = table.find('tr')
+        if first_row:
+            headers = [cell.get_text(strip=True) for cell in first_row.find_all(['th', 'td'])]
+    if not headers:
+        max_cols = 0
+        for row in table.find_all('tr'):
+            max_cols = max(max_cols, len(row.find_all(['td', 'th'])))
+        headers = [f'Column {i+1}' for i in range(max_cols)]
+    tbody = table.find('tbody')
+    rows_container = tbody if tbody else table
+    rows = []
+    for tr in rows_container.find_all('tr'):
+        if not tbody and tr == table.find('tr') and headers == [cell.get_text(strip=True) for cell in tr.find_all(['th', 'td'])]:
+            continue
+        row = [td.get_text(strip=True) for td in tr.find_all(['td', 'th'])]
+        if row and len(row) == len(headers):
+            rows.append(row)
+    return pd.DataFrame(rows, columns=headers)
+
+
+def timed(func):
+    gc.collect()
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main(sizes):
+    print(f"{'rows':>8} {'legacy (s)':>12} {'lxml (s)':>10} {'speedup':>8}")
+    for n_rows in sizes:
+        table_html = make_table(n_rows)
+        legacy, legacy_seconds = timed(
+            lambda: legacy_html_table_to_dataframe(BeautifulSoup(table_html, 'lxml').find('table'))
+        )
+        current, current_seconds = timed(lambda: parse_table(table_html).to_dataframe())
+        assert legacy.shape == current.shape, (legacy.shape, current.shape)
+        print(f"{n_rows:>8} {legacy_seconds:>12.3f} {current_seconds:>10.3f} {legacy_seconds / current_seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,153 @@
+"""Synthetic pages for the benchmarks.
+
+Pages come from a seed, so the same arguments always give the same markup.
+Each page has layout tables around one large ``<table id="records">`` and
+a number of smaller data tables. The large one has nested markup in its
+cells, rowspan groups, colspan section rows, the odd table nested inside
+a cell, a few dirty values, and big attributes on the table, rows and cells.
+"""
+import functools
+import html
+import http.server
+import random
+import re
+import threading
+
+
+FIRST_NAMES = ('Ada', 'Grace', 'Alan', 'Edsger', 'Barbara', 'Donald', 'Frances', 'Ken', 'Radia', 'Linus')
+LAST_NAMES = ('Lovelace', 'Hopper', 'Turing', 'Dijkstra', 'Liskov', 'Knuth', 'Allen', 'Thompson', 'Perlman')
+DEPARTMENTS = ('Engineering', 'Research', 'Sales', 'Support', 'Finance', 'Legal', 'Marketing', 'Operations')
+WORDS = ('migration', 'legacy', 'content', 'review', 'pending', 'archive', 'update', 'owner', 'policy', 'draft')
+RECORD_HEADERS = ('ID', 'Name', 'Email', 'Joined', 'Salary', 'Department', 'Active', 'Notes')
+
+# Share of cells in a typed column that hold something the rule path can't parse
+DIRTY_RATE = 0.01
+
+
+def _attributes(rng, size):
+    # Framework-style noise: inline styles and data attributes the parser has to skip
+    return f'style="padding:2px;color:#{rng.randrange(0xffffff):06x}" data-meta="{"x" * size}"'
+
+
+def _notes(rng, row):
+    words = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(3, 12)))
+    roll = rng.random()
+    if roll < 0.02:
+        # Long enough to become a long text field
+        return f'<p>{words}</p><p>' + ' '.join(rng.choice(WORDS) for _ in range(60)) + '</p>'
+    if roll < 0.03:
+        return f'{words}<table class="inner"><tr><td>{row}</td><td>nested</td></tr></table>'
+    if roll < 0.3:
+        return f'<em>{words}</em><br><span class="muted">{rng.choice(WORDS)}</span>'
+    return words
+
+
+def _record_cells(rng, row):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    salary = f'${rng.randrange(30000, 250000):,}.{rng.randrange(100):02d}'
+    if rng.random() < DIRTY_RATE:
+        salary = rng.choice(('TBD', 'ask HR', 'see contract'))
+    joined = f'{rng.randrange(1, 13):02d}/{rng.randrange(1, 29):02d}/{rng.randrange(1990, 2025)}'
+    return [
+        str(row + 1),
+        f'<a href="/people/{row + 1}" class="person-link"><b>{first}</b> {last}</a>',
+        f'{first.lower()}.{last.lower()}{row}@example.com',
+        joined,
+        salary,
+        None,  # Department comes from the rowspan groups
+        rng.choice(('Yes', 'No')),
+        _notes(rng, row),
+    ]
+
+
+def records_table(n_rows, seed=0, attribute_bytes=64, config_bytes=65536):
+    rng = random.Random(seed)
+    parts = [
+        f'<table id="records" class="table data-grid" data-config="{"c" * config_bytes}">',
+        '<thead><tr>' + ''.join(f'<th scope="col">{header}</th>' for header in RECORD_HEADERS) + '</tr></thead>',
+        '<tbody>',
+    ]
+    group_left = 0
+    for row in range(n_rows):
+        if row and row % 500 == 0:
+            # Section header spanning the whole table, like grouped reports have
+            parts.append(f'<tr class="group"><td colspan="{len(RECORD_HEADERS)}">Batch {row // 500}</td></tr>')
+        cells = _record_cells(rng, row)
+        rendered = []
+        for i, cell in enumerate(cells):
+            if cell is None:
+                if group_left:
+                    group_left -= 1
+                    continue
+                # Groups end before the next section row so the spans stay aligned
+                group_left = min(rng.randrange(1, 5), n_rows - row, 500 - row % 500) - 1
+                rendered.append(f'<td rowspan="{group_left + 1}">{rng.choice(DEPARTMENTS)}</td>')
+            else:
+                rendered.append(f'<td {_attributes(rng, attribute_bytes)}>{cell}</td>' if i in (1, 4) else f'<td>{cell}</td>')
+        parts.append(f'<tr data-row="{row}" class="row-{row % 2}">' + ''.join(rendered) + '</tr>')
+    parts.append('</tbody></table>')
+    return ''.join(parts)
+
+
+def small_table(rng, n_rows):
+    header = '<tr><th>Code</th><th>Label</th><th>Amount</th><th>Updated</th></tr>'
+    rows = ''.join(
+        f'<tr><td>{rng.randrange(1000, 9999)}</td><td>{html.escape(rng.choice(WORDS))}</td>'
+        f'<td>{rng.randrange(100000) / 100:.2f}</td><td>2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}</td></tr>'
+        for _ in range(n_rows)
+    )
+    return f'<table class="summary">{header}{rows}</table>'
+
+
+def make_page(n_rows, n_tables=12, seed=0, attribute_bytes=64):
+    """Return a page with one ``n_rows`` records table and ``n_tables`` smaller ones."""
+    rng = random.Random(seed + 1)
+    layout = '<table class="layout"><tr><td><a href="/">Home</a></td><td><a href="/about">About</a></td></tr></table>'
+    parts = [
+        '<!DOCTYPE html><html><head><title>Benchmark page</title>',
+        f'<style>{".x{color:red}" * 2000}</style>',
+        f'<script>var state = "{"s" * 50000}";</script>',
+        '</head><body>',
+        layout,
+    ]
+    for i in range(n_tables // 2):
+        parts.append(f'<h2>Summary {i}</h2>' + small_table(rng, rng.randrange(5, 200)))
+    parts.append(records_table(n_rows, seed, attribute_bytes))
+    for i in range(n_tables - n_tables // 2):
+        parts.append(f'<h2>Appendix {i}</h2>' + small_table(rng, rng.randrange(5, 200)))
+    parts.append(layout + '</body></html>')
+    return ''.join(parts)
+
+
+def records_table_index(n_tables=12):
+    # Position of the records table among the page's tables, as scrape_tables numbers them
+    return 1 + n_tables // 2
+
+
+@functools.lru_cache(maxsize=4)
+def cached_page(n_rows, seed=0):
+    return make_page(n_rows, seed=seed).encode('utf-8')
+
+
+class _PageHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        match = re.fullmatch(r'/page/(\d+)-(\d+)\.html', self.path)
+        if not match:
+            self.send_error(404)
+            return
+        body = cached_page(int(match.group(1)), int(match.group(2)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve():
+    """Serve pages at ``/page/<rows>-<seed>.html`` from a background thread; returns the base URL."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
@@ -0,0 +1,104 @@
+"""A local stand-in for an OpenAI-compatible chat completions API.
+
+Schema prompts get a schema with one string field per header. Extraction
+prompts get one record per row of the prompt's table, keyed by the field
+names in the prompt's schema, so the whole pipeline runs without a model.
+``latency`` adds a fixed delay per request; streamed requests are sent in
+small chunks the way the real API does.
+"""
+import html
+import http.server
+import json
+import re
+import threading
+import time
+
+
+ROW_COUNT = re.compile(r'exactly (\d+) objects')
+SCHEMA_BLOCK = re.compile(r'Schema:\n(.*?)\n\nHTML Table', re.DOTALL)
+ROW = re.compile(r'<tr>(.*?)</tr>', re.DOTALL)
+CELL = re.compile(r'<t[dh]>(.*?)</t[dh]>', re.DOTALL)
+
+
+def _field_name(header):
+    return re.sub(r'\W+', '_', header.strip().lower()).strip('_') or 'field'
+
+
+def respond(prompt):
+    rows = [[html.unescape(cell) for cell in CELL.findall(row)] for row in ROW.findall(prompt)]
+    headers, rows = (rows[0], rows[1:]) if rows else ([], [])
+    if not ROW_COUNT.search(prompt):
+        return json.dumps({
+            'content_type_name': 'benchmark_content',
+            'fields': [
+                {'field_name': _field_name(header), 'field_label': header, 'field_type': 'string'}
+                for header in headers
+            ],
+        })
+
+    try:
+        fields = [field['field_name'] for field in json.loads(SCHEMA_BLOCK.search(prompt).group(1))['fields']]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        fields = []
+    columns = {_field_name(header): i for i, header in enumerate(headers)}
+    records = [
+        {name: row[columns[name]] if columns.get(name, len(row)) < len(row) else None for name in fields}
+        for row in rows
+    ]
+    return json.dumps(records)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = body['messages'][-1]['content']
+        content = respond(prompt)
+
+        if body.get('stream'):
+            events = []
+            for i in range(0, len(content), 64):
+                chunk = {
+                    'id': 'mock', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model'],
+                    'choices': [{'index': 0, 'delta': {'content': content[i:i + 64]}, 'finish_reason': None}],
+                }
+                events.append(f'data: {json.dumps(chunk)}\n\n')
+            events.append('data: [DONE]\n\n')
+            self._send(200, 'text/event-stream', ''.join(events).encode('utf-8'))
+            return
+
+        response = {
+            'id': 'mock', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': len(prompt) // 4,
+                'completion_tokens': len(content) // 4,
+                'total_tokens': (len(prompt) + len(content)) // 4,
+            },
+        }
+        self._send(200, 'application/json', json.dumps(response).encode('utf-8'))
+
+
+def start(latency=0.0):
+    """Start the server on a free port; returns ``(base_url, server)``."""
+    handler = type('MockLLMHandler', (_Handler,), {'latency': latency})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}/v1', server
@@ -1,5 +1,10 @@
 import os
 
+from dotenv import load_dotenv
+
+# Values from .env are in place before the settings below read the environment
+load_dotenv()
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
@@ -7,6 +12,8 @@ class Config:
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     OLLAMA_API_KEY = os.environ.get('OLLAMA_API_KEY')
     OLLAMA_API_URL = os.environ.get('OLLAMA_API_URL')
+    OPENAI_API_URL = os.environ.get('OPENAI_BASE_URL')
+    OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL')
     FLASK_ENV = os.environ.get('FLASK_ENV') or 'development'
     DEBUG = os.environ.get('FLASK_DEBUG') or True
     TESTING = os.environ.get('TESTING') or False
@@ -17,3 +24,122 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     ADMINS = os.environ.get('ADMINS') or ['you@example.com']
+
+    # Headless Chrome driver pool
+    DRIVER_POOL_SIZE = int(os.environ.get('DRIVER_POOL_SIZE') or 2)
+    DRIVER_POOL_PREWARM = int(os.environ.get('DRIVER_POOL_PREWARM') or 0)
+    DRIVER_MAX_USES = int(os.environ.get('DRIVER_MAX_USES') or 25)
+    DRIVER_MAX_AGE = int(os.environ.get('DRIVER_MAX_AGE') or 1800)
+    DRIVER_CHECKOUT_TIMEOUT = int(os.environ.get('DRIVER_CHECKOUT_TIMEOUT') or 60)
+    DRIVER_PAGE_LOAD_TIMEOUT = int(os.environ.get('DRIVER_PAGE_LOAD_TIMEOUT') or 30)
+
+    # Page readiness: comma separated chain of body, challenge, dom_quiet, tables, network_idle
+    SCRAPE_READINESS = os.environ.get('SCRAPE_READINESS') or 'body,challenge,dom_quiet'
+    SCRAPE_READY_TIMEOUT = float(os.environ.get('SCRAPE_READY_TIMEOUT') or 30)
+    SCRAPE_QUIET_MS = int(os.environ.get('SCRAPE_QUIET_MS') or 300)
+    SCRAPE_MIN_TABLES = int(os.environ.get('SCRAPE_MIN_TABLES') or 1)
+    SCRAPE_PROFILE_PATH = os.environ.get('SCRAPE_PROFILE_PATH')
+    SCRAPE_PROFILE_SAVE_INTERVAL = float(os.environ.get('SCRAPE_PROFILE_SAVE_INTERVAL') or 30)
+
+    # Tiered page fetching (plain HTTP first, browser fallback)
+    FETCH_HTTP_ENABLED = (os.environ.get('FETCH_HTTP_ENABLED') or '1') != '0'
+    FETCH_HTTP_TIMEOUT = float(os.environ.get('FETCH_HTTP_TIMEOUT') or 15)
+    FETCH_HTTP_POOL_SIZE = int(os.environ.get('FETCH_HTTP_POOL_SIZE') or 10)
+    FETCH_BROWSER_DOMAINS_PATH = os.environ.get('FETCH_BROWSER_DOMAINS_PATH')
+    # Only bring back the page's tables from the browser, not the whole document
+    FETCH_BROWSER_TABLES_ONLY = (os.environ.get('FETCH_BROWSER_TABLES_ONLY') or '0') != '0'
+
+    # Batch crawling
+    CRAWL_JOBS_DIR = os.environ.get('CRAWL_JOBS_DIR')
+    CRAWL_WORKERS = int(os.environ.get('CRAWL_WORKERS') or 4)
+    CRAWL_MAX_RETRIES = int(os.environ.get('CRAWL_MAX_RETRIES') or 3)
+    CRAWL_BACKOFF = float(os.environ.get('CRAWL_BACKOFF') or 2.0)
+    CRAWL_HOST_INTERVAL = float(os.environ.get('CRAWL_HOST_INTERVAL') or 1.0)
+    # Re-crawls send conditional requests and only process tables that changed;
+    # stored results nobody has used for CRAWL_STATE_TTL seconds are dropped
+    CRAWL_STATE_ENABLED = (os.environ.get('CRAWL_STATE_ENABLED') or '1') != '0'
+    CRAWL_STATE_TTL = int(os.environ.get('CRAWL_STATE_TTL') or 30 * 86400)
+
+    # Near-duplicate tables across pages: MinHash over rows, similarity from 0 to 1.
+    # Changing DEDUPE_NUM_PERM starts the index over.
+    DEDUPE_ENABLED = (os.environ.get('DEDUPE_ENABLED') or '1') != '0'
+    DEDUPE_THRESHOLD = float(os.environ.get('DEDUPE_THRESHOLD') or 0.8)
+    DEDUPE_NUM_PERM = int(os.environ.get('DEDUPE_NUM_PERM') or 128)
+
+    # Server-side table store (kept in the SQLite database above)
+    TABLE_STORE_TTL = int(os.environ.get('TABLE_STORE_TTL') or 86400)
+    TABLE_STORE_MAX_BYTES = int(os.environ.get('TABLE_STORE_MAX_BYTES') or 200 * 1024 * 1024)
+    TABLE_STORE_MAX_ENTRIES = int(os.environ.get('TABLE_STORE_MAX_ENTRIES') or 10000)
+
+    # Scrape result previews: a few rows per table, the rest paged in on demand
+    TABLE_PREVIEW_ROWS = int(os.environ.get('TABLE_PREVIEW_ROWS') or 5)
+    TABLE_PAGE_SIZE = int(os.environ.get('TABLE_PAGE_SIZE') or 50)
+    TABLE_PAGE_SIZE_MAX = int(os.environ.get('TABLE_PAGE_SIZE_MAX') or 500)
+    TABLE_PARSE_CACHE_ENTRIES = int(os.environ.get('TABLE_PARSE_CACHE_ENTRIES') or 4)
+
+    # Worker processes for parsing pages with many tables; smaller pages stay in-process
+    TABLE_PARSE_WORKERS = int(os.environ.get('TABLE_PARSE_WORKERS') or min(4, os.cpu_count() or 1))
+    TABLE_PARSE_POOL_MIN_BYTES = int(os.environ.get('TABLE_PARSE_POOL_MIN_BYTES') or 2 * 1024 * 1024)
+    TABLE_PARSE_POOL_MIN_TABLES = int(os.environ.get('TABLE_PARSE_POOL_MIN_TABLES') or 2)
+
+    # Chunked LLM extraction
+    EXTRACT_MODEL = os.environ.get('EXTRACT_MODEL') or 'gpt-4o'
+    EXTRACT_BATCH_TOKENS = int(os.environ.get('EXTRACT_BATCH_TOKENS') or 1500)
+    EXTRACT_CONCURRENCY = int(os.environ.get('EXTRACT_CONCURRENCY') or 4)
+    EXTRACT_MAX_TOKENS = int(os.environ.get('EXTRACT_MAX_TOKENS') or 4096)
+    EXTRACT_MAX_RETRIES = int(os.environ.get('EXTRACT_MAX_RETRIES') or 3)
+    EXTRACT_RULES_ENABLED = (os.environ.get('EXTRACT_RULES_ENABLED') or '1') != '0'
+    EXTRACT_RULES_MIN_CONFIDENCE = float(os.environ.get('EXTRACT_RULES_MIN_CONFIDENCE') or 0.95)
+
+    # LLM response cache
+    LLM_CACHE_ENABLED = (os.environ.get('LLM_CACHE_ENABLED') or '1') != '0'
+    LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get('LLM_CACHE_MEMORY_ENTRIES') or 256)
+    LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES') or 100 * 1024 * 1024)
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL') or 7 * 86400)
+
+    # Reuse schemas across tables with the same layout (near match 0 disables fuzzy lookup)
+    SCHEMA_REGISTRY_ENABLED = (os.environ.get('SCHEMA_REGISTRY_ENABLED') or '1') != '0'
+    SCHEMA_NEAR_MATCH = float(os.environ.get('SCHEMA_NEAR_MATCH') or 0.9)
+
+    # Schema prompt size: token budget and how many representative rows to offer
+    SCHEMA_PROMPT_TOKENS = int(os.environ.get('SCHEMA_PROMPT_TOKENS') or 3000)
+    SCHEMA_SAMPLE_ROWS = int(os.environ.get('SCHEMA_SAMPLE_ROWS') or 20)
+
+    # Background jobs
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 4)
+    # How long the job page's EventSource waits before asking for the next status
+    JOB_EVENTS_RETRY_MS = int(os.environ.get('JOB_EVENTS_RETRY_MS') or 1000)
+
+    # LLM gateway: routing is 'latency' (fastest backend first) or 'priority' (configured order)
+    LLM_ROUTING = os.environ.get('LLM_ROUTING') or 'latency'
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT') or 60)
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES') or 2)
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS') or 20)
+    LLM_FAILURE_COOLDOWN = float(os.environ.get('LLM_FAILURE_COOLDOWN') or 30)
+    OPENAI_CONCURRENCY = int(os.environ.get('OPENAI_CONCURRENCY') or 8)
+    OPENAI_RATE_LIMIT = float(os.environ.get('OPENAI_RATE_LIMIT') or 0)
+    OLLAMA_CONCURRENCY = int(os.environ.get('OLLAMA_CONCURRENCY') or 2)
+    OLLAMA_RATE_LIMIT = float(os.environ.get('OLLAMA_RATE_LIMIT') or 0)
+
+    # Per-stage timings and counters for /metrics and the dashboard
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or '1') != '0'
+    METRICS_RECENT_TRACES = int(os.environ.get('METRICS_RECENT_TRACES') or 50)
+
+    # Refuse to start when check_config finds a problem, instead of only warning
+    CONFIG_STRICT = (os.environ.get('CONFIG_STRICT') or '0') != '0'
+
+
+def check_config(config):
+    """Return a list of problems with a loaded configuration.
+
+    Nothing here raises, so the app still starts (and serves everything
+    that doesn't need a model) when no LLM is configured.
+    """
+    problems = []
+    if not (config.get('OPENAI_API_KEY') or config.get('OLLAMA_API_URL')):
+        problems.append("No LLM backend configured. Set OPENAI_API_KEY or OLLAMA_API_URL.")
+    if config.get('LLM_ROUTING') not in ('latency', 'priority'):
+        problems.append(f"LLM_ROUTING must be 'latency' or 'priority', got {config.get('LLM_ROUTING')!r}.")
+    if not 0 < (config.get('DEDUPE_THRESHOLD') or 0) <= 1:
+        problems.append(f"DEDUPE_THRESHOLD must be between 0 and 1, got {config.get('DEDUPE_THRESHOLD')!r}.")
+    return problems
@@ -0,0 +1,74 @@
+import hashlib
+import http.server
+import threading
+
+import pytest
+
+from app import create_app
+from config import Config
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app whose database and state files live in a temporary directory."""
+    apps = []
+
+    def make(**overrides):
+        settings = dict(
+            TESTING=True,
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+            FETCH_BROWSER_DOMAINS_PATH=str(tmp_path / 'browser_domains.json'),
+            CRAWL_JOBS_DIR=str(tmp_path / 'crawl_jobs'),
+            OPENAI_API_KEY='test',
+            OPENAI_API_URL='http://llm.test/v1',
+            OLLAMA_API_URL=None,
+        )
+        settings.update(overrides)
+        app = create_app(type('TestConfig', (Config,), settings))
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        if 'llm_loop' in app.extensions:
+            app.extensions['llm_loop'].close()
+
+
+@pytest.fixture
+def serve_pages():
+    """Serve ``{path: (status, html)}`` from a local HTTP server; returns the base URL.
+
+    Pages carry an ETag and answer a matching If-None-Match with 304. Pass
+    a ``log`` list to collect the ``(path, status)`` of every request.
+    """
+    servers = []
+
+    def serve(pages, log=None):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body = pages.get(self.path, (404, 'Not found'))
+                body = body.encode('utf-8')
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                if log is not None:
+                    log.append((self.path, status))
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,53 @@
+import json
+import os
+
+from app.scrape.batch import CrawlJob, HostRateLimiter, run_job
+
+
+PAGE = '<html><body><table><tr><th>A</th></tr><tr><td>1</td></tr></table></body></html>'
+
+
+def fetch_page(url, validators=None):
+    return {'html': PAGE, 'tier': 'http'}
+
+
+def test_state_is_saved_in_batches(tmp_path, monkeypatch):
+    job = CrawlJob.create(str(tmp_path), [f'http://example.test/{i}' for i in range(25)])
+    job.save_every = 10
+    job.save_interval = 3600
+    saves = []
+    save = job.save
+    monkeypatch.setattr(job, 'save', lambda wait=True: saves.append(wait) or save(wait))
+
+    run_job(job, fetch_page, workers=1, rate_limiter=HostRateLimiter(0))
+
+    # Two batches of ten, then the save at the end of the run
+    assert saves == [True, False, False, True]
+    with open(job.state_path) as f:
+        state = json.load(f)
+    assert state['status'] == 'done'
+    assert {entry['status'] for entry in state['urls'].values()} == {'done'}
+    with open(job.results_path) as f:
+        assert len(f.readlines()) == 25
+
+
+def test_resumed_url_gets_every_retry_again(tmp_path):
+    url = 'http://example.test/flaky'
+    job = CrawlJob.create(str(tmp_path), [url])
+    # Crashed while running its third attempt
+    job.state['urls'][url].update(status='running', attempts=2)
+    job.save()
+    calls = []
+
+    def fetch(url, validators=None):
+        calls.append(url)
+        raise OSError('connection reset')
+
+    job = CrawlJob.load(str(tmp_path), job.id)
+    run_job(job, fetch, max_retries=3, backoff=0, rate_limiter=HostRateLimiter(0))
+
+    assert len(calls) == 3
+    entry = job.state['urls'][url]
+    assert entry['status'] == 'failed'
+    assert entry['attempts'] == 5
+    assert os.path.exists(job.results_path)
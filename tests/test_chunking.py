@@ -0,0 +1,92 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.extract.chunking import ExtractionError, extract_batches, extract_table, split_into_batches
+from benchmarks import mock_llm
+
+
+HEADERS = ['Name', 'Price', 'Notes']
+ROWS = [[f'item {i}', f'{i}.50', 'x' * (i % 7)] for i in range(120)]
+SCHEMA = json.dumps({'fields': [
+    {'field_name': 'name', 'field_label': 'Name', 'field_type': 'string'},
+    {'field_name': 'price', 'field_label': 'Price', 'field_type': 'string'},
+    {'field_name': 'notes', 'field_label': 'Notes', 'field_type': 'string'},
+]})
+
+
+@pytest.fixture
+def llm_url():
+    url, server = mock_llm.start()
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+def test_batches_fit_budget_and_keep_rows_in_order():
+    batches = split_into_batches(HEADERS, ROWS, budget_tokens=100)
+    assert len(batches) > 1
+    assert [row for batch in batches for row in batch] == ROWS
+
+
+def test_large_table_is_extracted_in_row_order(make_app, llm_url):
+    app = make_app(OPENAI_API_URL=llm_url, EXTRACT_BATCH_TOKENS=150, EXTRACT_CONCURRENCY=4)
+    progress = []
+
+    with app.app_context():
+        records, batch_count = extract_table(
+            SCHEMA, HEADERS, ROWS, app.config, on_progress=lambda finished, total: progress.append((finished, total))
+        )
+
+    assert batch_count > 4
+    assert records == [{'name': name, 'price': price, 'notes': notes} for name, price, notes in ROWS]
+    assert progress[-1] == (batch_count, batch_count)
+    assert len(progress) == batch_count
+
+
+class ScriptedClient:
+    """Async client that answers each batch from a list of canned replies."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.prompts.append(kwargs['messages'][-1]['content'])
+        content = self.replies.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_batch_with_wrong_row_count_is_retried(monkeypatch):
+    # No backoff between attempts
+    sleep = asyncio.sleep
+    monkeypatch.setattr('app.extract.chunking.asyncio.sleep', lambda seconds: sleep(0))
+    rows = ROWS[:3]
+    good = json.dumps([{'name': row[0]} for row in rows])
+    client = ScriptedClient(['[{"name": "item 0"}]', f'Here you go:\n```json\n{good}\n```'])
+
+    records, batch_count = asyncio.run(extract_batches(client, SCHEMA, HEADERS, rows, budget_tokens=10000))
+
+    assert batch_count == 1
+    assert records == [{'name': row[0]} for row in rows]
+    assert len(client.prompts) == 2
+    assert 'exactly 3 objects' in client.prompts[0]
+
+
+def test_batch_with_wrong_row_count_on_every_attempt_raises(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr('app.extract.chunking.asyncio.sleep', lambda seconds: sleep(0))
+    client = ScriptedClient(['[{"name": "item 0"}]'] * 2)
+
+    with pytest.raises(ExtractionError):
+        asyncio.run(extract_batches(client, SCHEMA, HEADERS, ROWS[:3], budget_tokens=10000, max_retries=2))
+    assert len(client.prompts) == 2
+
+
+def test_batch_that_keeps_failing_raises():
+    client = ScriptedClient(['not json'] * 2)
+    with pytest.raises(ExtractionError):
+        asyncio.run(extract_batches(client, SCHEMA, HEADERS, ROWS[:3], budget_tokens=10000, max_retries=1))
@@ -0,0 +1,78 @@
+import os
+
+from app.scrape.batch import crawl_page
+from app.scrape.crawl_state import compare_tables, get_crawl_state, table_hash
+from app.scrape.fetcher import get_fetcher
+from app.scrape.routes import scrape_tables
+from app.table_store import get_table_store
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'page_with_table.html')
+
+
+def fixture_page():
+    with open(FIXTURE) as f:
+        return f.read()
+
+
+def test_compare_tables():
+    assert compare_tables(None, ['a', 'b']) == (['new', 'new'], 0)
+    # A replaced table is changed, an extra one is new
+    assert compare_tables(['a', 'b', 'c'], ['a', 'x', 'c', 'y']) == (['unchanged', 'changed', 'unchanged', 'new'], 0)
+    # Moved tables are unchanged, one gone from the page is removed
+    assert compare_tables(['a', 'b', 'c'], ['c', 'a']) == (['unchanged', 'unchanged'], 1)
+
+
+def test_batch_crawled_page_is_reused_when_not_modified(make_app, serve_pages):
+    log = []
+    base = serve_pages({'/table.html': (200, fixture_page())}, log)
+    url = f'{base}/table.html'
+    app = make_app()
+
+    with app.test_request_context():
+        state = get_crawl_state()
+        _, tables, changes = crawl_page(url, get_fetcher().fetch, state=state, store=get_table_store())
+        crawled = state.page(url)
+        result = scrape_tables(url)
+        checked = state.page(url)
+
+    assert changes['page'] == 'new'
+    # The interactive scrape got a 304 and used the tables the batch crawl stored
+    assert log == [('/table.html', 200), ('/table.html', 304)]
+    assert result['changes']['page'] == 'not_modified'
+    assert [table['table_id'] for table in result['tables']] == [table['table_id'] for table in tables]
+    assert result['tables'][0]['summary']['n_rows'] == 5
+    # Only the check time moves on a 304
+    assert checked['fetched_at'] == crawled['fetched_at']
+    assert checked['checked_at'] >= crawled['checked_at']
+    assert checked['tables'] == crawled['tables']
+
+
+def test_not_modified_batch_page_keeps_table_ids(make_app, serve_pages):
+    base = serve_pages({'/table.html': (200, fixture_page())})
+    url = f'{base}/table.html'
+    app = make_app()
+
+    with app.app_context():
+        state = get_crawl_state()
+        fetch = get_fetcher().fetch
+        _, first, _ = crawl_page(url, fetch, state=state, store=get_table_store())
+        fetched, second, changes = crawl_page(url, fetch, state=state, store=get_table_store())
+
+    assert fetched['not_modified']
+    assert changes['page'] == 'not_modified'
+    assert [table['table_id'] for table in second] == [table['table_id'] for table in first]
+    assert all(table['table_id'] for table in second)
+
+
+def test_table_store_ids_are_crawl_hashes(make_app):
+    app = make_app()
+    table = fixture_page()
+    reformatted = table.replace('><', '>\n  <')
+
+    with app.app_context():
+        store = get_table_store()
+        table_id = store.put(table)
+        assert store.put(reformatted) == table_id
+
+    assert table_id == table_hash(table)
@@ -0,0 +1,117 @@
+import json
+import sqlite3
+import threading
+
+import app.extract.rules as rules
+from app.extract.routes import extract_records
+from app.scrape.batch import extract_tables
+from app.scrape.crawl_state import CrawlState, get_crawl_state, table_hash
+from app.scrape.dedupe import TableIndex, content_hash, get_table_index
+from app.scrape.parallel import TableParser
+
+
+def table_html(rows, attributes=''):
+    body = ''.join(f'<tr><td>{name}</td><td>{value}</td></tr>' for name, value in rows)
+    return f'<table{attributes}><tr><th>Name</th><th>Value</th></tr>{body}</table>'
+
+
+ROWS = [(f'item {i}', str(i)) for i in range(50)]
+NEAR_ROWS = ROWS[:-2] + [('other 1', '1'), ('other 2', '2')]
+
+
+def connect(path):
+    local = threading.local()
+
+    def connection():
+        if not hasattr(local, 'connection'):
+            local.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+            local.connection.row_factory = sqlite3.Row
+        return local.connection
+    return connection
+
+
+def test_content_hash_ignores_attributes_but_not_spans():
+    assert content_hash(table_html(ROWS)) == content_hash(table_html(ROWS, ' class="striped" id="t1"'))
+    assert content_hash('<table><tr><td colspan="2">x</td></tr></table>') != content_hash(
+        '<table><tr><td>x</td></tr></table>'
+    )
+
+
+def test_concurrent_near_copies_get_one_canonical(tmp_path):
+    index = TableIndex(connect(str(tmp_path / 'index.db')))
+    copies = [table_html(ROWS), table_html(NEAR_ROWS)]
+    barrier = threading.Barrier(len(copies))
+    results = {}
+
+    def add(i):
+        barrier.wait()
+        results[i] = index.add(table_hash(copies[i]), f'http://example.test/{i}', copies[i])
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(len(copies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[0]['canonical'] == results[1]['canonical']
+    assert sorted(result['match'] or 'first' for result in results.values()) == ['first', 'near']
+    assert index.stats()['canonical'] == 1
+
+
+class CountingParser(TableParser):
+    def __init__(self):
+        super().__init__(workers=0)
+        self.parsed = []
+
+    def parse(self, tables, limit=None):
+        tables = list(tables)
+        self.parsed.extend(i for i, _ in tables)
+        return super().parse(tables, limit)
+
+
+def test_copy_differing_in_attributes_reuses_parsed_rows(tmp_path):
+    path = str(tmp_path / 'crawl.db')
+    state = CrawlState(connect(path))
+    index = TableIndex(connect(path))
+    parser = CountingParser()
+
+    plain, styled = table_html(ROWS), table_html(ROWS, ' class="zebra"')
+
+    first = extract_tables(f'<html><body>{plain}</body></html>', parser, state, index, 'http://a.test/')
+    second = extract_tables(f'<html><body>{styled}</body></html>', parser, state, index, 'http://b.test/')
+
+    assert parser.parsed == [0]
+    assert second[0]['rows'] == first[0]['rows']
+    assert second[0]['hash'] != first[0]['hash']
+    assert second[0]['canonical'] == first[0]['hash']
+
+
+def test_near_copy_only_extracts_rows_it_doesnt_share(make_app, monkeypatch):
+    app = make_app()
+    schema = json.dumps({'fields': [
+        {'field_name': 'name', 'field_label': 'Name', 'field_type': 'string'},
+        {'field_name': 'value', 'field_label': 'Value', 'field_type': 'integer'},
+    ]})
+    extracted_rows = []
+    extract_with_fallback = rules.extract_with_fallback
+
+    def counting(table, *args, **kwargs):
+        extracted_rows.append(table.n_rows)
+        return extract_with_fallback(table, *args, **kwargs)
+
+    monkeypatch.setattr(rules, 'extract_with_fallback', counting)
+    original, near = table_html(ROWS), table_html(NEAR_ROWS)
+
+    with app.app_context():
+        index = get_table_index()
+        for url, html in (('http://a.test/', original), ('http://b.test/', near)):
+            index.add(table_hash(html), url, html)
+        first, _ = extract_records(original, schema)
+        second, report = extract_records(near, schema)
+        stored = get_crawl_state().get_result(table_hash(near), 'schema')
+
+    assert extracted_rows == [50, 2]
+    assert second == [{'name': name, 'value': int(value)} for name, value in NEAR_ROWS]
+    assert second[:48] == first[:48]
+    assert report['value']['column'] == 'Value'
+    assert stored is None
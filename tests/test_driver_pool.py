@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from app.scrape.driver_pool import DriverPool, DriverPoolTimeout
+
+
+class FakeDriver:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.quit_called = False
+        self.visited = []
+
+    @property
+    def window_handles(self):
+        return ['main'] if self.alive else []
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise ConnectionError('browser went away')
+        return 1
+
+    def delete_all_cookies(self):
+        pass
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.drivers = []
+
+    def __call__(self):
+        driver = FakeDriver(len(self.drivers))
+        self.drivers.append(driver)
+        return driver
+
+
+def make_pool(**kwargs):
+    factory = FakeFactory()
+    return DriverPool(factory, **kwargs), factory
+
+
+def test_warm_starts_every_driver():
+    pool, factory = make_pool(size=3)
+    pool.warm(3)
+
+    assert len(factory.drivers) == 3
+    assert pool.snapshot()['created'] == 3
+    assert pool.snapshot()['reused'] == 0
+    assert pool.snapshot()['idle'] == 3
+
+
+def test_warm_is_capped_at_pool_size():
+    pool, factory = make_pool(size=2)
+    pool.warm(5)
+    assert len(factory.drivers) == 2
+
+
+def test_checked_in_driver_is_reset_and_reused():
+    pool, factory = make_pool(size=1)
+    with pool.driver() as driver:
+        first = driver
+    with pool.driver() as driver:
+        assert driver is first
+
+    assert len(factory.drivers) == 1
+    assert first.visited == ['about:blank', 'about:blank']
+    assert pool.snapshot()['reused'] == 1
+
+
+def test_checkout_waits_for_a_free_driver():
+    pool, _ = make_pool(size=1, checkout_timeout=0.05)
+    pooled = pool.checkout()
+    with pytest.raises(DriverPoolTimeout):
+        pool.checkout()
+
+    # A driver checked in from another thread frees the slot
+    timer = threading.Timer(0.05, pool.checkin, args=(pooled,))
+    timer.start()
+    pool.checkout_timeout = 5
+    assert pool.checkout() is pooled
+    timer.join()
+
+
+def test_dead_idle_driver_is_replaced():
+    pool, factory = make_pool(size=1)
+    pool.warm(1)
+    factory.drivers[0].alive = False
+
+    with pool.driver() as driver:
+        assert driver is factory.drivers[1]
+
+    assert factory.drivers[0].quit_called
+    assert pool.snapshot()['crashed'] == 1
+
+
+def test_driver_that_dies_during_a_page_is_discarded():
+    pool, factory = make_pool(size=1)
+    with pytest.raises(RuntimeError):
+        with pool.driver() as driver:
+            driver.alive = False
+            raise RuntimeError('page failed')
+
+    assert factory.drivers[0].quit_called
+    assert pool.snapshot()['idle'] == 0
+
+
+def test_driver_is_recycled_after_max_uses():
+    pool, factory = make_pool(size=1, max_uses=2)
+    for _ in range(3):
+        with pool.driver():
+            pass
+
+    assert len(factory.drivers) == 2
+    assert pool.snapshot()['recycled'] == 1
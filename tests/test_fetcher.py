@@ -0,0 +1,130 @@
+import json
+import os
+
+from app.scrape.fetcher import BrowserDomains, TieredFetcher
+from app.scrape.tables import parse_table
+from benchmarks import corpus
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'page_with_table.html')
+CHALLENGE = '<html><title>Just a moment...</title><body>Checking your browser</body></html>'
+
+
+def fixture_page():
+    with open(FIXTURE) as f:
+        return f.read()
+
+
+class FakeBrowser:
+    def __init__(self, html=None):
+        self.html = html or fixture_page()
+        self.urls = []
+
+    def __call__(self, url):
+        self.urls.append(url)
+        return self.html
+
+
+def test_page_with_table_stays_on_http(serve_pages):
+    base = serve_pages({'/table.html': (200, fixture_page())})
+    browser = FakeBrowser()
+    fetcher = TieredFetcher(browser)
+
+    result = fetcher.fetch(f'{base}/table.html')
+
+    assert result['tier'] == 'http'
+    assert result['status'] == 200
+    assert parse_table(result['html']).headers == ['ID', 'Name', 'Email', 'Phone', 'Location']
+    assert browser.urls == []
+    stats = fetcher.snapshot()
+    assert stats['tiers']['http']['hits'] == 1
+    assert stats['tiers']['browser']['attempts'] == 0
+
+
+def test_corpus_page_stays_on_http():
+    base = corpus.serve()
+    browser = FakeBrowser()
+    result = TieredFetcher(browser).fetch(f'{base}/page/50-0.html')
+
+    assert result['tier'] == 'http'
+    assert '<table' in result['html']
+    assert browser.urls == []
+
+
+def test_page_without_table_falls_back_and_learns_domain(serve_pages, tmp_path):
+    base = serve_pages({'/empty.html': (200, '<html><body><div id="app"></div></body></html>')})
+    path = str(tmp_path / 'browser_domains.json')
+    browser = FakeBrowser()
+    fetcher = TieredFetcher(browser, BrowserDomains(path))
+
+    result = fetcher.fetch(f'{base}/empty.html')
+    assert result['tier'] == 'browser'
+    assert result['escalation'] == 'no_tables'
+
+    # The domain is remembered, so the next page skips the HTTP attempt
+    result = fetcher.fetch(f'{base}/other.html')
+    assert result['escalation'] == 'learned_domain'
+    assert fetcher.snapshot()['tiers']['http']['attempts'] == 1
+    assert fetcher.snapshot()['escalations'] == {'no_tables': 1, 'learned_domain': 1}
+    with open(path) as f:
+        assert json.load(f)[base[len('http://'):]]['reason'] == 'no_tables'
+    assert base[len('http://'):] in BrowserDomains(path)
+
+
+def test_challenge_page_falls_back_to_browser(serve_pages):
+    base = serve_pages({'/protected.html': (403, CHALLENGE)})
+    browser = FakeBrowser()
+    fetcher = TieredFetcher(browser)
+
+    result = fetcher.fetch(f'{base}/protected.html')
+
+    assert result['tier'] == 'browser'
+    assert result['escalation'] == 'challenge'
+    assert browser.urls == [f'{base}/protected.html']
+
+
+def test_http_error_falls_back_without_learning_domain(serve_pages):
+    base = serve_pages({})
+    browser = FakeBrowser()
+    fetcher = TieredFetcher(browser)
+
+    result = fetcher.fetch(f'{base}/missing.html')
+
+    assert result['escalation'] == 'http_error'
+    assert base[len('http://'):] not in fetcher.browser_domains
+
+
+def test_browser_without_tables_doesnt_learn_domain(serve_pages):
+    base = serve_pages({'/empty.html': (200, '<html><body></body></html>')})
+    fetcher = TieredFetcher(FakeBrowser('<html><body>still nothing</body></html>'))
+
+    fetcher.fetch(f'{base}/empty.html')
+
+    assert base[len('http://'):] not in fetcher.browser_domains
+    assert fetcher.snapshot()['tiers']['browser']['hits'] == 0
+
+
+def test_noscript_notice_on_a_page_with_tables_stays_on_http(serve_pages):
+    page = fixture_page().replace(
+        '<body>', '<body><noscript>Please enable JavaScript for the full experience.</noscript>', 1
+    )
+    base = serve_pages({'/table.html': (200, page)})
+    browser = FakeBrowser()
+    fetcher = TieredFetcher(browser)
+
+    result = fetcher.fetch(f'{base}/table.html')
+
+    assert result['tier'] == 'http'
+    assert browser.urls == []
+
+
+def test_challenge_status_with_tables_doesnt_learn_domain(serve_pages):
+    page = fixture_page().replace('<body>', '<body><p>Please enable JavaScript to continue.</p>', 1)
+    base = serve_pages({'/blocked.html': (503, page)})
+    fetcher = TieredFetcher(FakeBrowser())
+
+    result = fetcher.fetch(f'{base}/blocked.html')
+
+    assert result['tier'] == 'browser'
+    assert result['escalation'] == 'challenge_with_tables'
+    assert base[len('http://'):] not in fetcher.browser_domains
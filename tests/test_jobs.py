@@ -0,0 +1,39 @@
+import threading
+import time
+
+from app.jobs.manager import JOB_HANDLERS, get_job_manager
+
+
+def events(client, job_id):
+    response = client.get(f'/jobs/{job_id}/events')
+    assert response.mimetype == 'text/event-stream'
+    return response.get_data(as_text=True)
+
+
+def test_events_answer_at_once_and_let_the_client_poll(make_app, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setitem(JOB_HANDLERS, 'wait', lambda params, progress: release.wait(5) and {'ok': True})
+    app = make_app(JOB_EVENTS_RETRY_MS=250)
+    client = app.test_client()
+
+    with app.app_context():
+        manager = get_job_manager()
+        job_id = manager.submit('wait', {})
+
+        started = time.monotonic()
+        body = events(client, job_id)
+        # Answered from the current state rather than held open until the job finishes
+        assert time.monotonic() - started < 1
+        assert body.startswith('retry: 250\nevent: progress\n')
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while manager.status(job_id)['status'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert 'event: done\n' in events(client, job_id)
+        manager.shutdown()
+
+
+def test_events_for_unknown_job(make_app):
+    client = make_app().test_client()
+    assert events(client, 'missing').startswith('event: failed\n')
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.extract.chunking import extract_table
+import app.llm as llm
+from app.llm import Backend, ConcurrencyLimit, LLMGateway, LLMLoop, TokenBucket, get_llm_gateway, get_llm_loop
+from app.llm_cache import CachedClient, LLMCache
+from benchmarks import mock_llm
+
+
+HEADERS = ['Name', 'Price']
+ROWS = [[f'item {i}', f'{i}.00'] for i in range(40)]
+SCHEMA = json.dumps({'fields': [
+    {'field_name': 'name', 'field_label': 'Name', 'field_type': 'string'},
+    {'field_name': 'price', 'field_label': 'Price', 'field_type': 'string'},
+]})
+
+
+def completion(body, content):
+    return {
+        'id': 'test', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+    }
+
+
+class MockEndpoint:
+    """Answers like ``benchmarks/mock_llm.py``, tracking requests in flight."""
+
+    def __init__(self, status=200, latency=0.02):
+        self.status = status
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+        self.models = []
+        self._lock = threading.Lock()
+
+    def _start(self, request):
+        body = json.loads(request.content)
+        with self._lock:
+            self.models.append(body['model'])
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        return body
+
+    def _finish(self, body):
+        with self._lock:
+            self.in_flight -= 1
+        if self.status != 200:
+            return httpx.Response(self.status, json={'error': {'message': 'unavailable'}})
+        return httpx.Response(200, json=completion(body, mock_llm.respond(body['messages'][-1]['content'])))
+
+    async def __call__(self, request):
+        body = self._start(request)
+        await asyncio.sleep(self.latency)
+        return self._finish(body)
+
+    def handle_sync(self, request):
+        body = self._start(request)
+        time.sleep(self.latency)
+        return self._finish(body)
+
+
+class MockBackend(Backend):
+    def __init__(self, name, endpoint, **kwargs):
+        super().__init__(name, f'http://{name}.test/v1', 'test', **kwargs)
+        self.endpoint = endpoint
+        self.clients_made = 0
+
+    def async_client(self):
+        self.clients_made += 1
+        return openai.AsyncOpenAI(
+            base_url=self.base_url, api_key=self.api_key, max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.endpoint)),
+        )
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    base_url=self.base_url, api_key=self.api_key, max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(self.endpoint.handle_sync)),
+                )
+            return self._client
+
+
+def ask(llm_loop, client=None, model='gpt-4o', prompt='Say hi'):
+    client = client or llm_loop.client
+    return llm_loop.run(client.chat.completions.create(model=model, messages=[{'role': 'user', 'content': prompt}]))
+
+
+def test_concurrency_limit_holds_across_runs(make_app):
+    endpoint = MockEndpoint()
+    backend = MockBackend('openai', endpoint, concurrency=2)
+    app = make_app(EXTRACT_CONCURRENCY=4, EXTRACT_BATCH_TOKENS=60)
+    app.extensions['llm_gateway'] = LLMGateway([backend])
+    results = []
+
+    def run():
+        with app.app_context():
+            results.append(extract_table(SCHEMA, HEADERS, ROWS, app.config))
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [len(records) for records, batches in results] == [len(ROWS)] * 2
+    assert all(batches > 2 for records, batches in results)
+    # Each run asks for 4 at a time, but the backend allows 2 in total
+    assert endpoint.peak == 2
+    assert backend.clients_made == 1
+
+
+def test_failover_when_primary_returns_5xx():
+    primary = MockBackend('ollama', MockEndpoint(status=503), model='llama3')
+    secondary = MockBackend('openai', MockEndpoint())
+    llm_loop = LLMLoop(LLMGateway([primary, secondary], routing='priority', max_retries=0))
+    try:
+        response = ask(llm_loop)
+    finally:
+        llm_loop.close()
+
+    assert response.choices[0].message.content
+    assert primary.endpoint.models == ['llama3']
+    assert secondary.endpoint.models == ['gpt-4o']
+    assert primary.snapshot()['errors'] == 1
+    assert secondary.snapshot()['errors'] == 0
+
+
+def test_failover_answers_are_cached_under_the_model_that_gave_them():
+    primary = MockBackend('openai', MockEndpoint(status=500))
+    fallback = MockBackend('ollama', MockEndpoint(), model='llama3')
+    llm_loop = LLMLoop(LLMGateway([primary, fallback], routing='priority', max_retries=0))
+    connection = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    cache = LLMCache(lambda: connection)
+    try:
+        client = CachedClient(llm_loop.client, cache, is_async=True)
+        ask(llm_loop, client)
+        primary.endpoint.status = 200
+        ask(llm_loop, client)
+    finally:
+        llm_loop.close()
+
+    # The second call wasn't answered from the llama3 response
+    assert primary.endpoint.models == ['gpt-4o', 'gpt-4o']
+    assert [row['model'] for row in connection.execute('SELECT model FROM llm_cache ORDER BY created_at')] == [
+        'llama3', 'gpt-4o'
+    ]
+
+
+def test_failover_answers_are_found_while_failover_lasts():
+    primary = MockBackend('openai', MockEndpoint(status=500))
+    fallback = MockBackend('ollama', MockEndpoint(), model='llama3')
+    gateway = LLMGateway([primary, fallback], max_retries=0)
+    connection = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    client = CachedClient(gateway, LLMCache(lambda: connection))
+
+    answers = [client.chat.completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': 'Say hi'}])
+               for _ in range(3)]
+    gateway.close()
+
+    # The failed primary goes last, so later calls are looked up under the fallback's model
+    assert primary.endpoint.models == ['gpt-4o']
+    assert fallback.endpoint.models == ['llama3']
+    assert len({answer.choices[0].message.content for answer in answers}) == 1
+
+
+def test_sync_and_async_calls_share_one_limit():
+    endpoint = MockEndpoint(latency=0.05)
+    backend = MockBackend('openai', endpoint, concurrency=2)
+    gateway = LLMGateway([backend])
+    llm_loop = LLMLoop(gateway)
+
+    def sync_call(i):
+        gateway.chat.completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': f'sync {i}'}])
+
+    async def async_calls():
+        client = llm_loop.client
+        await asyncio.gather(*[
+            client.chat.completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': f'async {i}'}])
+            for i in range(4)
+        ])
+
+    threads = [threading.Thread(target=sync_call, args=(i,)) for i in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        llm_loop.run(async_calls())
+        for thread in threads:
+            thread.join()
+    finally:
+        llm_loop.close()
+        gateway.close()
+
+    assert len(endpoint.models) == 8
+    assert endpoint.peak == 2
+    assert backend.limit.in_flight == 0
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    limit = ConcurrencyLimit(1)
+
+    async def run():
+        await limit.acquire_async()
+        waiter = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        limit.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert limit.in_flight == 0
+
+
+def test_gateway_is_built_once_for_concurrent_callers(make_app, monkeypatch):
+    app = make_app()
+    build_backends = llm.build_backends
+    calls = []
+
+    def slow_build(config):
+        calls.append(config)
+        time.sleep(0.05)
+        return build_backends(config)
+
+    monkeypatch.setattr(llm, 'build_backends', slow_build)
+    barrier = threading.Barrier(4)
+    gateways = []
+
+    def get():
+        barrier.wait()
+        gateways.append(get_llm_gateway(app))
+        get_llm_loop(app)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({id(gateway) for gateway in gateways}) == 1
+
+
+def test_llm_stats_without_backends(make_app):
+    app = make_app(OPENAI_API_KEY=None)
+    response = app.test_client().get('/llm_stats')
+    assert response.status_code == 200
+    assert response.get_json()['gateway']['backends'] == []
+
+
+def test_token_bucket_spaces_out_requests():
+    bucket = TokenBucket(rate=20, burst=2)
+
+    async def acquire_all():
+        for _ in range(6):
+            await bucket.acquire_async()
+
+    started = time.monotonic()
+    asyncio.run(acquire_all())
+    # Two tokens up front, the other four at 20 per second
+    assert time.monotonic() - started >= 0.19
+
+
+def test_rate_limit_applies_to_gateway_requests():
+    backend = MockBackend('openai', MockEndpoint(latency=0), rate=10)
+    backend.bucket = TokenBucket(rate=10, burst=1)
+    llm_loop = LLMLoop(LLMGateway([backend]))
+    started = time.monotonic()
+    try:
+        for _ in range(4):
+            ask(llm_loop)
+    finally:
+        llm_loop.close()
+    assert time.monotonic() - started >= 0.29
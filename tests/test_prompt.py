@@ -0,0 +1,34 @@
+import sys
+
+import pytest
+
+from app.schema import prompt
+from app.schema.prompt import FULL_PROMPT_TEMPLATE, PromptStats, count_tokens, full_prompt_tokens
+
+
+TABLE = '<table><tr><th>Name</th></tr>' + '<tr><td>item</td></tr>' * 50 + '</table>'
+
+
+class WordEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+def test_both_prompts_are_counted_with_one_tokenizer(monkeypatch):
+    monkeypatch.setattr(prompt, '_encoding', lambda model: WordEncoding())
+
+    full = full_prompt_tokens(TABLE)
+    assert full == len(FULL_PROMPT_TEMPLATE.format(table_html=TABLE).split())
+    entry = PromptStats().record(count_tokens('a short prompt'), full, 0.1, 5)
+    assert entry['tokenizer'] == 'tiktoken'
+    assert entry['tokens_saved'] == full - 3
+
+
+def test_missing_tiktoken_fails(monkeypatch):
+    prompt._encoding.cache_clear()
+    monkeypatch.setitem(sys.modules, 'tiktoken', None)
+    try:
+        with pytest.raises(ImportError):
+            count_tokens('hello')
+    finally:
+        prompt._encoding.cache_clear()
@@ -0,0 +1,59 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.scrape.readiness import DomainProfiles, DomQuiet
+
+
+class FakeDriver:
+    def __init__(self, result=True):
+        self.result = result
+        self.timeouts = SimpleNamespace(script=30)
+
+    def set_script_timeout(self, seconds):
+        self.timeouts.script = seconds
+
+    def execute_async_script(self, script, *args):
+        assert self.timeouts.script != 30
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+@pytest.mark.parametrize('result', [True, TimeoutError('script timed out')])
+def test_dom_quiet_restores_the_script_timeout(result):
+    driver = FakeDriver(result)
+    strategy = DomQuiet()
+
+    if isinstance(result, Exception):
+        with pytest.raises(TimeoutError):
+            strategy.wait(driver, time.monotonic() + 5)
+    else:
+        assert strategy.wait(driver, time.monotonic() + 5)
+    assert driver.timeouts.script == 30
+
+
+def test_profiles_are_saved_for_new_domains_and_then_in_batches(tmp_path):
+    path = tmp_path / 'profiles.json'
+    profiles = DomainProfiles(str(path), save_interval=3600)
+    saves = []
+    save = profiles._save
+    profiles._save = lambda: saves.append(1) or save()
+
+    for _ in range(20):
+        profiles.record('example.test', 1.0, True)
+    assert len(saves) == 1
+    assert json.loads(path.read_text())['example.test']['samples'] == 1
+
+    profiles.record('other.test', 2.0, False)
+    profiles.record('other.test', 2.0, True)
+    assert len(saves) == 2
+
+    profiles.flush()
+    profiles.flush()
+    assert len(saves) == 3
+    saved = DomainProfiles(str(path))
+    assert saved.get('example.test')['samples'] == 20
+    assert saved.get('other.test')['samples'] == 2
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from app.extract.chunking import ExtractionError
+from app.extract.rules import extract_with_fallback, iter_with_fallback, parse_schema
+from app.scrape.tables import parse_table
+
+
+TABLE = """
+<table>
+  <tr><th>Product Name</th><th>Price</th></tr>
+  <tr><td>Foo</td><td>1.50</td></tr>
+  <tr><td>Bar</td><td>2.25</td></tr>
+</table>
+"""
+
+SCHEMA = json.dumps({'fields': [
+    {'field_name': 'field_title', 'field_label': 'Product Name', 'field_type': 'string'},
+    {'field_name': 'field_cost', 'field_label': 'Price', 'field_type': 'decimal'},
+    {'field_name': 'field_extra', 'field_label': 'Notes', 'field_type': 'string'},
+]})
+
+CONFIG = {'EXTRACT_RULES_MIN_CONFIDENCE': 0.95}
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, schema, headers, rows):
+        self.calls.append((json.loads(schema), rows))
+        return [{'field_extra': f"note {row[0]}"} for row in rows]
+
+
+def test_schema_field_names_differ_from_headers():
+    llm = FakeLLM()
+    records, report = extract_with_fallback(parse_table(TABLE), CONFIG, llm, parse_schema(SCHEMA))
+
+    assert records == [
+        {'field_title': 'Foo', 'field_cost': 1.5, 'field_extra': 'note Foo'},
+        {'field_title': 'Bar', 'field_cost': 2.25, 'field_extra': 'note Bar'},
+    ]
+    assert report['field_title'] == {'path': 'rules', 'column': 'Product Name', 'confidence': 1.0}
+    assert report['field_cost']['column'] == 'Price'
+    # Only the field without a column goes to the LLM
+    assert report['field_extra']['path'] == 'llm'
+    assert report['field_extra']['column'] is None
+    assert len(llm.calls) == 1
+    assert [field['field_name'] for field in llm.calls[0][0]['fields']] == ['field_extra']
+
+
+def test_streamed_records_use_schema_names():
+    def llm_stream(schema, headers, rows):
+        return iter([{'field_extra': None} for _ in rows])
+
+    records, report = iter_with_fallback(parse_table(TABLE), CONFIG, llm_stream, parse_schema(SCHEMA))
+
+    assert list(report) == ['field_title', 'field_cost', 'field_extra']
+    assert [list(record) for record in records] == [['field_title', 'field_cost', 'field_extra']] * 2
+
+
+def test_unmapped_fields_keep_their_keys_without_llm_answer():
+    records, report = extract_with_fallback(
+        parse_table(TABLE), CONFIG, lambda schema, headers, rows: [None] * len(rows), parse_schema(SCHEMA)
+    )
+    assert records[0] == {'field_title': 'Foo', 'field_cost': 1.5, 'field_extra': None}
+
+
+def test_llm_answer_with_wrong_row_count_raises():
+    # Pairing by position would put every later answer on the wrong row
+    with pytest.raises(ExtractionError):
+        extract_with_fallback(
+            parse_table(TABLE), CONFIG, lambda schema, headers, rows: [{'field_extra': 'x'}], parse_schema(SCHEMA)
+        )
+
+    records, _ = iter_with_fallback(
+        parse_table(TABLE), CONFIG, lambda schema, headers, rows: iter([{'field_extra': 'x'}]), parse_schema(SCHEMA)
+    )
+    with pytest.raises(ExtractionError):
+        list(records)
+
+
+def test_without_schema_every_column_is_a_field():
+    records, report = extract_with_fallback(parse_table(TABLE), CONFIG, FakeLLM())
+    assert records[0] == {'product_name': 'Foo', 'price': 1.5}
+
+
+def test_parse_schema_rejects_malformed_schemas():
+    assert parse_schema('not json') is None
+    assert parse_schema('{"fields": [{"label": "x"}]}') is None
+    # No fields means the rule path has nothing to map, not empty records
+    assert parse_schema({'fields': []}) is None
+    assert parse_schema({'content_type': {'label': 'Products'}}) is None
+
+
+def test_parse_schema_reads_drupal_style_schemas():
+    schema = {
+        'content_type': {'name': 'product', 'label': 'Product'},
+        'fields': {
+            'field_title': {'label': 'Product Name', 'type': 'string', 'required': True},
+            'field_cost': {'label': 'Price', 'type': 'decimal'},
+        },
+    }
+    assert [(field['field_name'], field['field_label'], field['field_type']) for field in parse_schema(schema)] == [
+        ('field_title', 'Product Name', 'string'), ('field_cost', 'Price', 'decimal'),
+    ]
+    nested = {'content_type': {'machine_name': 'product', 'fields': [{'machine_name': 'field_cost', 'label': 'Price'}]}}
+    assert parse_schema(nested)[0]['field_name'] == 'field_cost'
+
+    records, report = extract_with_fallback(parse_table(TABLE), CONFIG, FakeLLM(), parse_schema(schema))
+    assert records[0] == {'field_title': 'Foo', 'field_cost': 1.5}
+    assert report['field_cost']['path'] == 'rules'
+
+
+def test_schema_prompt_asks_for_the_rules_shape():
+    from app.schema.prompt import FULL_PROMPT_TEMPLATE
+
+    prompt = FULL_PROMPT_TEMPLATE.format(table_html=TABLE)
+    example = prompt[prompt.index('For example:') + len('For example:'):].splitlines()[1]
+    assert parse_schema(example)[0]['field_label'] == 'Price'
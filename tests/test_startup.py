@@ -0,0 +1,17 @@
+import os
+import statistics
+
+from benchmarks.bench_startup import measure
+
+
+# The budget depends on the machine; slow CI runners can raise it
+BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS') or 800)
+
+
+def test_startup_defers_heavy_imports():
+    assert measure()['loaded'] == []
+
+
+def test_startup_is_within_import_budget():
+    import_ms = statistics.median(measure()['import_ms'] for _ in range(3))
+    assert import_ms <= BUDGET_MS, f"create_app() spent {import_ms:.0f} ms importing, budget is {BUDGET_MS:.0f} ms"
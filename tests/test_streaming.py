@@ -0,0 +1,145 @@
+import csv
+import io
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import app.extract.routes as extract_routes
+from app.extract.chunking import ExtractionError
+from app.extract.streaming import RecordStreamParser, iter_csv, stream_batches
+from app.table_store import get_table_store
+
+
+RECORDS = [
+    {'name': 'plain', 'notes': None},
+    {'name': 'quote " and backslash \\ inside', 'notes': 'ends with a backslash \\'},
+    {'name': 'brackets ] } [ { in a string', 'notes': '\\"escaped\\" é ☃'},
+    {'name': 'nested', 'notes': {'tags': ['a', {'deep': [1, 2, {'x': '}'}]}], 'empty': {}}},
+    {'name': 'unicode \\u escape', 'notes': [[], [[]], '[{"not": "a record"}]']},
+]
+ARRAY = json.dumps(RECORDS)
+TEXTS = [
+    ARRAY,
+    json.dumps(RECORDS, indent=2),
+    f'Here are the records:\n```json\n{json.dumps(RECORDS, indent=1)}\n```\nLet me know if you need more.',
+    json.dumps({'rows': RECORDS}),
+]
+
+
+def feed_all(chunks):
+    parser = RecordStreamParser()
+    records = []
+    for chunk in chunks:
+        records.extend(parser.feed(chunk))
+    return records, parser
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_every_two_way_split_gives_the_same_records(text):
+    for split in range(len(text) + 1):
+        records, parser = feed_all([text[:split], text[split:]])
+        assert records == RECORDS, f"split at {split}: {text[max(0, split - 10):split]!r}|{text[split:split + 10]!r}"
+        assert parser.done
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_character_by_character(text):
+    records, _ = feed_all(text)
+    assert records == RECORDS
+
+
+def test_random_chunks():
+    rng = random.Random(7)
+    for _ in range(200):
+        text = rng.choice(TEXTS)
+        cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 30)))
+        chunks = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        records, _ = feed_all(chunks)
+        assert records == RECORDS
+
+
+def test_split_between_backslash_and_escaped_quote():
+    text = json.dumps([{'a': 'x\\"y'}, {'a': '\\\\'}])
+    for split in [i + 1 for i, char in enumerate(text) if char == '\\']:
+        records, _ = feed_all([text[:split], text[split:]])
+        assert records == [{'a': 'x\\"y'}, {'a': '\\\\'}]
+
+
+def test_text_after_the_array_is_ignored():
+    records, parser = feed_all([ARRAY[:-1], '] and then [{"name": "extra"}]'])
+    assert records == RECORDS
+    assert parser.feed('[{"more": 1}]') == []
+
+
+class StreamingClient:
+    """Sync client whose completions stream canned replies in small chunks."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        prompt = kwargs['messages'][-1]['content']
+        text = json.dumps(self.reply(prompt))
+        for start in range(0, len(text), 7):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[start:start + 7]))])
+
+
+HEADERS = ['Name']
+ROWS = [[f'item {i}'] for i in range(40)]
+SCHEMA = json.dumps({'fields': [{'field_name': 'name', 'field_label': 'Name', 'field_type': 'string'}]})
+
+
+def rows_in(prompt):
+    return [line.split('<td>')[1].split('</td>')[0] for line in prompt.split('<tr>')[2:]]
+
+
+def test_stream_batches_keeps_row_order():
+    client = StreamingClient(lambda prompt: [{'name': name} for name in rows_in(prompt)])
+    records = list(stream_batches(client, SCHEMA, HEADERS, ROWS, budget_tokens=60, concurrency=3))
+    assert records == [{'name': row[0]} for row in ROWS]
+
+
+def test_stream_batches_raises_on_a_short_batch():
+    client = StreamingClient(lambda prompt: [{'name': name} for name in rows_in(prompt)][:-1])
+    with pytest.raises(ExtractionError):
+        list(stream_batches(client, SCHEMA, HEADERS, ROWS, budget_tokens=60, max_retries=1))
+
+
+def test_iter_csv_flushes_rows_before_an_error():
+    def records():
+        yield from [{'name': f'item {i}'} for i in range(3)]
+        raise ExtractionError('batch failed')
+
+    chunks = []
+    with pytest.raises(ExtractionError):
+        for chunk in iter_csv(records(), ['name']):
+            chunks.append(chunk)
+    assert list(csv.reader(io.StringIO(''.join(chunks)))) == [['name'], ['item 0'], ['item 1'], ['item 2']]
+
+
+@pytest.mark.parametrize('output', ['csv', 'ndjson'])
+def test_failed_stream_ends_with_an_error(make_app, monkeypatch, output):
+    def records():
+        yield {'name': 'item 0'}
+        raise ExtractionError('batch failed')
+
+    monkeypatch.setattr(extract_routes, 'stream_records', lambda table_html, schema: (records(), ['name']))
+    app = make_app()
+    with app.app_context():
+        table_id = get_table_store().put('<table><tr><th>Name</th></tr><tr><td>item 0</td></tr></table>')
+
+    response = app.test_client().post(
+        '/extract/extract_content/stream', data={'schema': SCHEMA, 'table_id': table_id, 'format': output}
+    )
+    body = response.get_data(as_text=True)
+
+    if output == 'csv':
+        rows = list(csv.reader(io.StringIO(body)))
+        assert rows[:2] == [['name'], ['item 0']]
+        assert rows[-1] == ['ERROR: Error extracting content: batch failed']
+    else:
+        lines = [json.loads(line) for line in body.splitlines()]
+        assert lines == [{'name': 'item 0'}, {'error': 'Error extracting content: batch failed'}]
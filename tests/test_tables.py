@@ -0,0 +1,167 @@
+import csv
+import io
+
+from app.scrape.tables import ParsedTable, iter_table_html, parse_table, summarize_table
+
+
+def test_sections_are_read_in_rendering_order():
+    table = parse_table("""
+    <table>
+      <tfoot><tr><td>total</td><td>3</td></tr></tfoot>
+      <tbody><tr><td>x</td><td>1</td></tr></tbody>
+      <thead><tr><th>Item</th><th>Count</th></tr></thead>
+      <tbody><tr><td>y</td><td>2</td></tr></tbody>
+    </table>
+    """)
+    # <thead> rows are headers wherever they appear, <tfoot> always comes last
+    assert table.headers == ['Item', 'Count']
+    assert table.rows() == [['x', '1'], ['y', '2'], ['total', '3']]
+
+
+def test_multi_row_header_with_spans():
+    table = parse_table("""
+    <table>
+      <thead>
+        <tr><th colspan="2">Name</th><th rowspan="2">Age</th></tr>
+        <tr><th>First</th><th>Last</th></tr>
+      </thead>
+      <tr><td>Ada</td><td>Lovelace</td><td>36</td></tr>
+    </table>
+    """)
+    assert table.headers == ['Name First', 'Name Last', 'Age']
+    assert table.rows() == [['Ada', 'Lovelace', '36']]
+
+
+def test_rowspan_and_colspan_fill_every_slot():
+    table = parse_table("""
+    <table>
+      <tr><th>A</th><th>B</th><th>C</th></tr>
+      <tr><td rowspan="3">a</td><td colspan="2">bc</td></tr>
+      <tr><td>b2</td><td rowspan="2">c</td></tr>
+      <tr><td>b3</td></tr>
+      <tr><td>a4</td><td>b4</td><td>c4</td></tr>
+    </table>
+    """)
+    assert table.rows() == [
+        ['a', 'bc', 'bc'],
+        ['a', 'b2', 'c'],
+        ['a', 'b3', 'c'],
+        ['a4', 'b4', 'c4'],
+    ]
+
+
+def test_overlapping_spans_end_where_they_should():
+    # The colspan in the second row runs over the rowspan from the first (a
+    # table model error browsers still render); the row's own cell wins there
+    table = parse_table("""
+    <table>
+      <tr><th>A</th><th>B</th><th>C</th></tr>
+      <tr><td>a1</td><td rowspan="2">b</td><td>c1</td></tr>
+      <tr><td colspan="3">wide</td></tr>
+      <tr><td>a3</td><td>b3</td><td>c3</td></tr>
+    </table>
+    """)
+    assert table.rows() == [
+        ['a1', 'b', 'c1'],
+        ['wide', 'wide', 'wide'],
+        ['a3', 'b3', 'c3'],
+    ]
+
+
+def test_invalid_and_huge_spans_are_clamped():
+    table = parse_table("""
+    <table>
+      <tr><th>A</th><th>B</th></tr>
+      <tr><td colspan="x">1</td><td rowspan="0">2</td></tr>
+      <tr><td>3</td><td>4</td></tr>
+    </table>
+    """)
+    assert table.rows() == [['1', '2'], ['3', '4']]
+    assert parse_table('<table><tr><td colspan="99999">x</td></tr><tr><td>y</td></tr></table>').shape == (1, 1000)
+
+
+def test_ragged_rows_are_padded():
+    table = parse_table("""
+    <table>
+      <tr><th>A</th><th>B</th></tr>
+      <tr><td>1</td></tr>
+      <tr><td>2</td><td>3</td><td>4</td></tr>
+    </table>
+    """)
+    assert table.headers == ['A', 'B', 'Column 3']
+    assert table.rows() == [['1', '', ''], ['2', '3', '4']]
+    assert all(len(column) == table.n_rows for column in table.columns)
+
+
+def test_first_row_is_the_header_without_th():
+    table = parse_table("""
+    <table>
+      <tr><td>Name</td><td></td><td>Name</td></tr>
+      <tr><td>x</td><td>1</td><td>y</td></tr>
+    </table>
+    """)
+    assert table.headers == ['Name', 'Column 2', 'Name.1']
+    assert table.rows() == [['x', '1', 'y']]
+
+
+def test_th_row_after_data_is_data():
+    table = parse_table("""
+    <table>
+      <tr><th>Region</th><th>Sales</th></tr>
+      <tr><th>North</th><td>10</td></tr>
+      <tr><th>South</th><td>20</td></tr>
+    </table>
+    """)
+    assert table.headers == ['Region', 'Sales']
+    assert table.rows() == [['North', '10'], ['South', '20']]
+
+
+def test_text_links_and_nested_tables():
+    table = parse_table("""
+    <table>
+      <tr><th>Name</th><th>Detail</th></tr>
+      <tr><td>  <a href=" /a ">Ada</a>
+          Lovelace </td><td><table><tr><td>inner</td></tr></table></td></tr>
+      <tr><td>Bob</td><td>plain</td></tr>
+    </table>
+    """)
+    assert table.rows() == [['Ada Lovelace', 'inner'], ['Bob', 'plain']]
+    assert table.links == {0: ['/a', None]}
+    # The nested table is listed on its own, after the one holding it
+    assert [index for index, _ in iter_table_html(f'<html><body>{TABLE_WITH_NESTED}</body></html>')] == [0, 1]
+
+
+TABLE_WITH_NESTED = '<table><tr><td><table><tr><td>inner</td></tr></table></td></tr></table>'
+
+
+def test_limit_parses_the_first_rows_and_counts_the_rest():
+    rows = ''.join(f'<tr><td>{i}</td></tr>' for i in range(10))
+    table = parse_table(f'<table><tr><th>N</th></tr>{rows}</table>', limit=3)
+    assert table.rows() == [['0'], ['1'], ['2']]
+    assert table.total_rows == 10
+    assert summarize_table(f'<table><tr><th>N</th></tr>{rows}</table>', 2)['n_rows'] == 10
+
+
+def test_iter_csv_quotes_values():
+    table = ParsedTable(
+        ['name', 'note, with comma'],
+        [['plain', 'say "hi"', 'two\nlines', ''], ['1', 'a,b', ' padded ', '"']],
+        4,
+    )
+    chunks = list(table.iter_csv(chunk_rows=3))
+
+    assert len(chunks) == 2
+    assert ''.join(chunks) == table.to_csv()
+    assert list(csv.reader(io.StringIO(table.to_csv()))) == [
+        ['name', 'note, with comma'],
+        ['plain', '1'],
+        ['say "hi"', 'a,b'],
+        ['two\nlines', ' padded '],
+        ['', '"'],
+    ]
+
+
+def test_iter_csv_of_parsed_table():
+    table = parse_table('<table><tr><th>A</th><th>B</th></tr><tr><td>x, y</td><td>"q"</td></tr></table>')
+    assert table.to_csv() == 'A,B\r\n"x, y","""q"""\r\n'
+    assert parse_table('<table><tr><th>A</th></tr></table>').to_csv() == 'A\r\n'